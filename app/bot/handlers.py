@@ -2,14 +2,24 @@
 """
 Основной роутер для обработки команд Telegram-бота
 """
+import asyncio
 import logging
+import time
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.types import Message, Document
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from app.bot.keyboards import MAIN_MENU
-from app.services.ai_service import ask_ai
+from app.bot.middlewares import MetricsMiddleware
+from app.config import settings
+from app.monitoring import span
+from app.services.ai_service import ask_ai, ask_ai_stream
+from app.services.answer_cache import make_context_key
+from app.services.context_builder import build_context
+from app.rate_limiter import format_reset
 from app.services.document_service import doc_service
+from app.services.reranker import reranker
 # Импортируем новую функцию проверки и зависимость
 from app.services.sro_registry_service import sro_registry_service # <-- Новый импорт
 from app.database.connection import get_user, upsert_user, check_question_limit
@@ -17,7 +27,12 @@ import os
 
 logger = logging.getLogger(__name__)
 
+# Максимальная длина текста сообщения Telegram
+TELEGRAM_TEXT_LIMIT = 4096
+
 router = Router()
+# Латентность каждого хендлера в Prometheus
+router.message.middleware(MetricsMiddleware())
 
 class Registration(StatesGroup):
     inn = State()
@@ -133,6 +148,13 @@ async def handle_pdf(message: Message, document: Document):
         file_path = f"documents/uploaded/{document.file_name}"
         # Используем await для асинхронной загрузки файла (исправлено)
         await message.bot.download(document, destination=file_path)
+        # Документ сразу становится доступен для поиска (индексация в рабочем потоке)
+        try:
+            await doc_service.add_document(file_path)
+        except Exception as e:
+            logger.error(f"Error indexing uploaded document {file_path}: {e}", exc_info=True)
+            await message.answer(f"Документ {document.file_name} сохранен, но не добавлен в поиск. Попробуйте позже.", reply_markup=MAIN_MENU)
+            return
         await message.answer(f"Документ {document.file_name} сохранен в разделе 'Загруженные'", reply_markup=MAIN_MENU)
     else:
         await message.answer("Пожалуйста, отправьте PDF-файл.", reply_markup=MAIN_MENU)
@@ -142,7 +164,8 @@ async def handle_pdf(message: Message, document: Document):
 @router.message(F.text)
 async def ai_answer(message: Message):
     # Получаем пользователя для проверки лимита
-    user = await get_user(message.from_user.id)
+    with span("db_lookup"):
+        user = await get_user(message.from_user.id)
     if not user:
         user_role = 'guest'
         user_id = message.from_user.id
@@ -152,26 +175,114 @@ async def ai_answer(message: Message):
         user_id = user['id']
         logger.info(f"User {user_id} (role: {user_role}) asking a question.")
 
-    # Проверяем лимит вопросов для гостей
-    is_allowed = await check_question_limit(user_id, user_role)
-    if not is_allowed:
-        await message.answer("Вы превысили лимит вопросов на сегодня (3 вопроса).", reply_markup=MAIN_MENU)
+    # Проверяем лимит вопросов для роли пользователя
+    with span("rate_limit"):
+        limit = await check_question_limit(user_id, user_role)
+    if not limit.allowed:
+        await message.answer(
+            f"Вы превысили лимит вопросов. Следующий вопрос можно задать через {format_reset(limit.reset_in)}.",
+            reply_markup=MAIN_MENU,
+        )
         return
 
-    # Ищем релевантные документы
-    docs = await doc_service.search(message.text)
-    # Формируем контекст из найденных документов
-    context = "\n".join(f"Документ: {d['name']}\n{d['text']}" for d in docs[:3])
+    # Сразу показываем, что вопрос принят: ответ будет дописываться в это сообщение
+    placeholder = None
+    if settings.stream_answers:
+        with span("telegram_send"):
+            # Без reply_markup: сообщение с ReplyKeyboardMarkup Telegram не даёт редактировать
+            # (клавиатура меню у пользователя остаётся от предыдущих сообщений)
+            placeholder = await message.answer("⏳ Ищу ответ в документах...")
 
-    # Получаем ответ от ИИ
-    answer = await ask_ai(message.text, context)
+    # Ищем релевантные фрагменты документов (эмбеддинг и FAISS замеряются в сервисе).
+    # Фрагменты со сходством ниже settings.search_min_score отбрасываются сервисом:
+    # если релевантных нет, вопрос уходит ИИ без контекста
+    with span("retrieval"):
+        if settings.rerank_enabled:
+            # Больше кандидатов для cross-encoder'а, в контекст — только лучшие
+            docs = await doc_service.search(message.text, top_k=reranker.top_n)
+            docs = (await reranker.rerank(message.text, docs, doc_service.index_version))[:settings.rerank_keep]
+        else:
+            docs = await doc_service.search(message.text)
+    # Формируем контекст из лучших фрагментов в пределах бюджета токенов
+    context = build_context(docs, settings.context_max_tokens)
+
+    # Получаем ответ от ИИ (или из кэша ответов на близкие вопросы)
+    context_key = make_context_key(doc_service.index_version, context.docs) if context.docs else None
+    sources = _sources_block(context.docs)
+    if placeholder is not None:
+        await _stream_reply(placeholder, ask_ai_stream(message.text, context.text, context_key), sources)
+        return
+
+    with span("llm"):
+        answer = await ask_ai(message.text, context.text, context_key)
+    with span("telegram_send"):
+        await message.answer(answer + sources, reply_markup=MAIN_MENU)
+
+
+# Блок источников под ответом
+def _sources_block(docs: list) -> str:
+    if not docs:
+        return ""
+    # Несколько фрагментов одного документа показываем одной строкой
+    best: dict = {}
+    for d in docs:
+        best.setdefault(d['name'], d['score'])
+    sources = "\n".join(
+        f"🔹 {name} (релевантность: {score:.1%})"
+        for name, score in best.items()
+    )
+    return f"\n\n📚 Использованные документы:\n{sources}"
+
+
+# Выводит потоковый ответ правкой сообщения-заглушки не чаще stream_edit_interval
+async def _stream_reply(placeholder: Message, chunks, suffix: str):
+    text = ""
+    shown = ""
+    next_edit = 0.0
+    async for chunk in chunks:
+        text += chunk
+        now = time.monotonic()
+        if now >= next_edit:
+            shown, delay = await _edit_text(placeholder, text[:TELEGRAM_TEXT_LIMIT], shown)
+            next_edit = now + max(settings.stream_edit_interval, delay)
+
+    # Финальная правка с источниками; хвост длиннее лимита — отдельными сообщениями
+    parts = _split_text(text + suffix)
+    shown, delay = await _edit_text(placeholder, parts[0], shown)
+    if delay:
+        await asyncio.sleep(delay)
+        shown, _ = await _edit_text(placeholder, parts[0], shown)
+    if shown != parts[0]:
+        # Правка не удалась: ответ не должен потеряться в заглушке
+        await placeholder.answer(parts[0], reply_markup=MAIN_MENU)
+    for part in parts[1:]:
+        await placeholder.answer(part, reply_markup=MAIN_MENU)
+
+
+# Правка текста сообщения; возвращает показанный текст и паузу при flood control
+async def _edit_text(msg: Message, text: str, shown: str):
+    if not text.strip() or text == shown:
+        return shown, 0.0
+    try:
+        with span("telegram_send"):
+            await msg.edit_text(text)
+    except TelegramRetryAfter as e:
+        logger.warning(f"Telegram flood control on edit, retry after {e.retry_after}s")
+        return shown, float(e.retry_after)
+    except TelegramBadRequest as e:
+        if "message is not modified" in str(e):
+            return text, 0.0
+        logger.warning(f"Edit failed: {e}")
+        return shown, 0.0
+    return text, 0.0
 
-    # Формируем итоговое сообщение с ответом и источниками
-    if docs:
-        sources = "\n".join(
-            f"🔹 {d['name']} (релевантность: {d['score']:.1%})"
-            for d in docs[:3]
-        )
-        answer = f"{answer}\n\n📚 Использованные документы:\n{sources}"
 
-    await message.answer(answer, reply_markup=MAIN_MENU)
+def _split_text(text: str, limit: int = TELEGRAM_TEXT_LIMIT) -> list:
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        cut = cut if cut > 0 else limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    parts.append(text)
+    return parts
@@ -0,0 +1,44 @@
+# app/bot/middlewares.py
+"""
+Middleware aiogram: метрики обработки обновлений.
+"""
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from app.database.log_writer import bot_log_writer
+from app.monitoring import REQUESTS_TOTAL, LATENCY_SECONDS, HANDLER_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Считает запросы и пишет латентность каждого хендлера (с меткой статуса)
+    в Prometheus и в журнал bot_logs.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        REQUESTS_TOTAL.inc()
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            LATENCY_SECONDS.observe(elapsed)
+            HANDLER_LATENCY.labels(handler=name, status=status).observe(elapsed)
+            logger.debug(f"Handler {name} finished in {elapsed * 1000:.1f} ms ({status})")
+            user = data.get("event_from_user")
+            await bot_log_writer.log(user.id if user else None, name, status, elapsed * 1000)
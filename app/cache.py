@@ -0,0 +1,73 @@
+# app/cache.py
+"""
+In-process LRU-кэш с TTL и счётчиками попаданий.
+
+Используется как первый (локальный) уровень кэшей бота; общий для реплик
+второй уровень живёт в Redis и реализуется в конкретных сервисах.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from app.monitoring import CACHE_REQUESTS
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU-кэш ограниченного размера с временем жизни записей.
+
+    Args:
+        name: Имя кэша в метриках (метка ``cache``).
+        maxsize: Максимальное число записей; при переполнении вытесняется
+            самая давно использованная.
+        ttl: Время жизни записи в секундах (0 — без ограничения).
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 3600):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key, _MISSING)
+        if item is not _MISSING:
+            expires, value = item
+            if not expires or expires > time.monotonic():
+                self._data.move_to_end(key)
+                self._count(True)
+                return value
+            del self._data[key]
+        self._count(False)
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (time.monotonic() + ttl if ttl else 0, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def _count(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        CACHE_REQUESTS.labels(cache=self.name, level="local", result="hit" if hit else "miss").inc()
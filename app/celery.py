@@ -6,4 +6,12 @@ celery = Celery(
     broker=settings.redis_url,
     backend=settings.redis_url,
     include=['app.services.tasks']
-)
\ No newline at end of file
+)
+celery.conf.update(
+    # CELERY_EAGER: задачи выполняются синхронно в вызывающем процессе (локально, в тестах)
+    task_always_eager=settings.celery_eager,
+    task_eager_propagates=True,
+    # Шард подтверждается после выполнения: при падении воркера его возьмёт другой
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+)
@@ -1,6 +1,7 @@
 # Конфигурация приложения
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
+from typing import Dict
 
 class Settings(BaseSettings):
     bot_token: str = Field(..., json_schema_extra={"env": "BOT_TOKEN"})
@@ -9,6 +10,119 @@ class Settings(BaseSettings):
     redis_url: str = Field(..., json_schema_extra={"env": "REDIS_URL"})
     sro_api_url: str = Field(..., json_schema_extra={"env": "SRO_API_URL"})
     env: str = Field("development", json_schema_extra={"env": "ENVIRONMENT"})
+    # Каталог дискового кэша эмбеддингов/индекса (пустая строка отключает кэш)
+    index_cache_dir: str = Field("data/index_cache", json_schema_extra={"env": "INDEX_CACHE_DIR"})
+    # Поиск по документам: потоки пула и окно микро-батчинга запросов
+    search_workers: int = Field(2, json_schema_extra={"env": "SEARCH_WORKERS"})
+    search_batch_window_ms: float = Field(5.0, json_schema_extra={"env": "SEARCH_BATCH_WINDOW_MS"})
+    search_max_batch: int = Field(32, json_schema_extra={"env": "SEARCH_MAX_BATCH"})
+    # Загрузка корпуса: процессов разбора PDF/DOCX (0 — по числу ядер; задачи Celery
+    # разбирают в своём процессе) и размер батча encode
+    ingest_workers: int = Field(0, json_schema_extra={"env": "INGEST_WORKERS"})
+    ingest_batch_size: int = Field(64, json_schema_extra={"env": "INGEST_BATCH_SIZE"})
+    # Переиндексация задачами Celery (app.services.tasks): каталог версий артефакта индекса
+    # (общий для воркеров и ботов), загружать ли его в ботах вместо разбора корпуса,
+    # файлов на шард, повторы шарда, сколько версий хранить; eager — без брокера
+    index_artifact_dir: str = Field("data/index_artifacts", json_schema_extra={"env": "INDEX_ARTIFACT_DIR"})
+    index_artifact_load: bool = Field(False, json_schema_extra={"env": "INDEX_ARTIFACT_LOAD"})
+    reindex_shard_size: int = Field(50, json_schema_extra={"env": "REINDEX_SHARD_SIZE"})
+    reindex_max_retries: int = Field(3, json_schema_extra={"env": "REINDEX_MAX_RETRIES"})
+    reindex_keep_versions: int = Field(3, json_schema_extra={"env": "REINDEX_KEEP_VERSIONS"})
+    celery_eager: bool = Field(False, json_schema_extra={"env": "CELERY_EAGER"})
+    # Загружать корпус документов в фоне при старте (иначе — при первом вопросе)
+    docs_preload: bool = Field(True, json_schema_extra={"env": "DOCS_PRELOAD"})
+    # Поиск по документам в процессе бота (local) или в отдельном процессе через Unix-сокет (worker)
+    retrieval_mode: str = Field("local", json_schema_extra={"env": "RETRIEVAL_MODE"})
+    retrieval_socket: str = Field("/tmp/sro_retrieval.sock", json_schema_extra={"env": "RETRIEVAL_SOCKET"})
+    retrieval_pool_size: int = Field(4, json_schema_extra={"env": "RETRIEVAL_POOL_SIZE"})
+    retrieval_timeout: float = Field(30.0, json_schema_extra={"env": "RETRIEVAL_TIMEOUT"})
+    # При недоступном процессе поиска искать в процессе бота (загружает модель);
+    # через retry секунд клиент снова пробует сокет
+    retrieval_fallback_local: bool = Field(False, json_schema_extra={"env": "RETRIEVAL_FALLBACK_LOCAL"})
+    retrieval_fallback_retry: float = Field(30.0, json_schema_extra={"env": "RETRIEVAL_FALLBACK_RETRY"})
+    # Тип FAISS-индекса: auto | flat | sq_fp16 | sq8 | hnsw | ivf_flat | ivf_sq8 | ivf_pq
+    # и параметры поиска (nprobe для IVF, efSearch для HNSW)
+    vector_index_type: str = Field("auto", json_schema_extra={"env": "VECTOR_INDEX_TYPE"})
+    vector_index_nprobe: int = Field(16, json_schema_extra={"env": "VECTOR_INDEX_NPROBE"})
+    vector_index_ef_search: int = Field(64, json_schema_extra={"env": "VECTOR_INDEX_EF_SEARCH"})
+    # Минимальное косинусное сходство фрагмента с вопросом: ниже порога фрагмент не попадает в контекст
+    # (кроме сильных совпадений BM25 в гибридном режиме — точные номера и аббревиатуры)
+    search_min_score: float = Field(0.3, json_schema_extra={"env": "SEARCH_MIN_SCORE"})
+    # Сильное совпадение BM25: оценка не ниже этой доли максимально возможной для запроса
+    search_lexical_min_score: float = Field(0.3, json_schema_extra={"env": "SEARCH_LEXICAL_MIN_SCORE"})
+    # Гибридный поиск: BM25 по фрагментам (номера статей, ИНН, аббревиатуры) вместе с векторным
+    search_hybrid: bool = Field(True, json_schema_extra={"env": "SEARCH_HYBRID"})
+    # Переранжирование кандидатов cross-encoder'ом: сколько оценивать, сколько брать в контекст,
+    # бюджет времени на вопрос (при превышении — порядок поиска) и кэш результатов
+    rerank_enabled: bool = Field(False, json_schema_extra={"env": "RERANK_ENABLED"})
+    rerank_model: str = Field("cross-encoder/mmarco-mMiniLMv2-L12-H384-v1", json_schema_extra={"env": "RERANK_MODEL"})
+    rerank_top_n: int = Field(10, json_schema_extra={"env": "RERANK_TOP_N"})
+    rerank_keep: int = Field(2, json_schema_extra={"env": "RERANK_KEEP"})
+    rerank_budget_ms: float = Field(300.0, json_schema_extra={"env": "RERANK_BUDGET_MS"})
+    rerank_cache_size: int = Field(1024, json_schema_extra={"env": "RERANK_CACHE_SIZE"})
+    rerank_cache_ttl: int = Field(3600, json_schema_extra={"env": "RERANK_CACHE_TTL"})
+    # Максимум вопросов в очереди оценки: сверх него переранжирование пропускается
+    rerank_max_pending: int = Field(32, json_schema_extra={"env": "RERANK_MAX_PENDING"})
+    # Бюджет токенов контекста документов в промпте и локальный токенизатор для подсчёта
+    # (путь к tokenizer.json или имя модели HF Hub; пусто — оценка по символам)
+    context_max_tokens: int = Field(1500, json_schema_extra={"env": "CONTEXT_MAX_TOKENS"})
+    context_tokenizer: str = Field("", json_schema_extra={"env": "CONTEXT_TOKENIZER"})
+    # Кэш поиска: локальный LRU и (опционально) общий уровень в Redis
+    search_cache_size: int = Field(1024, json_schema_extra={"env": "SEARCH_CACHE_SIZE"})
+    search_cache_ttl: int = Field(3600, json_schema_extra={"env": "SEARCH_CACHE_TTL"})
+    search_cache_redis: bool = Field(False, json_schema_extra={"env": "SEARCH_CACHE_REDIS"})
+    search_cache_redis_ttl: int = Field(86400, json_schema_extra={"env": "SEARCH_CACHE_REDIS_TTL"})
+    # Семантический кэш ответов ИИ
+    answer_cache_enabled: bool = Field(True, json_schema_extra={"env": "ANSWER_CACHE_ENABLED"})
+    answer_cache_threshold: float = Field(0.92, json_schema_extra={"env": "ANSWER_CACHE_THRESHOLD"})
+    answer_cache_size: int = Field(512, json_schema_extra={"env": "ANSWER_CACHE_SIZE"})
+    answer_cache_ttl: int = Field(3600, json_schema_extra={"env": "ANSWER_CACHE_TTL"})
+    answer_cache_redis: bool = Field(False, json_schema_extra={"env": "ANSWER_CACHE_REDIS"})
+    # HTTP-клиенты: реестр СРО (aiohttp) и DeepSeek (httpx)
+    registry_http_limit: int = Field(10, json_schema_extra={"env": "REGISTRY_HTTP_LIMIT"})
+    registry_http_limit_per_host: int = Field(4, json_schema_extra={"env": "REGISTRY_HTTP_LIMIT_PER_HOST"})
+    registry_connect_timeout: float = Field(5.0, json_schema_extra={"env": "REGISTRY_CONNECT_TIMEOUT"})
+    registry_read_timeout: float = Field(15.0, json_schema_extra={"env": "REGISTRY_READ_TIMEOUT"})
+    ai_http_max_connections: int = Field(20, json_schema_extra={"env": "AI_HTTP_MAX_CONNECTIONS"})
+    ai_http_max_keepalive: int = Field(10, json_schema_extra={"env": "AI_HTTP_MAX_KEEPALIVE"})
+    ai_http_timeout: float = Field(60.0, json_schema_extra={"env": "AI_HTTP_TIMEOUT"})
+    # Локальная реплика реестра СРО: период синхронизации и срок свежести записей, секунды
+    registry_sync_enabled: bool = Field(True, json_schema_extra={"env": "REGISTRY_SYNC_ENABLED"})
+    registry_sync_interval: int = Field(21600, json_schema_extra={"env": "REGISTRY_SYNC_INTERVAL"})
+    registry_sync_page_delay: float = Field(0.5, json_schema_extra={"env": "REGISTRY_SYNC_PAGE_DELAY"})
+    registry_freshness_ttl: int = Field(86400, json_schema_extra={"env": "REGISTRY_FRESHNESS_TTL"})
+    # Разборщик HTML реестра: auto | selectolax | lxml | bs4
+    registry_parser: str = Field("auto", json_schema_extra={"env": "REGISTRY_PARSER"})
+    # Потоковые ответы: правка сообщения не чаще раза в stream_edit_interval секунд
+    stream_answers: bool = Field(True, json_schema_extra={"env": "STREAM_ANSWERS"})
+    stream_edit_interval: float = Field(1.0, json_schema_extra={"env": "STREAM_EDIT_INTERVAL"})
+    # Порт экспортера Prometheus (0 — не запускать)
+    metrics_port: int = Field(8000, json_schema_extra={"env": "METRICS_PORT"})
+    # Кэш профилей пользователей (get_user): локальный LRU и (опционально) хэш в Redis;
+    # изменения профиля рассылаются другим процессам через pub/sub Redis
+    user_cache_size: int = Field(10000, json_schema_extra={"env": "USER_CACHE_SIZE"})
+    user_cache_ttl: int = Field(600, json_schema_extra={"env": "USER_CACHE_TTL"})
+    user_cache_redis: bool = Field(False, json_schema_extra={"env": "USER_CACHE_REDIS"})
+    # Лимиты вопросов по ролям: "<fixed|sliding|bucket>:<лимит>/<окно, с>" (JSON в переменной окружения);
+    # fixed-окна выравниваются по полуночи в зоне со смещением rate_limit_tz_offset секунд (МСК)
+    rate_limit_policies: Dict[str, str] = Field({"guest": "fixed:3/86400"}, json_schema_extra={"env": "RATE_LIMIT_POLICIES"})
+    rate_limit_tz_offset: int = Field(10800, json_schema_extra={"env": "RATE_LIMIT_TZ_OFFSET"})
+    # Пул asyncpg: размеры, таймауты (секунды), кэш подготовленных выражений, период проверки пула
+    db_pool_min_size: int = Field(2, json_schema_extra={"env": "DB_POOL_MIN_SIZE"})
+    db_pool_max_size: int = Field(10, json_schema_extra={"env": "DB_POOL_MAX_SIZE"})
+    db_pool_max_inactive_lifetime: float = Field(300.0, json_schema_extra={"env": "DB_POOL_MAX_INACTIVE_LIFETIME"})
+    db_acquire_timeout: float = Field(5.0, json_schema_extra={"env": "DB_ACQUIRE_TIMEOUT"})
+    db_command_timeout: float = Field(10.0, json_schema_extra={"env": "DB_COMMAND_TIMEOUT"})
+    db_statement_cache_size: int = Field(100, json_schema_extra={"env": "DB_STATEMENT_CACHE_SIZE"})
+    # Пул SQLAlchemy (только для get_db, создаётся лениво)
+    db_sqlalchemy_pool_size: int = Field(2, json_schema_extra={"env": "DB_SQLALCHEMY_POOL_SIZE"})
+    db_health_interval: float = Field(30.0, json_schema_extra={"env": "DB_HEALTH_INTERVAL"})
+    # Журнал bot_logs: очередь в памяти, сброс пачкой каждые N записей или T миллисекунд
+    bot_log_enabled: bool = Field(True, json_schema_extra={"env": "BOT_LOG_ENABLED"})
+    bot_log_queue_size: int = Field(10000, json_schema_extra={"env": "BOT_LOG_QUEUE_SIZE"})
+    bot_log_batch_size: int = Field(500, json_schema_extra={"env": "BOT_LOG_BATCH_SIZE"})
+    bot_log_flush_ms: float = Field(1000.0, json_schema_extra={"env": "BOT_LOG_FLUSH_MS"})
+    bot_log_put_timeout: float = Field(0.0, json_schema_extra={"env": "BOT_LOG_PUT_TIMEOUT"})
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
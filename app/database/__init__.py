@@ -1,7 +1,14 @@
 """
 Работа с хранилищем: PostgreSQL, Redis, модели данных.
 """
-from .connection import db, lifespan
-from .models import Base, User
+from .connection import db, lifespan, on_shutdown, on_startup
 
-__all__ = ["db", "lifespan", "Base", "User"]
+__all__ = ["db", "lifespan", "on_startup", "on_shutdown", "Base", "User"]
+
+
+def __getattr__(name):
+    # Модели SQLAlchemy импортируются только по требованию: бот работает через asyncpg
+    if name in ("Base", "User"):
+        from . import models
+        return getattr(models, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
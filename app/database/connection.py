@@ -1,17 +1,42 @@
 # app/database/connection.py
 import logging  # <-- Убедиться, что импортирован
 import asyncio  # <-- Убедиться, что импортирован
+from types import MappingProxyType
+import time
+import uuid
+from app.cache import TTLCache
 from app.config import settings
+from app.monitoring import (
+    CACHE_REQUESTS,
+    DB_POOL_ACQUIRE_WAIT,
+    DB_POOL_HEALTHY,
+    DB_POOL_IDLE,
+    DB_POOL_SIZE,
+    start_prometheus_server,
+)
+from app.rate_limiter import LimitResult, RateLimiter
 import asyncpg
 import redis.asyncio as redis
-from typing import AsyncGenerator, AsyncIterator
-from contextlib import asynccontextmanager
-from datetime import date
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+from contextlib import AsyncExitStack, asynccontextmanager, suppress
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
 logger = logging.getLogger(__name__) # <-- Убедиться, что создан
 
+class AppConnection(asyncpg.Connection):
+    """Соединение пула с горячими запросами, подготовленными при открытии."""
+
+    async def prepare_hot_queries(self):
+        self.prepared = {}
+        for name, query in HOT_QUERIES.items():
+            try:
+                self.prepared[name] = await self.prepare(query)
+            except Exception as e:
+                # Например, таблицы ещё нет: запрос пойдёт текстом через кэш выражений asyncpg
+                logger.warning(f"Не удалось подготовить запрос {name}: {e}")
+
 class Database:
     def __init__(self, db_url: str, redis_url: str):
         self.db_url = db_url
@@ -19,13 +44,26 @@ class Database:
         # Инициализировать атрибуты как None для явности
         self.pool = None
         self.redis = None
+        self._health_task = None
 
     async def init(self):
         """Инициализирует соединения с PostgreSQL и Redis."""
         logger.info("Начало инициализации пула соединений PostgreSQL...")
         try:
-            self.pool = await asyncpg.create_pool(self.db_url)
-            logger.info("Пул соединений PostgreSQL успешно создан.")
+            self.pool = await asyncpg.create_pool(
+                self.db_url,
+                min_size=settings.db_pool_min_size,
+                max_size=settings.db_pool_max_size,
+                max_inactive_connection_lifetime=settings.db_pool_max_inactive_lifetime,
+                command_timeout=settings.db_command_timeout,
+                statement_cache_size=settings.db_statement_cache_size,
+                connection_class=AppConnection,
+                init=AppConnection.prepare_hot_queries,
+            )
+            logger.info(
+                f"Пул соединений PostgreSQL успешно создан "
+                f"(min={settings.db_pool_min_size}, max={settings.db_pool_max_size})."
+            )
         except Exception as e:
             logger.error(f"Ошибка при создании пула PostgreSQL: {e}", exc_info=True)
             raise
@@ -47,9 +85,51 @@ class Database:
                  logger.info("Пул PostgreSQL закрыт из-за ошибки инициализации Redis.")
              raise
 
+        # Фоновая проверка пула и обновление его метрик
+        if settings.db_health_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop(), name="db-health")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Соединение из пула с учётом времени ожидания в метрике DB_POOL_ACQUIRE_WAIT."""
+        started = time.perf_counter()
+        async with self.pool.acquire(timeout=settings.db_acquire_timeout) as conn:
+            DB_POOL_ACQUIRE_WAIT.observe(time.perf_counter() - started)
+            yield conn
+
+    def update_pool_metrics(self):
+        if self.pool is None:
+            return
+        DB_POOL_SIZE.set(self.pool.get_size())
+        DB_POOL_IDLE.set(self.pool.get_idle_size())
+
+    async def check_health(self) -> bool:
+        """Пробный запрос через пул; обновляет метрики пула."""
+        try:
+            async with self.acquire() as conn:
+                await conn.fetchval("SELECT 1", timeout=settings.db_acquire_timeout)
+            healthy = True
+        except Exception as e:
+            logger.error(f"Проверка пула PostgreSQL не прошла: {e}")
+            healthy = False
+        DB_POOL_HEALTHY.set(1 if healthy else 0)
+        self.update_pool_metrics()
+        return healthy
+
+    async def _health_loop(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(settings.db_health_interval)
+
     async def close(self):
         logger.info("Начало закрытия соединений с БД...")
-        # ... (остальной код close как в предыдущем примере) ...
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
         if self.pool:
             try:
                 await self.pool.close()
@@ -67,11 +147,38 @@ class Database:
 # Создание глобального экземпляра Database
 db = Database(settings.database_url, settings.redis_url)
 
-# SQLAlchemy engine и sessionmaker для альтернативного доступа (например, через get_db)
-# Исправляем замену префикса URL. Лучше использовать URL напрямую, если он уже правильный.
-# engine = create_async_engine(settings.database_url.replace("postgresql://", "postgresql+asyncpg://"))
-engine = create_async_engine(settings.database_url) # <-- Используем URL как есть
-async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+# SQLAlchemy engine для альтернативного доступа (get_db). Бот работает через пул asyncpg,
+# поэтому engine (и импорт SQLAlchemy) создаётся лениво при первом get_db. Его пул
+# ограничен db_sqlalchemy_pool_size, а таймауты и время жизни соединений берутся
+# из настроек пула asyncpg: всего к БД не больше db_pool_max_size + db_sqlalchemy_pool_size соединений.
+_engine = None
+_session_factory = None
+
+def get_engine() -> "AsyncEngine":
+    """Создаёт (один раз) и возвращает SQLAlchemy engine."""
+    global _engine, _session_factory
+    if _engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        _engine = create_async_engine(
+            db.db_url,  # <-- Используем URL как есть
+            pool_size=settings.db_sqlalchemy_pool_size,
+            max_overflow=0,
+            pool_timeout=settings.db_acquire_timeout,
+            pool_recycle=settings.db_pool_max_inactive_lifetime,
+            pool_pre_ping=True,
+            connect_args={"command_timeout": settings.db_command_timeout},
+        )
+        _session_factory = async_sessionmaker(_engine, expire_on_commit=False)
+        logger.info("SQLAlchemy engine создан.")
+    return _engine
+
+async def dispose_engine():
+    """Закрывает SQLAlchemy engine, если он создавался."""
+    global _engine, _session_factory
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+        _session_factory = None
 
 # Функция init_db для альтернативной инициализации или тестов
 async def init_db(db_url: str = None):
@@ -86,14 +193,9 @@ async def init_db(db_url: str = None):
     for attempt in range(max_retries):
         try:
             logger.info(f"Попытка инициализации БД #{attempt+1}...")
-            # Если передан новый URL, обновляем engine и async_session
+            # Если передан новый URL, обновляем его в db; engine пересоздастся при следующем get_db
             if db_url:
-                global engine, async_session
-                # Исправляем замену префикса URL
-                # engine = create_async_engine(db_url.replace("postgresql://", "postgresql+asyncpg://"))
-                engine = create_async_engine(db_url) # <-- Используем URL как есть
-                async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
-                # Также обновляем URL в экземпляре db для последующего использования в db.init()
+                await dispose_engine()
                 db.db_url = db_url
 
             # Вызываем метод init глобального экземпляра db
@@ -110,22 +212,177 @@ async def init_db(db_url: str = None):
             raise ConnectionError(f"Инициализация БД не удалась после {max_retries} попыток: {str(e)}")
 
 # Асинхронный генератор для получения SQLAlchemy сессии
-async def get_db() -> AsyncIterator[AsyncSession]:
+async def get_db() -> AsyncIterator["AsyncSession"]:
     """Получает асинхронную сессию SQLAlchemy."""
-    async with async_session() as session:
+    get_engine()
+    async with _session_factory() as session:
         yield session
 
+# Кэш профилей пользователей: роль меняется только при регистрации (upsert_user),
+# поэтому повторный вопрос того же пользователя не ходит в Postgres.
+# Первый уровень — LRU в процессе, второй (опционально) — хэш user:{id} в Redis.
+USER_COLUMNS = ("id", "inn", "is_member", "is_blocked", "role")
+
+# Запросы горячего пути, подготавливаемые один раз на соединение (AppConnection)
+HOT_QUERIES = {
+    "get_user": f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE id = $1",
+    "upsert_user": f"""
+        INSERT INTO users (id, inn, is_member, role, created_at, updated_at)
+        VALUES ($1, $2, $3, $4, NOW(), NOW())
+        ON CONFLICT (id) DO UPDATE SET inn=$2, is_member=$3, role=$4, updated_at=NOW()
+        RETURNING {', '.join(USER_COLUMNS)}
+    """,
+}
+
+async def _fetchrow(conn, name: str, *args):
+    stmt = conn.prepared.get(name)
+    if stmt is not None:
+        return await stmt.fetchrow(*args)
+    return await conn.fetchrow(HOT_QUERIES[name], *args)
+user_cache = TTLCache("users", maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl)
+# Отметка «пользователя нет в БД» (незарегистрированные гости тоже кэшируются).
+# Профили хранятся в кэше только для чтения, вызывающим отдаются копии
+_NO_USER = MappingProxyType({})
+
+def _user_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+def _user_to_hash(user) -> dict:
+    if not user:
+        return {"found": "0"}
+    return {
+        "found": "1",
+        "id": str(user["id"]),
+        "inn": user["inn"] or "",
+        "is_member": "1" if user["is_member"] else "0",
+        "is_blocked": "1" if user["is_blocked"] else "0",
+        "role": user["role"],
+    }
+
+def _user_from_hash(data: dict):
+    data = {k.decode() if isinstance(k, bytes) else k: v.decode() if isinstance(v, bytes) else v
+            for k, v in data.items()}
+    if data.get("found") != "1":
+        return _NO_USER
+    return MappingProxyType({
+        "id": int(data["id"]),
+        "inn": data["inn"] or None,
+        "is_member": data["is_member"] == "1",
+        "is_blocked": data["is_blocked"] == "1",
+        "role": data["role"],
+    })
+
+async def _redis_get_user(user_id: int):
+    if not settings.user_cache_redis or db.redis is None:
+        return None
+    try:
+        data = await db.redis.hgetall(_user_key(user_id))
+    except Exception as e:
+        logger.warning(f"User cache: Redis unavailable: {e}")
+        return None
+    CACHE_REQUESTS.labels(cache="users", level="redis", result="hit" if data else "miss").inc()
+    return _user_from_hash(data) if data else None
+
+async def _redis_set_user(user_id: int, user):
+    if not settings.user_cache_redis or db.redis is None:
+        return
+    key = _user_key(user_id)
+    try:
+        async with db.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping=_user_to_hash(user))
+            pipe.expire(key, settings.user_cache_ttl)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"User cache: Redis write failed: {e}")
+
+# Инвалидация локальных кэшей профилей в других процессах бота: upsert_user
+# публикует "<процесс>:<user_id>" в канал Redis, слушатель каждого процесса
+# удаляет запись из своего user_cache. Устаревшая запись живёт не дольше
+# доставки сообщения pub/sub; после переподключения слушателя локальный кэш
+# очищается целиком (пропущенные сообщения неизвестны). Без Redis — до
+# user_cache_ttl секунд
+USER_INVALIDATION_CHANNEL = "user:invalidate"
+_INSTANCE_ID = uuid.uuid4().hex
+_user_listener: Optional[asyncio.Task] = None
+
+async def _publish_user_invalidation(user_id: int):
+    if db.redis is None:
+        return
+    try:
+        await db.redis.publish(USER_INVALIDATION_CHANNEL, f"{_INSTANCE_ID}:{user_id}")
+    except Exception as e:
+        logger.warning(f"User cache: invalidation publish failed: {e}")
+
+def _apply_user_invalidation(data):
+    if isinstance(data, bytes):
+        data = data.decode()
+    instance, _, user_id = data.partition(":")
+    # Свой процесс уже записал в кэш новый профиль
+    if instance != _INSTANCE_ID:
+        user_cache.pop(int(user_id))
+
+async def _listen_user_invalidations():
+    reconnect = False
+    while True:
+        pubsub = db.redis.pubsub()
+        try:
+            await pubsub.subscribe(USER_INVALIDATION_CHANNEL)
+            if reconnect:
+                user_cache.clear()
+            while True:
+                # Таймаут меньше socket_timeout клиента: тишина в канале не считается обрывом
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=5.0)
+                if message is not None and message["type"] == "message":
+                    _apply_user_invalidation(message["data"])
+        except Exception as e:
+            logger.warning(f"User cache: invalidation listener failed: {e}")
+        finally:
+            with suppress(Exception):
+                await pubsub.aclose()
+        reconnect = True
+        await asyncio.sleep(1)
+
+def start_user_cache_listener():
+    """Запускает фоновый приём инвалидаций user_cache (нужен Redis)."""
+    global _user_listener
+    if db.redis is not None and _user_listener is None:
+        _user_listener = asyncio.create_task(_listen_user_invalidations(), name="user-cache-invalidation")
+
+async def stop_user_cache_listener():
+    global _user_listener
+    task, _user_listener = _user_listener, None
+    if task is not None:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
 # Функции для работы с PostgreSQL через asyncpg pool
 async def get_user(user_id: int):
-    """Получает пользователя из БД по user_id."""
+    """
+    Получает профиль пользователя (только USER_COLUMNS) по user_id.
+    Сначала из кэша, при промахе — из БД с записью результата в кэш.
+    """
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await _redis_get_user(user_id)
+        if user is not None:
+            user_cache.set(user_id, user)
+    if user is not None:
+        return dict(user) if user else None
+
     # Проверяем, инициализирован ли пул
     if db.pool is None:
         logger.error("Database pool is not initialized. Cannot get user.")
         # Можно выбросить исключение или вернуть None
         return None
 
-    async with db.pool.acquire() as conn:
-        return await conn.fetchrow("SELECT * FROM users WHERE id = $1", user_id)
+    async with db.acquire() as conn:
+        row = await _fetchrow(conn, "get_user", user_id)
+    user = MappingProxyType(dict(row)) if row else _NO_USER
+    user_cache.set(user_id, user)
+    await _redis_set_user(user_id, user)
+    return dict(user) if user else None
 
 async def upsert_user(user_id: int, inn: str, is_member: bool, role: str = 'guest'):
     """Создаёт или обновляет пользователя в БД."""
@@ -134,56 +391,163 @@ async def upsert_user(user_id: int, inn: str, is_member: bool, role: str = 'gues
         logger.error("Database pool is not initialized. Cannot upsert user.")
         raise RuntimeError("Database pool is not initialized.")
 
-    async with db.pool.acquire() as conn:
-        await conn.execute("""
-            INSERT INTO users (id, inn, is_member, role, created_at, updated_at)
-            VALUES ($1, $2, $3, $4, NOW(), NOW())
-            ON CONFLICT (id) DO UPDATE SET inn=$2, is_member=$3, role=$4, updated_at=NOW()
-        """, user_id, inn, is_member, role)
-
-# Функция для работы с Redis (ограничение количества вопросов)
-async def check_question_limit(user_id: int, role: str) -> bool:
-    """Проверяет, не превышен ли лимит вопросов для пользователя за день."""
-    # Проверяем, инициализирован ли клиент Redis
-    if db.redis is None:
-        logger.error("Redis client is not initialized. Cannot check question limit.")
-        # В случае проблем с Redis можно либо разрешить, либо запретить.
-        # Здесь выбрано разрешить, чтобы не блокировать работу бота.
-        return True
+    async with db.acquire() as conn:
+        row = await _fetchrow(conn, "upsert_user", user_id, inn, is_member, role)
+    # Запись в кэш сквозная: следующий get_user увидит новую роль без запроса к БД
+    user = MappingProxyType(dict(row)) if row else _NO_USER
+    user_cache.set(user_id, user)
+    await _redis_set_user(user_id, user)
+    await _publish_user_invalidation(user_id)
+
+# Локальная реплика реестра СРО (заполняется app.services.registry_sync)
+REGISTRY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS registry_members (
+        inn VARCHAR(12) PRIMARY KEY,
+        name TEXT NOT NULL,
+        status VARCHAR(64) NOT NULL,
+        join_date VARCHAR(32),
+        is_member BOOLEAN NOT NULL DEFAULT FALSE,
+        synced_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+"""
+
+async def ensure_registry_schema():
+    """Создаёт таблицу реплики реестра, если её нет."""
+    async with db.acquire() as conn:
+        await conn.execute(REGISTRY_SCHEMA)
 
-    if role != 'guest':
-        return True # Лимит применяется только к гостям
+async def get_registry_member(inn: str, max_age: int):
+    """Возвращает запись реплики реестра по ИНН, если она не старше max_age секунд."""
+    if db.pool is None:
+        return None
 
-    key = f"questions:{user_id}:{date.today()}"
-    # Увеличиваем счётчик и получаем новое значение
-    count = await db.redis.incr(key)
+    async with db.acquire() as conn:
+        row = await conn.fetchrow("""
+            SELECT name, inn, status, join_date, is_member FROM registry_members
+            WHERE inn = $1 AND synced_at > NOW() - make_interval(secs => $2)
+        """, inn, float(max_age))
+    return dict(row) if row else None
+
+async def upsert_registry_members(members, conn=None):
+    """Сохраняет записи реестра в реплику (synced_at обновляется)."""
+    if db.pool is None:
+        return
+    rows = [(m["inn"], m["name"], m["status"], m["join_date"], m["is_member"]) for m in members]
+    query = """
+        INSERT INTO registry_members (inn, name, status, join_date, is_member, synced_at)
+        VALUES ($1, $2, $3, $4, $5, NOW())
+        ON CONFLICT (inn) DO UPDATE SET name=$2, status=$3, join_date=$4, is_member=$5, synced_at=NOW()
+    """
+    if conn is not None:
+        await conn.executemany(query, rows)
+        return
+    async with db.acquire() as conn:
+        await conn.executemany(query, rows)
 
-    # Если это первое обращение за день, устанавливаем TTL на 24 часа (86400 секунд)
-    if count == 1:
-        await db.redis.expire(key, 86400)
+# Лимит вопросов по ролям (Redis, один Lua-скрипт на проверку)
+question_limiter = RateLimiter(
+    lambda: db.redis,
+    settings.rate_limit_policies,
+    tz_offset=settings.rate_limit_tz_offset,
+    prefix="questions",
+)
 
-    # Проверяем лимит (например, 3 вопроса в день для гостей)
-    if count > 3:
-        # Если лимит превышен, откатываем инкремент
-        await db.redis.decr(key)
-        return False # Лимит превышен
+async def check_question_limit(user_id: int, role: str) -> LimitResult:
+    """
+    Учитывает вопрос пользователя и проверяет лимит его роли.
+    При недоступности Redis вопрос разрешается, чтобы не блокировать работу бота.
+    """
+    return await question_limiter.check(user_id, role)
 
-    return True # Лимит не превышен
+# Закрытие долгоживущих HTTP-клиентов сервисов
+async def close_http_clients():
+    # Импорт здесь: сервисы сами импортируют этот модуль
+    from app.services.sro_registry_service import sro_registry_service
+    from app.services.ai_service import close_client
+    clients = [("SRO registry", sro_registry_service.close), ("DeepSeek", close_client)]
+    if settings.retrieval_mode == "worker":
+        from app.services.document_service import doc_service
+        clients.append(("retrieval worker", doc_service.close))
+    for name, close in clients:
+        try:
+            await close()
+        except Exception as e:
+            logger.error(f"Lifespan: Ошибка при закрытии HTTP-клиента {name}: {e}")
+    logger.info("Lifespan: HTTP-клиенты закрыты.")
 
-# Lifespan менеджер для aiogram
+# Lifespan менеджер ресурсов бота (в aiogram подключается через on_startup/on_shutdown)
 @asynccontextmanager
 async def lifespan(app):
     """Асинхронный контекстный менеджер для инициализации и закрытия ресурсов."""
+    registry_sync = None
+    bot_log_writer = None
     try:
         logger.info("LIFESPAN HAS BEEN ENTERED") # <-- Убедиться, что есть
         logger.info("Lifespan: Начало инициализации БД через lifespan...")
         await db.init()
         logger.info("Lifespan: Инициализация БД через lifespan успешно завершена.")
+        start_user_cache_listener()
+        if settings.metrics_port:
+            try:
+                start_prometheus_server(settings.metrics_port)
+                logger.info(f"Lifespan: Экспортер метрик Prometheus запущен на порту {settings.metrics_port}.")
+            except OSError as e:
+                logger.error(f"Lifespan: Не удалось запустить экспортер метрик: {e}")
+        if settings.registry_sync_enabled:
+            # Импорт здесь: сервис реестра сам импортирует этот модуль
+            from app.services.registry_sync import registry_sync
+            registry_sync.start()
+            logger.info("Lifespan: Фоновая синхронизация реестра СРО запущена.")
+        if settings.docs_preload:
+            # Модель и индекс документов грузятся в рабочем потоке: бот уже отвечает
+            # на команды без поиска (профиль, ИНН), вопросы дождутся готовности индекса
+            from app.services.document_service import doc_service
+            doc_service.start()
+            logger.info("Lifespan: Фоновая загрузка документов запущена.")
+            if settings.rerank_enabled:
+                from app.services.reranker import reranker
+                reranker.start()
+        if settings.bot_log_enabled:
+            from app.database.log_writer import bot_log_writer
+            await bot_log_writer.start()
+            logger.info("Lifespan: Пакетная запись журнала bot_logs запущена.")
         yield
     except Exception as e:
         logger.critical(f"Lifespan: Критическая ошибка инициализации БД: {e}", exc_info=True)
         raise
     finally:
+        if registry_sync is not None:
+            await registry_sync.stop()
+        if bot_log_writer is not None:
+            # Дописываем очередь журнала до закрытия пула
+            await bot_log_writer.stop()
+        await stop_user_cache_listener()
+        await close_http_clients()
+        if settings.rerank_enabled:
+            from app.services.reranker import reranker
+            reranker.close()
         logger.info("Lifespan: Начало закрытия соединений с БД...")
+        await dispose_engine()
         await db.close()
         logger.info("Lifespan: Закрытие соединений с БД завершено.")
+
+
+# Dispatcher aiogram 3 не принимает lifespan: контекст открывается в хуке
+# dp.startup и закрывается в dp.shutdown
+_lifespan_stack = None
+
+
+async def on_startup(dispatcher=None):
+    """Хук dp.startup: инициализирует ресурсы через lifespan."""
+    global _lifespan_stack
+    stack = AsyncExitStack()
+    await stack.enter_async_context(lifespan(dispatcher))
+    _lifespan_stack = stack
+
+
+async def on_shutdown(dispatcher=None):
+    """Хук dp.shutdown: закрывает ресурсы, открытые в on_startup."""
+    global _lifespan_stack
+    stack, _lifespan_stack = _lifespan_stack, None
+    if stack is not None:
+        await stack.aclose()
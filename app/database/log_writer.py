@@ -0,0 +1,167 @@
+# app/database/log_writer.py
+"""
+Асинхронная пакетная запись журнала взаимодействий (таблица bot_logs).
+
+Хендлеры не ходят в Postgres на каждое сообщение: запись кладётся в
+ограниченную очередь в памяти, а фоновая задача сбрасывает её пачками
+через COPY (``copy_records_to_table``) — каждые ``batch_size`` записей
+или каждые ``flush_ms`` миллисекунд, что наступит раньше. При полной
+очереди запись ждёт не дольше ``put_timeout`` секунд и отбрасывается
+(счётчик ``sro_bot_log_records_total{result="dropped"}``). При остановке
+(lifespan) очередь дописывается до конца.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from app.config import settings
+from app.database.connection import db
+from app.monitoring import BOT_LOG_QUEUE_SIZE, BOT_LOG_RECORDS, span
+
+logger = logging.getLogger(__name__)
+
+BOT_LOG_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS bot_logs (
+        id SERIAL PRIMARY KEY,
+        user_id BIGINT,
+        type VARCHAR(20),
+        status VARCHAR(10),
+        latency_ms INTEGER,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+"""
+COLUMNS = ("user_id", "type", "status", "latency_ms", "created_at")
+
+# user_id, type, status, latency_ms, created_at
+LogRecord = Tuple[Optional[int], str, str, int, datetime]
+
+# Метка конца очереди: после неё фоновая задача сбрасывает пачку и завершается
+_STOP = object()
+
+
+class BotLogWriter:
+    """
+    Буфер записей bot_logs с фоновым сбросом пачками.
+
+    Args:
+        maxsize: Ёмкость очереди (записей).
+        batch_size: Размер пачки, при котором она сбрасывается немедленно.
+        flush_ms: Максимальная задержка записи в базе, миллисекунды.
+        put_timeout: Сколько ждать места в полной очереди (0 — сразу отбросить).
+    """
+
+    def __init__(self, maxsize: int = 10000, batch_size: int = 500,
+                 flush_ms: float = 1000.0, put_timeout: float = 0.0):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.put_timeout = put_timeout
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done() and not self._stopping
+
+    async def log(self, user_id: Optional[int], type: str, status: str, latency_ms: float):
+        """Ставит запись в очередь; без запущенного писателя ничего не делает."""
+        if not self.running:
+            return
+        record = (user_id, type[:20], status[:10], int(latency_ms), datetime.now())
+        try:
+            if self.put_timeout > 0:
+                await asyncio.wait_for(self._queue.put(record), self.put_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            self.dropped += 1
+            BOT_LOG_RECORDS.labels(result="dropped").inc()
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"[BotLogWriter] Queue is full, {self.dropped} records dropped so far")
+            return
+        BOT_LOG_QUEUE_SIZE.set(self._queue.qsize())
+
+    async def _next_batch(self) -> Tuple[List[LogRecord], bool]:
+        # Ждём первую запись, затем добираем пачку до batch_size или до истечения flush_interval.
+        # Второй элемент результата — встречена ли метка остановки.
+        item = await self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def flush(self, batch: List[LogRecord]):
+        """Записывает пачку одним COPY; при ошибке пачка отбрасывается со счётчиком."""
+        if not batch:
+            return
+        if db.pool is None:
+            BOT_LOG_RECORDS.labels(result="failed").inc(len(batch))
+            return
+        try:
+            with span("bot_log_flush"):
+                async with db.acquire() as conn:
+                    await conn.copy_records_to_table("bot_logs", records=batch, columns=COLUMNS)
+        except Exception as e:
+            BOT_LOG_RECORDS.labels(result="failed").inc(len(batch))
+            logger.error(f"[BotLogWriter] Failed to write {len(batch)} records: {e}")
+            return
+        BOT_LOG_RECORDS.labels(result="written").inc(len(batch))
+        BOT_LOG_QUEUE_SIZE.set(self._queue.qsize())
+
+    async def run(self):
+        stop = False
+        while not stop:
+            batch, stop = await self._next_batch()
+            await self.flush(batch)
+
+    async def start(self):
+        if self.running:
+            return
+        if db.pool is not None:
+            async with db.acquire() as conn:
+                await conn.execute(BOT_LOG_SCHEMA)
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._stopping = False
+        self._task = asyncio.create_task(self.run(), name="bot-log-writer")
+
+    async def stop(self):
+        """Останавливает фоновую задачу и дописывает оставшиеся записи."""
+        if self._task is None:
+            return
+        # Новые записи больше не принимаются; метка встаёт в конец очереди,
+        # поэтому всё, что было поставлено раньше, будет записано
+        self._stopping = True
+        pending = self._queue.qsize()
+        if not self._task.done():
+            await self._queue.put(_STOP)
+        try:
+            await self._task
+        except Exception as e:
+            logger.error(f"[BotLogWriter] Writer task failed: {e}")
+        self._task = None
+        logger.info(f"[BotLogWriter] Stopped, {pending} queued records flushed")
+
+
+# Глобальный экземпляр журнала
+bot_log_writer = BotLogWriter(
+    maxsize=settings.bot_log_queue_size,
+    batch_size=settings.bot_log_batch_size,
+    flush_ms=settings.bot_log_flush_ms,
+    put_timeout=settings.bot_log_put_timeout,
+)
@@ -49,3 +49,13 @@ class BotLog(Base):
     status: Mapped[str] = mapped_column(sa.String(10))
     latency_ms: Mapped[int] = mapped_column(sa.Integer)
     created_at: Mapped[datetime] = mapped_column(sa.DateTime, server_default=sa.func.now())
+
+# Локальная реплика реестра членов СРО НОСО (синхронизируется с сайтом)
+class RegistryMember(Base):
+    __tablename__ = "registry_members"
+    inn: Mapped[str] = mapped_column(sa.String(12), primary_key=True)
+    name: Mapped[str] = mapped_column(sa.Text)
+    status: Mapped[str] = mapped_column(sa.String(64))
+    join_date: Mapped[str] = mapped_column(sa.String(32), nullable=True)
+    is_member: Mapped[bool] = mapped_column(default=False)
+    synced_at: Mapped[datetime] = mapped_column(sa.DateTime, server_default=sa.func.now())
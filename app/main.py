@@ -12,15 +12,17 @@ from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.redis import RedisStorage
 from app.config import settings
 from app.bot.handlers import router
-from app.database.connection import lifespan # <-- Убедиться, что lifespan импортируется
+from app.database.connection import on_shutdown, on_startup
 
 bot = Bot(settings.bot_token)
 print(f"Using Redis URL: {settings.redis_url}")  # Временная отладочная строка
 storage = RedisStorage.from_url(settings.redis_url)
 
-# Используем lifespan для инициализации/закрытия ресурсов
-dp = Dispatcher(storage=storage, lifespan=lifespan) 
+dp = Dispatcher(storage=storage)
 dp.include_router(router)
+# Инициализация/закрытие ресурсов (lifespan) — в хуках запуска и остановки
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
 
 # Точка входа для запуска бота в режиме polling
 # Исправить опечатку: name -> __name__
@@ -1,8 +1,56 @@
-from prometheus_client import Counter, Histogram, start_http_server
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Корзины для этапов обработки: от долей миллисекунды (кэш, FAISS) до десятков секунд (LLM)
+STAGE_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
 
 REQUESTS_TOTAL = Counter('sro_bot_requests_total', 'Total number of requests to the bot')
 LATENCY_SECONDS = Histogram('sro_bot_latency_seconds', 'Request latency in seconds', buckets=[0.1, 0.5, 1, 2, 5, 10])
 TOKENS_USED = Counter('openai_tokens_used', 'Total tokens used in OpenAI API calls')
+HANDLER_LATENCY = Histogram('sro_bot_handler_latency_seconds', 'Latency per aiogram handler', ['handler', 'status'], buckets=STAGE_BUCKETS)
+STAGE_LATENCY = Histogram('sro_bot_stage_latency_seconds', 'Latency per processing stage', ['stage'], buckets=STAGE_BUCKETS)
+LLM_TOKENS = Counter('sro_bot_llm_tokens_total', 'LLM tokens by kind (prompt or completion)', ['kind'])
+# Размер промпта: context — контекст документов, prompt — весь промпт (локальный подсчёт),
+# billed — prompt_tokens из ответа API
+PROMPT_TOKENS = Histogram('sro_bot_prompt_tokens', 'Prompt size in tokens by part', ['part'],
+                          buckets=[64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768])
+CACHE_REQUESTS = Counter('sro_bot_cache_requests_total', 'Cache lookups by cache, level and result', ['cache', 'level', 'result'])
+REGISTRY_LOOKUPS = Counter('sro_registry_lookups_total', 'INN lookups by source (replica or live site)', ['source'])
+REGISTRY_MEMBERS = Gauge('sro_registry_members', 'Number of organisations in the local registry replica')
+REGISTRY_SYNC_LAST_SUCCESS = Gauge('sro_registry_sync_last_success_timestamp', 'Unix time of the last successful registry sync')
+REGISTRY_SYNC_DURATION = Gauge('sro_registry_sync_duration_seconds', 'Duration of the last registry sync')
+REGISTRY_SYNC_ERRORS = Counter('sro_registry_sync_errors_total', 'Failed registry sync runs')
+DB_POOL_SIZE = Gauge('sro_db_pool_size', 'Open connections in the asyncpg pool')
+DB_POOL_IDLE = Gauge('sro_db_pool_idle', 'Idle connections in the asyncpg pool')
+DB_POOL_HEALTHY = Gauge('sro_db_pool_healthy', '1 if the last pool health probe succeeded')
+DB_POOL_ACQUIRE_WAIT = Histogram('sro_db_pool_acquire_wait_seconds', 'Time spent waiting for a pool connection', buckets=STAGE_BUCKETS)
+BOT_LOG_RECORDS = Counter('sro_bot_log_records_total', 'bot_logs records by result (written, dropped, failed)', ['result'])
+BOT_LOG_QUEUE_SIZE = Gauge('sro_bot_log_queue_size', 'Records waiting in the bot_logs write queue')
+RERANK_RESULTS = Counter('sro_rerank_results_total', 'Reranking outcomes (reranked, cached, timeout, skipped, error)', ['result'])
+
+@contextmanager
+def span(stage: str):
+    """Замеряет длительность блока и пишет её в STAGE_LATENCY{stage}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage=stage).observe(time.perf_counter() - started)
+
+def record_usage(usage):
+    """Учитывает токены из поля usage ответа chat.completions."""
+    if usage is None:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = getattr(usage, f"{kind}_tokens", None)
+        if isinstance(tokens, int):
+            LLM_TOKENS.labels(kind=kind).inc(tokens)
+            if kind == "prompt":
+                PROMPT_TOKENS.labels(part="billed").observe(tokens)
+    total = getattr(usage, "total_tokens", None)
+    if isinstance(total, int):
+        TOKENS_USED.inc(total)
 
 def start_prometheus_server(port=8000):
     start_http_server(port)
@@ -0,0 +1,173 @@
+# app/rate_limiter.py
+"""
+Ограничение числа вопросов к ИИ на Redis.
+
+Проверка выполняется одним Lua-скриптом (EVALSHA): подсчёт, установка TTL
+и отказ при превышении происходят атомарно за один round-trip, ключ не
+может остаться без TTL. Время берётся из Redis (TIME), поэтому окна
+совпадают у всех реплик бота.
+
+Политики задаются по ролям строкой ``<вид>:<лимит>/<окно в секундах>``:
+
+* ``fixed`` — фиксированное окно, выровненное по границе (для суток — по
+  полуночи с учётом ``tz_offset``);
+* ``sliding`` — скользящее окно (журнал запросов в sorted set);
+* ``bucket`` — token bucket: ``лимит`` токенов, полностью восполняются за окно.
+
+Роли без политики не ограничиваются.
+"""
+import logging
+import uuid
+from typing import Callable, Dict, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+POLICY_KINDS = ("fixed", "sliding", "bucket")
+
+# KEYS[1] — ключ счётчика; ARGV: вид, лимит, окно (мс), смещение зоны (мс), уникальный id запроса.
+# Возвращает {разрешено (0/1), остаток, мс до сброса}.
+LIMIT_SCRIPT = """
+local kind = ARGV[1]
+local limit = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+if kind == 'fixed' then
+    local offset = tonumber(ARGV[4])
+    local start = now - ((now + offset) % window)
+    local key = KEYS[1] .. ':' .. start
+    local reset = start + window - now
+    local count = tonumber(redis.call('GET', key) or '0')
+    if count >= limit then
+        return {0, 0, reset}
+    end
+    count = redis.call('INCR', key)
+    redis.call('PEXPIRE', key, reset)
+    return {1, limit - count, reset}
+elseif kind == 'sliding' then
+    local key = KEYS[1]
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    local count = redis.call('ZCARD', key)
+    if count >= limit then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        return {0, 0, tonumber(oldest[2]) + window - now}
+    end
+    redis.call('ZADD', key, now, ARGV[5])
+    redis.call('PEXPIRE', key, window)
+    local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+    return {1, limit - count - 1, tonumber(oldest[2]) + window - now}
+else
+    local key = KEYS[1]
+    local rate = limit / window
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or limit
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(limit, tokens + (now - ts) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', key, window)
+    local reset
+    if allowed == 1 then
+        reset = math.ceil((limit - tokens) / rate)
+    else
+        reset = math.ceil((1 - tokens) / rate)
+    end
+    return {allowed, math.floor(tokens), reset}
+end
+"""
+
+
+class Policy(NamedTuple):
+    kind: str
+    limit: int
+    window: int  # секунды
+
+
+class LimitResult(NamedTuple):
+    allowed: bool
+    remaining: Optional[int]  # None — без ограничения
+    reset_in: float  # секунд до сброса окна (или до следующего токена при отказе)
+
+
+UNLIMITED = LimitResult(True, None, 0.0)
+
+
+def parse_policy(spec: str) -> Policy:
+    """Разбирает строку вида ``fixed:3/86400``."""
+    try:
+        kind, rest = spec.split(":", 1)
+        limit, window = rest.split("/", 1)
+        policy = Policy(kind.strip(), int(limit), int(window))
+    except ValueError:
+        raise ValueError(f"Invalid rate limit policy '{spec}', expected '<kind>:<limit>/<window>'")
+    if policy.kind not in POLICY_KINDS or policy.limit <= 0 or policy.window <= 0:
+        raise ValueError(f"Invalid rate limit policy '{spec}'")
+    return policy
+
+
+class RateLimiter:
+    """
+    Лимиты по ролям поверх Redis.
+
+    Args:
+        redis: Функция без аргументов, возвращающая клиент redis.asyncio
+            (клиент создаётся в lifespan позже limiter'а).
+        policies: Роль -> политика (строка или Policy).
+        tz_offset: Смещение часового пояса в секундах для выравнивания fixed-окон.
+        prefix: Префикс ключей.
+    """
+
+    def __init__(self, redis: Callable, policies: Dict[str, object], tz_offset: int = 0, prefix: str = "ratelimit"):
+        self._redis = redis
+        self.policies = {
+            role: policy if isinstance(policy, Policy) else parse_policy(policy)
+            for role, policy in policies.items()
+        }
+        self.tz_offset = tz_offset
+        self.prefix = prefix
+        self._script = None
+        self._script_client = None
+
+    def _get_script(self, client):
+        # register_script сам делает EVALSHA и подгружает скрипт при NOSCRIPT
+        if self._script is None or self._script_client is not client:
+            self._script = client.register_script(LIMIT_SCRIPT)
+            self._script_client = client
+        return self._script
+
+    async def check(self, user_id: int, role: str) -> LimitResult:
+        """Учитывает запрос пользователя и возвращает решение с остатком квоты."""
+        policy = self.policies.get(role)
+        if policy is None:
+            return UNLIMITED
+        client = self._redis()
+        if client is None:
+            logger.error("Redis client is not initialized. Cannot check question limit.")
+            return UNLIMITED
+
+        key = f"{self.prefix}:{policy.kind}:{role}:{user_id}"
+        try:
+            allowed, remaining, reset_ms = await self._get_script(client)(
+                keys=[key],
+                args=[policy.kind, policy.limit, policy.window * 1000, self.tz_offset * 1000, uuid.uuid4().hex],
+            )
+        except Exception as e:
+            # Недоступность Redis не должна блокировать работу бота
+            logger.error(f"[RateLimiter] Limit check failed for user {user_id}: {e}")
+            return UNLIMITED
+        return LimitResult(bool(allowed), int(remaining), int(reset_ms) / 1000)
+
+
+def format_reset(seconds: float) -> str:
+    """Время до сброса лимита для сообщения пользователю."""
+    seconds = max(int(seconds), 1)
+    hours, rest = divmod(seconds, 3600)
+    minutes = (rest + 59) // 60 if not hours else rest // 60
+    if hours:
+        return f"{hours} ч {minutes} мин" if minutes else f"{hours} ч"
+    return f"{minutes} мин"
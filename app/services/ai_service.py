@@ -1,31 +1,139 @@
 # Сервис для работы с ИИ (DeepSeek API)
+import logging
+import time
 from openai import AsyncOpenAI
 import httpx
+from typing import AsyncIterator, Optional
 from app.config import settings
+from app.database.connection import db
+from app.monitoring import PROMPT_TOKENS, STAGE_LATENCY, record_usage, span
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.context_builder import token_counter, trim_to_tokens
 
+logger = logging.getLogger(__name__)
+
+ERROR_ANSWER = "Ошибка при получении ответа"
+
+# Общий HTTP-клиент с ограниченным пулом keep-alive соединений к DeepSeek
 client = AsyncOpenAI(
     api_key=settings.deepseek_api_key,
     base_url="https://api.deepseek.com",
-    http_client=httpx.AsyncClient(proxy=None)
+    http_client=httpx.AsyncClient(
+        proxy=None,
+        limits=httpx.Limits(
+            max_connections=settings.ai_http_max_connections,
+            max_keepalive_connections=settings.ai_http_max_keepalive,
+            keepalive_expiry=30,
+        ),
+        timeout=httpx.Timeout(settings.ai_http_timeout, connect=5.0),
+    )
 )
 
-# Основная функция для вопросов к ИИ с контекстом из документов
-async def ask_ai(question: str, context: str = "") -> str:
-    if settings.deepseek_api_key == "test_key":
-        return "Тестовый ответ на вопрос: " + question
-        
+# Закрытие пула соединений (вызывается из lifespan)
+async def close_client():
+    await client.close()
+
+# Кэш ответов на близкие вопросы с тем же контекстом
+answer_cache = SemanticAnswerCache(
+    threshold=settings.answer_cache_threshold,
+    maxsize=settings.answer_cache_size,
+    ttl=settings.answer_cache_ttl,
+    redis=(lambda: db.redis) if settings.answer_cache_redis else None,
+)
+
+# Сообщения для chat.completions: системный промпт с контекстом и вопрос.
+# Контекст длиннее settings.context_max_tokens обрезается по границе предложения
+# (хендлер собирает его в бюджете через build_context)
+def _build_messages(question: str, context: str = "") -> list:
     system_prompt = """Ты консультант СРО НОСО. Отвечай на вопросы, используя предоставленные документы.
 Если в документах нет ответа, скажи об этом. Будь вежлив и профессионален."""
-    
+
+    context_tokens = token_counter.count(context)
+    if context_tokens > settings.context_max_tokens:
+        context = trim_to_tokens(context, settings.context_max_tokens)
+        context_tokens = token_counter.count(context)
     if context:
         system_prompt += "\n\nКонтекст из документов:\n" + context
+    PROMPT_TOKENS.labels(part="context").observe(context_tokens)
+    PROMPT_TOKENS.labels(part="prompt").observe(token_counter.count(system_prompt) + token_counter.count(question))
 
-    msgs = [
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": question}
     ]
+
+# Эмбеддинг вопроса и ответ из семантического кэша (если есть)
+async def _cached_answer(question: str, context_key: Optional[str]):
+    if context_key is None or not settings.answer_cache_enabled:
+        return None, None
+    # Импорт здесь: модель эмбеддингов нужна только для кэша ответов
+    from app.services.document_service import doc_service
+    embedding = await doc_service.embed_query(question)
+    return embedding, await answer_cache.get(embedding, context_key)
+
+# Основная функция для вопросов к ИИ с контекстом из документов
+# context_key — ключ набора фрагментов (make_context_key); если передан,
+# ответ берётся из семантического кэша или сохраняется в него
+async def ask_ai(question: str, context: str = "", context_key: Optional[str] = None) -> str:
+    if settings.deepseek_api_key == "test_key":
+        return "Тестовый ответ на вопрос: " + question
+
+    embedding, cached = await _cached_answer(question, context_key)
+    if cached is not None:
+        return cached
+
+    msgs = _build_messages(question, context)
     try:
-        r = await client.chat.completions.create(model="deepseek-chat", messages=msgs, max_tokens=1000)
-        return r.choices[0].message.content or "Ответ не получен."
+        with span("llm_call"):
+            r = await client.chat.completions.create(model="deepseek-chat", messages=msgs, max_tokens=1000)
+        record_usage(getattr(r, "usage", None))
+        answer = r.choices[0].message.content
     except Exception:
-        return "Ошибка при получении ответа"
+        return ERROR_ANSWER
+    if not answer:
+        return "Ответ не получен."
+    if embedding is not None:
+        await answer_cache.set(embedding, context_key, answer)
+    return answer
+
+# Потоковый вариант ask_ai: отдаёт ответ частями по мере генерации
+async def ask_ai_stream(question: str, context: str = "", context_key: Optional[str] = None) -> AsyncIterator[str]:
+    if settings.deepseek_api_key == "test_key":
+        yield "Тестовый ответ на вопрос: " + question
+        return
+
+    embedding, cached = await _cached_answer(question, context_key)
+    if cached is not None:
+        yield cached
+        return
+
+    msgs = _build_messages(question, context)
+    parts = []
+    started = time.perf_counter()
+    try:
+        stream = await client.chat.completions.create(
+            model="deepseek-chat", messages=msgs, max_tokens=1000, stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            # Последний чанк содержит только usage
+            record_usage(getattr(chunk, "usage", None))
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not parts:
+                    STAGE_LATENCY.labels(stage="llm_first_token").observe(time.perf_counter() - started)
+                parts.append(delta)
+                yield delta
+    except Exception:
+        logger.error("Ошибка потокового ответа DeepSeek", exc_info=True)
+        if not parts:
+            yield ERROR_ANSWER
+        return
+
+    STAGE_LATENCY.labels(stage="llm_call").observe(time.perf_counter() - started)
+    if not parts:
+        yield "Ответ не получен."
+    elif embedding is not None:
+        await answer_cache.set(embedding, context_key, "".join(parts))
@@ -0,0 +1,135 @@
+# app/services/answer_cache.py
+"""
+Семантический кэш ответов ИИ.
+
+Ответ DeepSeek переиспользуется, если новый вопрос близок к ранее
+заданному (косинусная близость эмбеддингов не ниже порога) и для него
+найден тот же набор фрагментов документов. Записи сгруппированы по ключу
+контекста: в него входит версия индекса, поэтому изменение корпуса
+автоматически инвалидирует кэш. Общий для реплик уровень — хэш в Redis
+на каждый ключ контекста.
+"""
+import base64
+import hashlib
+import json
+import logging
+import time
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+
+from app.cache import TTLCache
+from app.monitoring import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+def make_context_key(version: str, passages: Iterable[dict]) -> str:
+    """Ключ набора фрагментов контекста в рамках версии индекса."""
+    parts = [version] + [f"{p['doc_id']}:{p['start']}:{p['end']}" for p in passages]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    Кэш ответов по близости вопросов.
+
+    Args:
+        threshold: Минимальная косинусная близость вопросов для попадания.
+        maxsize: Число ключей контекста в локальном LRU.
+        ttl: Время жизни ответа, секунды.
+        bucket_size: Максимум вопросов на один ключ контекста.
+        redis: Функция, возвращающая клиент Redis (или None), для общего уровня.
+        prefix: Префикс ключей Redis.
+    """
+
+    def __init__(self, threshold: float = 0.92, maxsize: int = 512, ttl: int = 3600,
+                 bucket_size: int = 32, redis: Optional[Callable[[], object]] = None,
+                 prefix: str = "answers"):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.bucket_size = bucket_size
+        self.local = TTLCache("answers", maxsize=maxsize, ttl=ttl)
+        self._redis = redis
+        self.prefix = prefix
+
+    async def get(self, embedding: np.ndarray, context_key: str) -> Optional[str]:
+        """Возвращает сохранённый ответ на близкий вопрос с тем же контекстом."""
+        bucket = self.local.get(context_key)
+        if bucket is None:
+            bucket = await self._load_bucket(context_key)
+        answer = self._match(bucket or [], self._normalize(embedding))
+        CACHE_REQUESTS.labels(cache="answers", level="semantic", result="hit" if answer else "miss").inc()
+        return answer
+
+    async def set(self, embedding: np.ndarray, context_key: str, answer: str):
+        """Сохраняет ответ локально и (если включено) в Redis."""
+        vector = self._normalize(embedding)
+        now = time.time()
+        bucket = [e for e in (self.local.get(context_key) or []) if e["ts"] + self.ttl > now]
+        bucket.append({"vector": vector, "answer": answer, "ts": now})
+        self.local.set(context_key, bucket[-self.bucket_size:])
+
+        client = self._client()
+        if client is None:
+            return
+        field = hashlib.sha1(vector.tobytes()).hexdigest()[:16]
+        payload = json.dumps({
+            "vector": base64.b64encode(vector.tobytes()).decode(),
+            "answer": answer,
+            "ts": now,
+        }, ensure_ascii=False)
+        key = f"{self.prefix}:{context_key}"
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.hset(key, field, payload)
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.debug(f"[SemanticAnswerCache] Не удалось записать в Redis: {e}")
+
+    def clear(self):
+        self.local.clear()
+
+    async def _load_bucket(self, context_key: str) -> Optional[List[dict]]:
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            raw = await client.hgetall(f"{self.prefix}:{context_key}")
+        except Exception as e:
+            logger.debug(f"[SemanticAnswerCache] Redis недоступен: {e}")
+            return None
+        CACHE_REQUESTS.labels(cache="answers", level="redis", result="hit" if raw else "miss").inc()
+        if not raw:
+            return None
+        bucket = []
+        for value in raw.values():
+            entry = json.loads(value)
+            bucket.append({
+                "vector": np.frombuffer(base64.b64decode(entry["vector"]), dtype="float32"),
+                "answer": entry["answer"],
+                "ts": entry["ts"],
+            })
+        bucket.sort(key=lambda e: e["ts"])
+        bucket = bucket[-self.bucket_size:]
+        self.local.set(context_key, bucket)
+        return bucket
+
+    def _match(self, bucket: List[dict], vector: np.ndarray) -> Optional[str]:
+        now = time.time()
+        live = [e for e in bucket if e["ts"] + self.ttl > now]
+        if not live:
+            return None
+        scores = np.stack([e["vector"] for e in live]) @ vector
+        best = int(np.argmax(scores))
+        return live[best]["answer"] if scores[best] >= self.threshold else None
+
+    def _client(self):
+        return self._redis() if self._redis is not None else None
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype="float32").reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -0,0 +1,79 @@
+# app/services/batching.py
+"""
+Микро-батчинг CPU-задач вне event loop.
+
+Запросы, пришедшие в течение короткого окна (несколько миллисекунд),
+склеиваются в один вызов функции-обработчика, который выполняется в
+отдельном пуле потоков. Так все одновременные вопросы пользователей
+кодируются одним вызовом ``encode`` и ищутся одним ``index.search``,
+а aiogram-диспетчер не блокируется.
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Собирает элементы в батчи и обрабатывает их в пуле потоков.
+
+    Args:
+        fn: Синхронная функция ``fn(items) -> results`` (результаты в том же порядке).
+        workers: Число потоков пула, т.е. максимум одновременно выполняемых батчей.
+        window_ms: Сколько ждать попутных запросов после первого (0 — без ожидания).
+        max_batch: Размер батча, при котором он отправляется немедленно.
+        name: Префикс имён потоков (для логов и профилирования).
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], workers: int = 2,
+                 window_ms: float = 5.0, max_batch: int = 32, name: str = "batch"):
+        self._fn = fn
+        self._window = window_ms / 1000
+        self._max_batch = max_batch
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        """Ставит элемент в текущий батч и ждёт его результат."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self._max_batch or self._window <= 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._executor, self._fn, [item for item, _ in batch])
+        except Exception as e:
+            logger.error(f"[MicroBatcher] Ошибка обработки батча из {len(batch)} элементов: {e}", exc_info=True)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def close(self):
+        """Останавливает пул потоков (незавершённые батчи дорабатываются)."""
+        self._executor.shutdown(wait=False)
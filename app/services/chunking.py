@@ -0,0 +1,138 @@
+# app/services/chunking.py
+"""
+Нарезка текста документов на перекрывающиеся фрагменты (passages) для RAG.
+
+MiniLM обрезает вход примерно до 128 токенов, поэтому один вектор на весь
+документ «видит» только первый абзац. Здесь текст режется на небольшие
+фрагменты с учётом страниц и разделов (Глава/Статья/пункт), и каждый
+фрагмент индексируется отдельно.
+"""
+import re
+from typing import List, NamedTuple
+
+import numpy as np
+
+# ~128 токенов MiniLM для русского текста
+DEFAULT_CHUNK_SIZE = 600
+DEFAULT_CHUNK_OVERLAP = 120
+
+# Начало нового раздела: «Глава 2», «Статья 5», «Раздел III», «5.1. Текст»
+SECTION_RE = re.compile(
+    r"^[ \t]*(?:(?i:глава|статья|раздел|приложение)\s+[\dIVXLC]+"
+    r"|\d+(?:\.\d+)*\.?[ \t]+[А-ЯЁA-Z])",
+    re.MULTILINE,
+)
+
+# Предпочтительные места разреза, от лучшего к худшему
+_BREAKS = ("\n\n", "\n", ". ", "; ", ", ", " ")
+
+
+# Таблица метаданных фрагментов: строка i соответствует вектору i в FAISS
+PASSAGE_DTYPE = np.dtype([
+    ("doc_id", np.int32),
+    ("page", np.int32),
+    ("start", np.int32),
+    ("end", np.int32),
+])
+
+
+class Passage(NamedTuple):
+    """Фрагмент документа: номер страницы (с 1) и смещения в полном тексте."""
+    page: int
+    start: int
+    end: int
+
+
+def passage_table(passages: List[Passage]) -> np.ndarray:
+    """Таблица PASSAGE_DTYPE по фрагментам одного документа (doc_id заполняет вызывающий)."""
+    table = np.zeros(len(passages), dtype=PASSAGE_DTYPE)
+    table["page"] = [p.page for p in passages]
+    table["start"] = [p.start for p in passages]
+    table["end"] = [p.end for p in passages]
+    return table
+
+
+def join_pages(pages: List[str]) -> str:
+    """Склеивает страницы в полный текст документа (смещения Passage — в нём)."""
+    return "\n".join(pages)
+
+
+def split_passages(pages: List[str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   overlap: int = DEFAULT_CHUNK_OVERLAP) -> List[Passage]:
+    """
+    Режет постраничный текст на фрагменты.
+
+    Фрагмент не пересекает границу страницы и начала разделов, режется по
+    абзацам/предложениям, соседние фрагменты одного раздела перекрываются
+    на ``overlap`` символов.
+
+    Args:
+        pages: Текст документа по страницам (для DOCX — одна «страница»).
+        chunk_size: Максимальная длина фрагмента в символах.
+        overlap: Перекрытие соседних фрагментов в символах.
+
+    Returns:
+        List[Passage]: Фрагменты со смещениями в ``join_pages(pages)``.
+    """
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
+
+    passages: List[Passage] = []
+    offset = 0
+    for page_no, page_text in enumerate(pages, start=1):
+        for sec_start, sec_end in _section_spans(page_text):
+            for start, end in _windows(page_text, sec_start, sec_end, chunk_size, overlap):
+                passages.append(Passage(page_no, offset + start, offset + end))
+        offset += len(page_text) + 1  # +1 за "\n" из join_pages
+    return passages
+
+
+# Границы разделов внутри страницы; короткие (заголовки) склеиваются со следующим
+def _section_spans(text: str, min_len: int = DEFAULT_CHUNK_OVERLAP) -> List[tuple]:
+    starts = [m.start() for m in SECTION_RE.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    starts.append(len(text))
+    spans = []
+    begin = 0
+    for end in starts[1:]:
+        if end - begin >= min_len or end == len(text):
+            spans.append((begin, end))
+            begin = end
+    return spans
+
+
+# Окна фиксированной длины с перекрытием внутри [start, end)
+def _windows(text: str, start: int, end: int, size: int, overlap: int):
+    while True:
+        start = _skip_space(text, start, end)
+        if start >= end:
+            return
+        cut = end if end - start <= size else _find_cut(text, start, start + size)
+        stop = cut
+        while stop > start and text[stop - 1].isspace():
+            stop -= 1
+        if stop > start:
+            yield start, stop
+        if cut >= end:
+            return
+        # Следующее окно начинается за overlap символов до разреза, с начала слова
+        nxt = max(cut - overlap, start + 1)
+        space = text.find(" ", nxt, cut)
+        start = space + 1 if space != -1 else cut
+
+
+def _find_cut(text: str, start: int, limit: int) -> int:
+    # Не режем раньше середины окна, чтобы не плодить мелкие фрагменты
+    lower = start + (limit - start) // 2
+    for sep in _BREAKS:
+        pos = text.rfind(sep, lower, limit)
+        if pos != -1:
+            return pos + len(sep)
+    return limit
+
+
+def _skip_space(text: str, pos: int, end: int) -> int:
+    while pos < end and text[pos].isspace():
+        pos += 1
+    return pos
@@ -0,0 +1,173 @@
+# app/services/context_builder.py
+"""
+Сборка контекста для DeepSeek в пределах бюджета токенов.
+
+Фрагменты берутся в порядке релевантности (выдача поиска или
+переранжирования) и добавляются, пока помещаются в ``max_tokens``:
+
+* перекрывающиеся фрагменты одного документа (соседние чанки делят
+  ``DEFAULT_CHUNK_OVERLAP`` символов) склеиваются, общий текст не повторяется;
+* фрагмент, который не помещается целиком, обрезается по границе
+  предложения; слишком короткий остаток не добавляется.
+
+Токены считает локальный токенизатор (``settings.context_tokenizer`` —
+путь к tokenizer.json или имя модели в HF Hub, библиотека ``tokenizers``),
+а без него — консервативная оценка по символам.
+"""
+import logging
+import math
+import os
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Остаток бюджета, меньше которого обрезанный фрагмент не добавляется
+MIN_PASSAGE_TOKENS = 32
+BLOCK_SEPARATOR = "\n\n"
+
+# Оценка без токенизатора: символов на токен для кириллицы, латиницы и цифр
+_PIECE_RE = re.compile(r"[^\W\d_]+|\d+|\S")
+# Конец предложения (или абзаца) — допустимое место обрезки
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?;:])\s+|\n+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Верхняя оценка числа BPE-токенов: слова по 3–4 символа, знаки по одному."""
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        if piece[0].isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif piece[0].isalpha():
+            tokens += math.ceil(len(piece) / (4 if piece.isascii() else 3))
+        else:
+            tokens += 1
+    return tokens
+
+
+class TokenCounter:
+    """
+    Подсчёт токенов локальным токенизатором (загружается лениво) или оценкой.
+
+    Args:
+        tokenizer: Путь к tokenizer.json или имя модели HF Hub; пустая строка — оценка.
+    """
+
+    def __init__(self, tokenizer: str = ""):
+        self.name = tokenizer
+        self._tokenizer = None
+        self._failed = not tokenizer
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._tokenizer is None and not self._failed:
+            with self._lock:
+                if self._tokenizer is None and not self._failed:
+                    try:
+                        from tokenizers import Tokenizer
+                        if os.path.isfile(self.name):
+                            self._tokenizer = Tokenizer.from_file(self.name)
+                        else:
+                            self._tokenizer = Tokenizer.from_pretrained(self.name)
+                    except Exception as e:
+                        logger.warning(f"[TokenCounter] Токенизатор {self.name} недоступен ({e}), используется оценка")
+                        self._failed = True
+        return self._tokenizer
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        tokenizer = self._load()
+        if tokenizer is None:
+            return estimate_tokens(text)
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+token_counter = TokenCounter(settings.context_tokenizer)
+
+
+def trim_to_tokens(text: str, max_tokens: int, counter: Optional[TokenCounter] = None) -> str:
+    """Самое длинное начало текста из целых предложений, укладывающееся в max_tokens."""
+    counter = counter or token_counter
+    end, used = 0, 0
+    for boundary in [m.start() for m in _SENTENCE_END_RE.finditer(text)] + [len(text)]:
+        if boundary <= end:
+            continue
+        cost = counter.count(text[end:boundary])
+        if used + cost > max_tokens:
+            break
+        end, used = boundary, used + cost
+    return text[:end].rstrip()
+
+
+class Context(NamedTuple):
+    """Собранный контекст: текст для промпта, вошедшие фрагменты и его размер в токенах."""
+    text: str
+    docs: List[Dict]
+    tokens: int
+
+
+def _header(doc: Dict) -> str:
+    return f"Документ: {doc['name']}, стр. {doc.get('page', 1)}\n"
+
+
+def build_context(docs: List[Dict], max_tokens: int, counter: Optional[TokenCounter] = None) -> Context:
+    """
+    Упаковывает фрагменты в бюджет токенов.
+
+    Args:
+        docs: Фрагменты (doc_id, name, page, start, end, text) по убыванию релевантности.
+        max_tokens: Бюджет токенов на весь контекст (заголовки и разделители включены).
+
+    Returns:
+        Context: ``docs`` — вошедшие фрагменты с итоговыми start/end (после
+        склейки и обрезки) в порядке релевантности.
+    """
+    counter = counter or token_counter
+    blocks: List[Dict] = []
+    remaining = max_tokens
+    separator = counter.count(BLOCK_SEPARATOR)
+
+    for doc in docs:
+        if remaining < MIN_PASSAGE_TOKENS:
+            break
+        block = next((b for b in blocks if b["doc_id"] == doc["doc_id"]
+                      and doc["start"] <= b["end"] and b["start"] <= doc["end"]), None)
+        if block is not None:
+            # Дописываем к уже взятому фрагменту только новый текст
+            if doc["end"] > block["end"]:
+                tail = doc["text"][block["end"] - doc["start"]:]
+                cost = counter.count(tail)
+                if cost > remaining:
+                    tail = trim_to_tokens(tail, remaining, counter)
+                    cost = counter.count(tail)
+                block["text"] += tail
+                block["end"] += len(tail)
+                remaining -= cost
+            if doc["start"] < block["start"]:
+                head = doc["text"][:block["start"] - doc["start"]]
+                cost = counter.count(head)
+                if cost <= remaining:
+                    block["text"] = head + block["text"]
+                    block["start"] = doc["start"]
+                    remaining -= cost
+            continue
+
+        overhead = counter.count(_header(doc)) + (separator if blocks else 0)
+        text = doc["text"]
+        cost = counter.count(text)
+        if overhead + cost > remaining:
+            if remaining - overhead < MIN_PASSAGE_TOKENS:
+                continue
+            text = trim_to_tokens(text, remaining - overhead, counter)
+            if not text:
+                continue
+            cost = counter.count(text)
+        blocks.append({**doc, "text": text, "end": doc["start"] + len(text)})
+        remaining -= overhead + cost
+
+    text = BLOCK_SEPARATOR.join(_header(b) + b["text"] for b in blocks)
+    return Context(text, blocks, max_tokens - remaining)
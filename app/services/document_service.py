@@ -1,78 +1,496 @@
 # Сервис для работы с документами (RAG-пайплайн)
-import faiss
+#
+# Тяжёлые зависимости (SentenceTransformer/torch, FAISS, разбор PDF/DOCX) импортируются
+# лениво: импорт модуля и создание doc_service не загружают модель и корпус. Корпус
+# загружается в фоне из lifespan (doc_service.start()) или при первом поиске.
+import asyncio
+import hashlib
+import logging
 import os
-import docx
-from pypdf import PdfReader
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+import threading
+import numpy as np
+from typing import List, Dict, Optional, Tuple
+from app.config import settings
+from app.services.batching import MicroBatcher
+from app.services.chunking import (
+    split_passages, join_pages, passage_table, PASSAGE_DTYPE, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP,
+)
+from app.database.connection import db
+from app.monitoring import span
+from app.services.search_cache import SearchCache, Hits
+from app.services.index_artifact import read_artifact
+from app.services.index_cache import IndexCache, file_sha256, make_fingerprint
+from app.services.ingest import IngestStats, extract_docx_pages, extract_pdf_pages, ingest, list_documents
+from app.services.lexical_index import LexicalIndex, rrf_fuse
+from app.services.vector_index import build_index, configure_search, enable_reconstruct, resolve_index_type
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBEDDING_DIM = 384
+UPLOADS_DIR = "documents/uploaded"
+# Версия формата кэша: меняется вместе с моделью, параметрами нарезки
+# и метрикой (векторы хранятся нормированными, поиск по скалярному произведению)
+CACHE_FINGERPRINT = make_fingerprint(MODEL_NAME, EMBEDDING_DIM, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP, "cosine")
+
+# Папки корпуса; documents/uploaded пополняется через handle_pdf
+DOCS_DIRS = ["documents", "documents/statutes", UPLOADS_DIR]
+
+def _load_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME)
+
+def _new_index():
+    import faiss
+    return faiss.IndexFlatIP(EMBEDDING_DIM)
+
+def normalize(vectors) -> np.ndarray:
+    """
+    L2-нормировка строк: скалярное произведение нормированных векторов —
+    косинусное сходство. Нулевые векторы остаются нулевыми.
+    """
+    vectors = np.asarray(vectors, dtype='float32')
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1).astype('float32')
 
 # Основной класс для работы с документами (загрузка, индексация, поиск)
 class DocumentService:
-    def __init__(self, test_mode=False):
-        self.model = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-        self.index = faiss.IndexFlatL2(384)
+    """
+    Args:
+        test_mode: Не загружать корпус (пустой индекс сразу готов к работе).
+        cache_dir: Каталог дискового кэша (по умолчанию settings.index_cache_dir).
+        min_score: Порог косинусного сходства для выдачи search
+            (по умолчанию settings.search_min_score).
+    """
+
+    def __init__(self, test_mode=False, cache_dir: Optional[str] = None, min_score: Optional[float] = None):
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._index = None
+        self.ready = test_mode
+        self._load_task: Optional[asyncio.Task] = None
         self.documents: List[Dict] = []
-        if not test_mode:
+        self.passages = np.empty(0, dtype=PASSAGE_DTYPE)
+        # Векторы корпуса до сборки индекса (общий массив конвейера загрузки)
+        self._vectors: Optional[np.ndarray] = None
+        self.ingest_stats: Optional[IngestStats] = None
+        # Защищает индекс и метаданные от одновременного поиска и добавления
+        self._lock = threading.RLock()
+        self._removed_passages = 0
+        self.min_score = settings.search_min_score if min_score is None else min_score
+        self.lexical_min_score = settings.search_lexical_min_score
+        # Гибридный поиск: BM25 по тем же фрагментам, объединение с векторным через RRF
+        self.hybrid = settings.search_hybrid
+        self.lexical = LexicalIndex()
+        self._batcher = MicroBatcher(
+            self._search_batch,
+            workers=settings.search_workers,
+            window_ms=settings.search_batch_window_ms,
+            max_batch=settings.search_max_batch,
+            name="doc-search",
+        )
+        self.search_cache = SearchCache(
+            maxsize=settings.search_cache_size,
+            ttl=settings.search_cache_ttl,
+            redis=(lambda: db.redis) if settings.search_cache_redis else None,
+            redis_ttl=settings.search_cache_redis_ttl,
+            # Эмбеддинги в Redis совместимы только с тем же форматом векторов
+            prefix=f"search:{CACHE_FINGERPRINT}",
+        )
+        self.index_version = ""
+        self.layout_version = ""
+        cache_dir = settings.index_cache_dir if cache_dir is None else cache_dir
+        self.cache = IndexCache(cache_dir, CACHE_FINGERPRINT) if cache_dir else None
+
+    # FAISS-индекс создаётся при первом обращении
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = _new_index()
+        return self._index
+
+    @index.setter
+    def index(self, value):
+        self._index = value
+
+    # Модель эмбеддингов загружается при первом обращении (из любого потока)
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = _load_model()
+                    logger.info(f"Модель эмбеддингов загружена: {MODEL_NAME}")
+        return self._model
+
+    # Полная загрузка корпуса: с диска (кэш) или с разбором и кодированием
+    def load(self):
+        if not (settings.index_artifact_load and self._load_artifact()):
             self._load_documents()
             self._build_index()
+        self.ready = True
+
+    def start(self) -> asyncio.Task:
+        """Запускает загрузку корпуса в рабочем потоке (один раз)."""
+        if self._load_task is None or (self._load_task.done() and not self.ready):
+            self._load_task = asyncio.create_task(asyncio.to_thread(self.load), name="doc-service-load")
+        return self._load_task
+
+    async def wait_ready(self):
+        """Дожидается загрузки корпуса; запускает её, если она ещё не начата."""
+        if self.ready:
+            return
+        await asyncio.shield(self.start())
 
-    # Загрузка документов из папок и извлечение текста
+    # Загрузка документов из папок: разбор в пуле процессов, батчевое кодирование
+    # (app.services.ingest); векторы корпуса — один массив в порядке фрагментов
     def _load_documents(self):
-        docs_dirs = ["documents", "documents/statutes"]
-        for docs_dir in docs_dirs:
-            for filename in os.listdir(docs_dir):
-                path = os.path.join(docs_dir, filename)
-                if filename.endswith(".pdf"):
-                    text = self._extract_text_from_pdf(path)
-                elif filename.endswith(".docx"):
-                    text = self._extract_text_from_docx(path)
-                else:
-                    continue
-                
-                self.documents.append({
-                    "name": filename,
-                    "path": path,
-                    "text": text,
-                    "embedding": self.model.encode(text)
-                })
-
-    # Построение FAISS индекса для векторного поиска
-    def _build_index(self):
-        embeddings = [doc["embedding"] for doc in self.documents]
-        if embeddings:
-            import numpy as np
-            self.index.add(np.array(embeddings).astype('float32'))
-
-    def _extract_text_from_pdf(self, path: str) -> str:
-        try:
-            with open(path, "rb") as f:
-                reader = PdfReader(f)
-                return "\n".join(
-                    page.extract_text() or "" 
-                    for page in reader.pages
-                )
-        except Exception as e:
-            print(f"Error reading PDF {path}: {str(e)}")
-            return ""
-
-    def _extract_text_from_docx(self, path: str) -> str:
-        try:
-            doc = docx.Document(path)
-            return "\n".join(para.text for para in doc.paragraphs)
-        except Exception as e:
-            print(f"Error reading DOCX {path}: {str(e)}")
-            return ""
-
-    # Поиск документов по запросу с использованием векторного поиска
-    async def search(self, query: str, top_k: int = 5) -> List[Dict]:
-        query_emb = self.model.encode([query])
-        distances, idx = self.index.search(query_emb, top_k)
-        return [
+        files, vectors, stats = ingest(
+            list_documents(DOCS_DIRS), self._encode, EMBEDDING_DIM,
+            cache=self.cache,
+            workers=settings.ingest_workers,
+            batch_size=settings.ingest_batch_size,
+            extract=self._extract_pages,
+        )
+        tables = [self.passages]
+        for f in files:
+            doc_id = len(self.documents)
+            self.documents.append({
+                "id": doc_id,
+                "name": os.path.basename(f.path),
+                "path": f.path,
+                "sha256": f.sha256,
+                "text": join_pages(f.pages),
+            })
+            table = f.table.copy()
+            table["doc_id"] = doc_id
+            tables.append(table)
+        self.passages = np.concatenate(tables)
+        self._vectors = vectors
+        self.ingest_stats = stats
+        logger.info(
+            f"Загружено документов: {len(self.documents)} (из кэша {stats.cached}), "
+            f"фрагментов: {len(self.passages)}, {stats.seconds:.1f} с"
+        )
+
+    # Готовый артефакт переиндексации (app.services.tasks): документы, фрагменты и индексы
+    # без разбора и кодирования корпуса. False — артефакта нет или он от другой модели
+    def _load_artifact(self) -> bool:
+        artifact = read_artifact(settings.index_artifact_dir)
+        if artifact is None:
+            return False
+        if artifact.manifest.get("fingerprint") != CACHE_FINGERPRINT:
+            logger.warning(f"Артефакт индекса {artifact.version} собран другой моделью, пропускается")
+            return False
+        self.documents = [
             {
-                **self.documents[i],
-                "score": float(1 - distances[0][j])
+                "id": doc_id,
+                "name": doc["name"],
+                "path": doc["path"],
+                "sha256": doc["sha256"],
+                "text": join_pages(doc["pages"]),
             }
-            for j, i in enumerate(idx[0]) if i >= 0
+            for doc_id, doc in enumerate(artifact.documents)
         ]
+        self.passages = artifact.passages
+        configure_search(artifact.index, nprobe=settings.vector_index_nprobe, ef_search=settings.vector_index_ef_search)
+        enable_reconstruct(artifact.index)
+        self.index = artifact.index
+        if self.hybrid:
+            lexical = LexicalIndex.from_arrays(artifact.lexical) if artifact.lexical is not None else None
+            if lexical is None or len(lexical) != len(self.passages):
+                lexical = LexicalIndex()
+                lexical.add(self._passage_text(row) for row in range(len(self.passages)))
+            self.lexical = lexical
+        self._update_version()
+        logger.info(f"Загружен артефакт индекса {artifact.version}: документов {len(self.documents)}, "
+                    f"фрагментов {len(self.passages)}")
+        return True
+
+    # Нормированные эмбеддинги фрагментов (батч формирует вызывающий)
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return normalize(self.model.encode(texts, batch_size=len(texts)))
+
+    def _extract_pages(self, path: str) -> List[str]:
+        if path.endswith(".pdf"):
+            return self._extract_pages_from_pdf(path)
+        return self._extract_pages_from_docx(path)
+
+    # Текст, фрагменты и эмбеддинги одного файла (add_document): из кэша по хэшу или заново
+    def _process_file(self, path: str) -> Tuple[str, List[str], np.ndarray, np.ndarray]:
+        sha = file_sha256(path)
+        if self.cache is not None:
+            entry = self.cache.load_entry(sha)
+            if entry is not None:
+                return (sha, *entry)
+
+        pages = self._extract_pages(path)
+        text = join_pages(pages)
+        table = passage_table(split_passages(pages))
+        if len(table):
+            vectors = self._encode([text[start:end] for start, end in zip(table["start"], table["end"])])
+        else:
+            vectors = np.empty((0, EMBEDDING_DIM), dtype='float32')
+
+        if self.cache is not None:
+            self.cache.save_entry(sha, pages, table, vectors)
+        logger.info(f"Документ проиндексирован: {path} ({len(table)} фрагментов)")
+        return sha, pages, table, vectors
+
+    # Построение FAISS индекса для векторного поиска (по вектору на фрагмент)
+    def _build_index(self):
+        import faiss
+        shas = [doc["sha256"] for doc in self.documents]
+        kind = resolve_index_type(settings.vector_index_type, len(self.passages))
+        # Кэш сверяется с запрошенным типом, а не с собранным (на маленьком корпусе IVF/PQ
+        # собирается как flat)
+        cached = self.cache.load_index(shas, kind) if self.cache is not None else None
+        if cached is not None and cached.ntotal == len(self.passages):
+            configure_search(cached, nprobe=settings.vector_index_nprobe, ef_search=settings.vector_index_ef_search)
+            enable_reconstruct(cached)
+            self.index = cached
+        else:
+            # Полная сборка: индексы с кластеризацией обучаются на векторах корпуса
+            vectors = self._vectors if self._vectors is not None else np.empty((0, EMBEDDING_DIM), dtype='float32')
+            self.index = build_index(
+                kind, vectors, EMBEDDING_DIM,
+                metric=faiss.METRIC_INNER_PRODUCT,
+                nprobe=settings.vector_index_nprobe,
+                ef_search=settings.vector_index_ef_search,
+            )
+            if self.cache is not None:
+                self.cache.save_index(self.index, shas, kind)
+        if self.hybrid:
+            self._build_lexical(shas)
+        if self.cache is not None:
+            self.cache.prune(shas)
+        self._vectors = None
+        self._update_version()
+
+    # BM25-индекс фрагментов: из кэша или токенизацией текстов корпуса
+    def _build_lexical(self, shas: List[str]):
+        arrays = self.cache.load_lexical(shas) if self.cache is not None else None
+        lexical = LexicalIndex.from_arrays(arrays) if arrays is not None else None
+        if lexical is None or len(lexical) != len(self.passages):
+            lexical = LexicalIndex()
+            lexical.add(self._passage_text(row) for row in range(len(self.passages)))
+            if self.cache is not None:
+                self.cache.save_lexical(lexical.to_arrays(), shas)
+        self.lexical = lexical
+        logger.info(f"Лексический индекс: фрагментов {len(lexical)}, терминов {len(lexical.vocab)}")
+
+    # Версия индекса: хэш активных документов в порядке индексации.
+    # Одинакова у реплик с одинаковым корпусом, меняется при add/remove.
+    # Версия раскладки — хэш всех документов таблицы фрагментов, включая
+    # удалённые (их строки остаются до полной перезагрузки): номера строк в
+    # кэше поиска совпадают только у реплик с одинаковой раскладкой
+    def _update_version(self):
+        active = "|".join(doc["sha256"] for doc in self.documents if not doc.get("removed"))
+        self.index_version = hashlib.sha1(active.encode()).hexdigest()[:12]
+        layout = "|".join(doc["sha256"] + ("-" if doc.get("removed") else "") for doc in self.documents)
+        self.layout_version = hashlib.sha1(layout.encode()).hexdigest()[:12]
+
+    def _extract_pages_from_pdf(self, path: str) -> List[str]:
+        return extract_pdf_pages(path)
+
+    def _extract_pages_from_docx(self, path: str) -> List[str]:
+        return extract_docx_pages(path)
+
+    def _passage_text(self, row: int) -> str:
+        meta = self.passages[row]
+        return self.documents[meta["doc_id"]]["text"][meta["start"]:meta["end"]]
+
+    # Фрагмент по строке таблицы метаданных
+    def _passage(self, row: int) -> Dict:
+        meta = self.passages[row]
+        doc = self.documents[meta["doc_id"]]
+        return {
+            "doc_id": int(meta["doc_id"]),
+            "name": doc["name"],
+            "path": doc["path"],
+            "page": int(meta["page"]),
+            "start": int(meta["start"]),
+            "end": int(meta["end"]),
+            "text": doc["text"][meta["start"]:meta["end"]],
+        }
+
+    # Инкрементальное добавление документа без перестройки индекса
+    async def add_document(self, path: str) -> int:
+        """
+        Извлекает текст, режет и кодирует документ в рабочем потоке,
+        затем дописывает его фрагменты в живой индекс.
+
+        Args:
+            path (str): Путь к PDF/DOCX файлу.
+
+        Returns:
+            int: Идентификатор документа (doc_id).
+        """
+        await self.wait_ready()
+        sha, pages, table, vectors = await asyncio.to_thread(self._process_file, path)
+        with self._lock:
+            for doc in self.documents:
+                if doc.get("removed"):
+                    continue
+                if doc["sha256"] == sha:
+                    logger.info(f"Документ {path} уже проиндексирован (doc_id={doc['id']})")
+                    return doc["id"]
+                if doc["path"] == path:
+                    # Файл перезаписан новой версией
+                    self._remove_locked(doc["id"])
+
+            doc_id = len(self.documents)
+            table = table.copy()
+            table["doc_id"] = doc_id
+            text = join_pages(pages)
+            if len(table):
+                self.index.add(np.asarray(vectors, dtype='float32'))
+                if self.hybrid:
+                    self.lexical.add(text[start:end] for start, end in zip(table["start"], table["end"]))
+            self.passages = np.concatenate([self.passages, table])
+            self.documents.append({
+                "id": doc_id,
+                "name": os.path.basename(path),
+                "path": path,
+                "sha256": sha,
+                "text": text,
+            })
+            self._update_version()
+        logger.info(f"Документ {path} добавлен в индекс (doc_id={doc_id}, фрагментов {len(table)})")
+        return doc_id
+
+    # Исключение документа из поиска (фрагменты помечаются удалёнными)
+    async def remove_document(self, doc_id: int, delete_file: bool = False) -> bool:
+        """
+        Исключает документ из выдачи. Векторы физически удаляются при
+        следующей полной загрузке корпуса.
+
+        Returns:
+            bool: True, если документ был в индексе.
+        """
+        await self.wait_ready()
+        with self._lock:
+            if not 0 <= doc_id < len(self.documents) or self.documents[doc_id].get("removed"):
+                return False
+            path = self.documents[doc_id]["path"]
+            self._remove_locked(doc_id)
+            self._update_version()
+        if delete_file:
+            await asyncio.to_thread(os.remove, path)
+        logger.info(f"Документ {path} исключён из индекса (doc_id={doc_id})")
+        return True
+
+    def _remove_locked(self, doc_id: int):
+        self.documents[doc_id]["removed"] = True
+        self._removed_passages += int(np.count_nonzero(self.passages["doc_id"] == doc_id))
+
+    # Поиск фрагментов документов по запросу с использованием векторного поиска
+    async def search(self, query: str, top_k: int = 5, min_score: Optional[float] = None) -> List[Dict]:
+        """
+        Возвращает до ``top_k`` фрагментов с косинусным сходством (``score``)
+        не ниже ``min_score`` (по умолчанию self.min_score); нерелевантных
+        фрагментов может не оказаться вовсе.
+        """
+        await self.wait_ready()
+        min_score = self.min_score if min_score is None else min_score
+        version = self.layout_version
+        cached = await self.search_cache.get(query, version, top_k)
+        if cached.hits is not None:
+            return self._materialize(cached.hits, min_score)
+
+        # Кодирование и поиск выполняются в пуле потоков, одновременные
+        # запросы склеиваются в один батч; эмбеддинг из кэша не пересчитывается
+        embedding, hits = await self._batcher.submit((query, top_k, cached.embedding))
+        await self.search_cache.set(query, version, top_k, embedding, hits)
+        return self._materialize(hits, min_score)
+
+    # Эмбеддинг запроса (из кэша поиска, если запрос уже искали)
+    async def embed_query(self, query: str) -> np.ndarray:
+        cached = await self.search_cache.get(query, self.layout_version, 0)
+        if cached.embedding is not None:
+            return cached.embedding
+        embedding = await asyncio.to_thread(self.model.encode, [query])
+        return normalize(embedding)[0]
+
+    # Фрагменты с текстом по результатам поиска (удалённые документы и
+    # фрагменты ниже порога отбрасываются; в кэше хранится выдача без порога).
+    # Порог косинуса не применяется к сильным совпадениям BM25 (см. _fuse):
+    # точные совпадения (номер статьи, ИНН, аббревиатура) у модели
+    # эмбеддингов получают низкое сходство по определению
+    def _materialize(self, hits: Hits, min_score: float = -1.0) -> List[Dict]:
+        return [
+            {**self._passage(row), "score": score}
+            for row, score, lexical in hits
+            if (lexical or score >= min_score) and not self.documents[self.passages[row]["doc_id"]].get("removed")
+        ]
+
+    def _removed(self, row: int) -> bool:
+        return self.documents[self.passages[row]["doc_id"]].get("removed", False)
+
+    # Батчевый поиск: один encode и один index.search на все запросы;
+    # в гибридном режиме к векторной выдаче добавляется BM25 (слияние RRF)
+    def _search_batch(self, requests: List[Tuple[str, int, Optional[np.ndarray]]]) -> List[Tuple[np.ndarray, Hits]]:
+        query_emb = np.empty((len(requests), EMBEDDING_DIM), dtype='float32')
+        to_encode = [row for row, (_, _, emb) in enumerate(requests) if emb is None]
+        for row, (_, _, emb) in enumerate(requests):
+            if emb is not None:
+                query_emb[row] = emb
+        if to_encode:
+            queries = [requests[row][0] for row in to_encode]
+            with span("embed"):
+                query_emb[to_encode] = normalize(self.model.encode(queries, batch_size=len(queries)))
+
+        with self._lock:
+            # Запрашиваем с запасом на удалённые фрагменты
+            k = min(max(top_k for _, top_k, _ in requests) + self._removed_passages, self.index.ntotal)
+            if k <= 0:
+                return [(query_emb[row], []) for row in range(len(requests))]
+            with span("faiss_search"):
+                # Индекс по скалярному произведению: для нормированных векторов это косинус
+                scores, idx = self.index.search(query_emb, k)
+            batch = []
+            for row, (query, top_k, _) in enumerate(requests):
+                hits = [
+                    (int(i), float(scores[row][j]), False)
+                    for j, i in enumerate(idx[row])
+                    if i >= 0 and not self._removed(i)
+                ]
+                if self.hybrid:
+                    hits = self._fuse(query, query_emb[row], hits, k)
+                batch.append((query_emb[row], hits[:top_k]))
+        return batch
+
+    # Слияние векторной и BM25-выдачи; score остаётся косинусным сходством
+    # (для фрагментов, найденных только BM25, он считается по вектору из индекса).
+    # Сильное совпадение BM25 — оценка не ниже lexical_min_score от максимально
+    # возможной для запроса: совпадение одного частого слова порог косинуса не обходит
+    def _fuse(self, query: str, query_emb: np.ndarray, hits: Hits, k: int) -> Hits:
+        with span("bm25_search"):
+            lexical = [(row, score) for row, score in self.lexical.search(query, k) if not self._removed(row)]
+        if not lexical:
+            return hits
+        scores = {row: score for row, score, _ in hits}
+        floor = self.lexical_min_score * self.lexical.max_score(query)
+        strong = {row for row, score in lexical if score >= floor}
+        fused = rrf_fuse([[row for row, _, _ in hits], [row for row, _ in lexical]])
+        return [
+            (row, scores[row] if row in scores else float(self.index.reconstruct(row) @ query_emb), row in strong)
+            for row in fused
+        ]
+
+def _local_service() -> DocumentService:
+    return DocumentService(test_mode=os.getenv("ENVIRONMENT") == "test")
 
-doc_service = DocumentService(test_mode=os.getenv("ENVIRONMENT") == "test")
+# В режиме worker поиск выполняет отдельный процесс (app.services.retrieval_worker),
+# а бот держит только клиент с тем же интерфейсом
+if settings.retrieval_mode == "worker":
+    from app.services.retrieval_client import RetrievalClient
+    doc_service = RetrievalClient(
+        settings.retrieval_socket,
+        pool_size=settings.retrieval_pool_size,
+        timeout=settings.retrieval_timeout,
+        fallback=_local_service if settings.retrieval_fallback_local else None,
+        fallback_retry=settings.retrieval_fallback_retry,
+    )
+else:
+    doc_service = _local_service()
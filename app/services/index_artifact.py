@@ -0,0 +1,152 @@
+# app/services/index_artifact.py
+"""
+Версионированный артефакт индекса документов.
+
+Собирается задачами переиндексации (app.services.tasks) и загружается
+ботами вместо разбора корпуса (``INDEX_ARTIFACT_LOAD=true``): артефакт
+самодостаточен — исходные PDF/DOCX на хосте бота не нужны.
+
+Структура каталога::
+
+    <root>/<version>/manifest.json   версия, отпечаток модели, тип индекса, счётчики
+    <root>/<version>/documents.json  документы в порядке doc_id: имя, путь, sha256, страницы
+    <root>/<version>/passages.npy    таблица фрагментов (PASSAGE_DTYPE)
+    <root>/<version>/index.faiss     FAISS-индекс (строка i — фрагмент i)
+    <root>/<version>/lexical.npz     BM25-индекс (LexicalIndex.to_arrays)
+    <root>/LATEST                    имя последней готовой версии
+
+Версия выводится из содержимого (отпечаток + SHA-256 файлов по порядку +
+тип индекса), поэтому повторная сборка того же корпуса даёт ту же версию.
+Каталог версии пишется во временный и переименовывается целиком, LATEST
+переключается после этого — читатель никогда не видит частичный артефакт.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import faiss
+
+logger = logging.getLogger(__name__)
+
+LATEST = "LATEST"
+
+
+def artifact_version(fingerprint: str, shas: List[str], index_type: str) -> str:
+    """Версия артефакта по содержимому корпуса."""
+    digest = hashlib.sha256("|".join([fingerprint, index_type, *shas]).encode())
+    return digest.hexdigest()[:16]
+
+
+class Artifact(NamedTuple):
+    version: str
+    manifest: Dict
+    documents: List[Dict]
+    passages: np.ndarray
+    index: "faiss.Index"
+    lexical: Optional[Dict[str, np.ndarray]]
+
+
+def artifact_exists(root: str, version: str) -> bool:
+    return os.path.isfile(os.path.join(root, version, "manifest.json"))
+
+
+def latest_version(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, LATEST), encoding="utf-8") as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return version if version and artifact_exists(root, version) else None
+
+
+def write_artifact(root: str, version: str, documents: List[Dict], passages: np.ndarray,
+                   index: "faiss.Index", lexical: Optional[Dict[str, np.ndarray]], manifest: Dict,
+                   keep: int = 3):
+    """
+    Атомарно публикует версию и делает её последней.
+
+    Args:
+        documents: Словари с ключами name, path, sha256, pages.
+        manifest: Дополнительные поля manifest.json (fingerprint, index_type, ...).
+        keep: Сколько последних версий оставить на диске.
+    """
+    import faiss
+    os.makedirs(root, exist_ok=True)
+    final = os.path.join(root, version)
+    if not artifact_exists(root, version):
+        tmp = os.path.join(root, f".{version}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        with open(os.path.join(tmp, "documents.json"), "w", encoding="utf-8") as f:
+            json.dump(documents, f, ensure_ascii=False)
+        np.save(os.path.join(tmp, "passages.npy"), passages)
+        faiss.write_index(index, os.path.join(tmp, "index.faiss"))
+        if lexical is not None:
+            np.savez(os.path.join(tmp, "lexical.npz"), **lexical)
+        manifest = {
+            **manifest,
+            "version": version,
+            "documents": len(documents),
+            "passages": len(passages),
+            "created_at": time.time(),
+        }
+        with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)
+
+    pointer = os.path.join(root, LATEST + ".tmp")
+    with open(pointer, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(root, LATEST))
+    logger.info(f"[IndexArtifact] Опубликована версия {version} ({len(passages)} фрагментов)")
+    prune_versions(root, keep=keep)
+
+
+def prune_versions(root: str, keep: int = 3):
+    """Удаляет старые версии, кроме ``keep`` последних и текущей LATEST."""
+    current = latest_version(root)
+    versions = sorted(
+        (name for name in os.listdir(root) if artifact_exists(root, name)),
+        key=lambda name: os.path.getmtime(os.path.join(root, name, "manifest.json")),
+        reverse=True,
+    )
+    for name in versions[keep:]:
+        if name != current:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def read_artifact(root: str, version: Optional[str] = None) -> Optional[Artifact]:
+    """Читает версию (по умолчанию LATEST); индекс отображается в память, кроме IVF."""
+    import faiss
+    version = version or latest_version(root)
+    if version is None:
+        return None
+    path = os.path.join(root, version)
+    try:
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        with open(os.path.join(path, "documents.json"), encoding="utf-8") as f:
+            documents = json.load(f)
+        passages = np.load(os.path.join(path, "passages.npy"))
+        # В отображённый в память IVF нельзя дописывать документы (см. IndexCache.load_index)
+        flags = 0 if manifest.get("index_type", "").startswith("ivf") else faiss.IO_FLAG_MMAP
+        index = faiss.read_index(os.path.join(path, "index.faiss"), flags)
+        lexical = None
+        if os.path.exists(os.path.join(path, "lexical.npz")):
+            with np.load(os.path.join(path, "lexical.npz")) as data:
+                lexical = {name: data[name] for name in data.files}
+    except Exception as e:
+        logger.warning(f"[IndexArtifact] Не удалось прочитать версию {version}: {e}")
+        return None
+    if index.ntotal != len(passages):
+        logger.warning(f"[IndexArtifact] Версия {version} несогласована, пропускается")
+        return None
+    return Artifact(version, manifest, documents, passages, index, lexical)
@@ -0,0 +1,195 @@
+# app/services/index_cache.py
+"""
+Дисковый кэш извлечённого текста, эмбеддингов и FAISS индекса.
+
+Записи кэша адресуются SHA-256 содержимого файла, поэтому при рестарте
+заново разбираются и кодируются только изменённые документы. Все записи
+лежат в подкаталоге «отпечатка» (модель + параметры нарезки): смена
+модели или нарезки автоматически делает старый кэш невидимым.
+
+Структура каталога::
+
+    <cache_dir>/<fingerprint>/entries/<sha>.json          страницы текста
+    <cache_dir>/<fingerprint>/entries/<sha>.passages.npy  метаданные фрагментов
+    <cache_dir>/<fingerprint>/entries/<sha>.vectors.npy   эмбеддинги (float32)
+    <cache_dir>/<fingerprint>/index.faiss                 собранный индекс
+    <cache_dir>/<fingerprint>/index.json                  порядок записей в индексе
+    <cache_dir>/<fingerprint>/lexical.npz                 BM25-индекс фрагментов (и порядок записей)
+
+Предварительная сборка кэша (например, при сборке образа)::
+
+    python -m app.services.index_cache
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.vector_index import index_type_of
+
+if TYPE_CHECKING:
+    import faiss
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 содержимого файла (ключ записи кэша)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_fingerprint(*parts) -> str:
+    """Короткий отпечаток параметров, от которых зависят эмбеддинги."""
+    return hashlib.sha256("|".join(map(str, parts)).encode()).hexdigest()[:16]
+
+
+class IndexCache:
+    """Кэш записей документов и собранного индекса на диске."""
+
+    def __init__(self, cache_dir: str, fingerprint: str):
+        self.root = os.path.join(cache_dir, fingerprint)
+        self.entries_dir = os.path.join(self.root, "entries")
+        os.makedirs(self.entries_dir, exist_ok=True)
+
+    def _entry_path(self, sha: str, suffix: str) -> str:
+        return os.path.join(self.entries_dir, f"{sha}{suffix}")
+
+    def load_entry(self, sha: str) -> Optional[Tuple[List[str], np.ndarray, np.ndarray]]:
+        """
+        Загружает запись документа.
+
+        Returns:
+            Optional[Tuple]: (страницы, таблица фрагментов, эмбеддинги в mmap)
+            или None, если записи нет или она повреждена.
+        """
+        try:
+            with open(self._entry_path(sha, ".json"), encoding="utf-8") as f:
+                pages = json.load(f)["pages"]
+            passages = np.load(self._entry_path(sha, ".passages.npy"))
+            vectors = np.load(self._entry_path(sha, ".vectors.npy"), mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"[IndexCache] Повреждённая запись {sha}: {e}")
+            return None
+        if len(passages) != len(vectors):
+            logger.warning(f"[IndexCache] Несогласованная запись {sha}, будет пересобрана")
+            return None
+        return pages, passages, vectors
+
+    def save_entry(self, sha: str, pages: List[str], passages: np.ndarray, vectors: np.ndarray):
+        """Атомарно сохраняет запись документа (json пишется последним)."""
+        self._atomic_save_npy(self._entry_path(sha, ".passages.npy"), passages)
+        self._atomic_save_npy(self._entry_path(sha, ".vectors.npy"), np.asarray(vectors, dtype="float32"))
+        self._atomic_write(self._entry_path(sha, ".json"),
+                           json.dumps({"pages": pages}, ensure_ascii=False).encode("utf-8"))
+
+    def load_index(self, shas: List[str], kind: str) -> Optional["faiss.Index"]:
+        """
+        Читает индекс, если он собран ровно из этих записей в этом порядке
+        для запрошенного типа ``kind`` (собранный тип может отличаться: на
+        маленьком корпусе IVF/PQ заменяется точным индексом).
+
+        Файл отображается в память, кроме IVF: его инвертированные списки
+        при отображении только для чтения, и такой индекс нельзя дополнять.
+        """
+        try:
+            with open(os.path.join(self.root, "index.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["shas"] != shas or meta.get("kind") != kind:
+                return None
+            import faiss
+            flags = 0 if meta.get("built", "").startswith("ivf") else faiss.IO_FLAG_MMAP
+            return faiss.read_index(os.path.join(self.root, "index.faiss"), flags)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"[IndexCache] Не удалось прочитать индекс: {e}")
+            return None
+
+    def save_index(self, index: "faiss.Index", shas: List[str], kind: str):
+        """Сохраняет индекс через faiss.write_index вместе с порядком записей и типом."""
+        import faiss
+        tmp = os.path.join(self.root, "index.faiss.tmp")
+        faiss.write_index(index, tmp)
+        os.replace(tmp, os.path.join(self.root, "index.faiss"))
+        meta = {"shas": shas, "kind": kind, "built": index_type_of(index)}
+        self._atomic_write(os.path.join(self.root, "index.json"), json.dumps(meta).encode("utf-8"))
+
+    def load_lexical(self, shas: List[str]) -> Optional[Dict[str, np.ndarray]]:
+        """Массивы лексического индекса, если он собран ровно из этих записей в этом порядке."""
+        try:
+            with np.load(os.path.join(self.root, "lexical.npz")) as data:
+                if data["shas"].tolist() != shas:
+                    return None
+                return {name: data[name] for name in data.files if name != "shas"}
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"[IndexCache] Не удалось прочитать лексический индекс: {e}")
+            return None
+
+    def save_lexical(self, arrays: Dict[str, np.ndarray], shas: List[str]):
+        """Сохраняет массивы LexicalIndex.to_arrays() вместе с порядком записей."""
+        path = os.path.join(self.root, "lexical.npz")
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, shas=np.array(shas, dtype=str), **arrays)
+        os.replace(tmp, path)
+
+    def prune(self, keep: Iterable[str]):
+        """Удаляет записи файлов, которых больше нет в корпусе."""
+        keep = set(keep)
+        for filename in os.listdir(self.entries_dir):
+            sha = filename.split(".", 1)[0]
+            if sha not in keep:
+                os.remove(os.path.join(self.entries_dir, filename))
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.entries_dir, exist_ok=True)
+
+    def _atomic_save_npy(self, path: str, array: np.ndarray):
+        tmp = path + ".tmp.npy"
+        np.save(tmp, array)
+        os.replace(tmp, path)
+
+    def _atomic_write(self, path: str, data: bytes):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+def main():
+    """CLI: собирает (или дополняет) кэш индекса для текущего корпуса."""
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Предварительная сборка кэша индекса документов")
+    parser.add_argument("--rebuild", action="store_true", help="удалить кэш и собрать заново")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from app.services.document_service import DocumentService
+
+    started = time.perf_counter()
+    service = DocumentService(test_mode=True)
+    if args.rebuild and service.cache is not None:
+        service.cache.clear()
+    service.load()
+    logger.info(
+        f"Кэш индекса готов: документов {len(service.documents)}, "
+        f"фрагментов {service.index.ntotal}, {time.perf_counter() - started:.1f} с"
+    )
+
+
+if __name__ == "__main__":
+    main()
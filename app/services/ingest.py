@@ -0,0 +1,278 @@
+# app/services/ingest.py
+"""
+Конвейер загрузки корпуса: извлечение текста, нарезка и кодирование.
+
+1. Для каждого файла считается SHA-256; записи из дискового кэша
+   (IndexCache) берутся как есть.
+2. Новые файлы разбираются (pypdf / python-docx) и режутся на фрагменты в
+   пуле процессов — это CPU-работа под GIL, в одном процессе она занимает
+   одно ядро. Результаты забираются по мере готовности.
+3. Фрагменты готовых файлов копятся в буфере; как только в нём набирается
+   ``ENCODE_WINDOW_BATCHES`` батчей, он сортируется по длине (меньше
+   паддинга в трансформере) и кодируется батчами по ``batch_size``, пока
+   пул разбирает следующие файлы. Короткий остаток ждёт следующего окна.
+4. Выделяется один массив float32 (фрагменты × размерность) в порядке
+   документов; в него копируются кэшированные и новые векторы.
+
+Запуск (предварительная сборка кэша индекса с отчётом о скорости)::
+
+    python -m app.services.ingest [--workers 4] [--batch-size 64] [--rebuild] [dirs ...]
+"""
+import logging
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.chunking import join_pages, passage_table, split_passages
+from app.services.index_cache import file_sha256
+
+if TYPE_CHECKING:
+    from app.services.index_cache import IndexCache
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_SUFFIXES = (".pdf", ".docx")
+# Окно сортировки по длине, в батчах encode: кодирование начинается, как только
+# разобрано столько фрагментов, а не после разбора всего корпуса
+ENCODE_WINDOW_BATCHES = 8
+
+
+def extract_pdf_pages(path: str) -> List[str]:
+    from pypdf import PdfReader
+    try:
+        with open(path, "rb") as f:
+            reader = PdfReader(f)
+            return [page.extract_text() or "" for page in reader.pages]
+    except Exception as e:
+        logger.error(f"Error reading PDF {path}: {e}")
+        return []
+
+
+def extract_docx_pages(path: str) -> List[str]:
+    # В DOCX нет страниц: весь документ считается одной страницей
+    import docx
+    try:
+        doc = docx.Document(path)
+        return ["\n".join(para.text for para in doc.paragraphs)]
+    except Exception as e:
+        logger.error(f"Error reading DOCX {path}: {e}")
+        return []
+
+
+def extract_pages(path: str) -> List[str]:
+    return extract_pdf_pages(path) if path.endswith(".pdf") else extract_docx_pages(path)
+
+
+# Задача процесса пула: текст по страницам и таблица фрагментов файла
+def extract_file(path: str) -> Tuple[List[str], np.ndarray]:
+    pages = extract_pages(path)
+    return pages, passage_table(split_passages(pages))
+
+
+def list_documents(dirs: Sequence[str]) -> List[str]:
+    """PDF/DOCX файлы каталогов (без рекурсии) в порядке индексации."""
+    paths = []
+    for docs_dir in dirs:
+        if not os.path.isdir(docs_dir):
+            continue
+        for filename in sorted(os.listdir(docs_dir)):
+            if filename.endswith(DOCUMENT_SUFFIXES):
+                paths.append(os.path.join(docs_dir, filename))
+    return paths
+
+
+def resolve_workers(workers: int) -> int:
+    """0 — по числу доступных процессу ядер."""
+    if workers > 0:
+        return workers
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class IngestedFile(NamedTuple):
+    """Документ корпуса; ``vectors`` — срез общего массива векторов."""
+    path: str
+    sha256: str
+    pages: List[str]
+    table: np.ndarray
+    vectors: np.ndarray
+
+
+class IngestStats(NamedTuple):
+    # extract_seconds — до разбора последнего файла; кодирование идёт параллельно
+    # с разбором, поэтому extract_seconds + encode_seconds может быть больше seconds
+    files: int
+    cached: int
+    passages: int
+    extract_seconds: float
+    encode_seconds: float
+    seconds: float
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS процесса и его дочерних процессов (пул разбора), МБ."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (own + children) / 1024  # ru_maxrss в Linux — в килобайтах
+
+
+def _extract_new(paths: Sequence[str], todo: List[int], workers: int,
+                 extract: Optional[Callable[[str], List[str]]]) -> Iterator[Tuple[int, List[str], np.ndarray]]:
+    """Разобранные новые файлы (номер, страницы, таблица фрагментов) по мере готовности."""
+    workers = min(resolve_workers(workers), len(todo))
+    if workers > 1:
+        # spawn: рабочие процессы не наследуют потоки бота и загруженную модель
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {pool.submit(extract_file, paths[i]): i for i in todo}
+            for done, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                try:
+                    pages, table = future.result()
+                except Exception as e:
+                    logger.error(f"[Ingest] Не удалось разобрать {paths[i]}: {e}")
+                    pages, table = [], passage_table([])
+                if done % 100 == 0:
+                    logger.info(f"[Ingest] Разобрано {done}/{len(todo)} файлов")
+                yield i, pages, table
+    else:
+        extract = extract or extract_pages
+        for i in todo:
+            pages = extract(paths[i])
+            yield i, pages, passage_table(split_passages(pages))
+
+
+def _encode_pending(pending: List[Tuple[int, int, str]], encode: Callable[[List[str]], np.ndarray],
+                    batch_size: int, out: Dict[int, np.ndarray], final: bool) -> List[Tuple[int, int, str]]:
+    """
+    Кодирует буфер (файл, строка в файле, текст) по убыванию длины полными
+    батчами (при ``final`` — целиком); возвращает некодированный остаток.
+    """
+    pending.sort(key=lambda item: len(item[2]), reverse=True)
+    stop = len(pending) if final else len(pending) - len(pending) % batch_size
+    for begin in range(0, stop, batch_size):
+        batch = pending[begin:begin + batch_size]
+        for (i, row, _), vector in zip(batch, encode([text for _, _, text in batch])):
+            out[i][row] = vector
+    return pending[stop:]
+
+
+def ingest(paths: Sequence[str], encode: Callable[[List[str]], np.ndarray], dim: int,
+           cache: Optional["IndexCache"] = None, workers: int = 0, batch_size: int = 64,
+           extract: Optional[Callable[[str], List[str]]] = None
+           ) -> Tuple[List[IngestedFile], np.ndarray, IngestStats]:
+    """
+    Загружает файлы корпуса.
+
+    Args:
+        paths: Файлы в порядке индексации (он же порядок строк векторов).
+        encode: Кодирование списка текстов в матрицу (len × dim), уже нормированную.
+        cache: Дисковый кэш записей; новые записи сохраняются в него.
+        workers: Процессов разбора (0 — по числу ядер); при одном процессе
+            или одном новом файле разбор идёт в текущем процессе.
+        batch_size: Размер батча encode.
+        extract: Разбор файла в текущем процессе (по умолчанию extract_pages).
+
+    Returns:
+        Tuple: документы, общий массив векторов (фрагменты × dim), статистика.
+    """
+    started = time.perf_counter()
+    shas = [file_sha256(path) for path in paths]
+    entries = [cache.load_entry(sha) if cache is not None else None for sha in shas]
+    todo = [i for i, entry in enumerate(entries) if entry is None]
+
+    # 1. Разбор новых файлов и кодирование их фрагментов окнами по мере разбора
+    extracted = {}
+    new_vectors: Dict[int, np.ndarray] = {}
+    pending: List[Tuple[int, int, str]] = []
+    window = batch_size * ENCODE_WINDOW_BATCHES
+    encoded, encode_seconds = 0, 0.0
+    for i, pages, table in _extract_new(paths, todo, workers, extract):
+        extracted[i] = (pages, table)
+        new_vectors[i] = np.empty((len(table), dim), dtype="float32")
+        text = join_pages(pages)
+        pending.extend((i, row, text[start:end]) for row, (start, end) in enumerate(zip(table["start"], table["end"])))
+        if len(pending) >= window:
+            encode_started = time.perf_counter()
+            before = len(pending)
+            pending = _encode_pending(pending, encode, batch_size, new_vectors, final=False)
+            encoded += before - len(pending)
+            encode_seconds += time.perf_counter() - encode_started
+            logger.info(f"[Ingest] Закодировано {encoded} фрагментов")
+    extract_seconds = time.perf_counter() - started
+    encode_started = time.perf_counter()
+    _encode_pending(pending, encode, batch_size, new_vectors, final=True)
+    encode_seconds += time.perf_counter() - encode_started
+
+    # 2. Общий массив векторов в порядке документов
+    tables = [entries[i][1] if entries[i] is not None else extracted[i][1] for i in range(len(paths))]
+    offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+    np.cumsum([len(t) for t in tables], out=offsets[1:])
+    vectors = np.empty((int(offsets[-1]), dim), dtype="float32")
+    for i, entry in enumerate(entries):
+        vectors[offsets[i]:offsets[i + 1]] = entry[2] if entry is not None else new_vectors.pop(i)
+
+    files = []
+    for i, path in enumerate(paths):
+        pages = entries[i][0] if entries[i] is not None else extracted[i][0]
+        file_vectors = vectors[offsets[i]:offsets[i + 1]]
+        if entries[i] is None:
+            if cache is not None:
+                cache.save_entry(shas[i], pages, tables[i], file_vectors)
+            logger.info(f"Документ проиндексирован: {path} ({len(tables[i])} фрагментов)")
+        files.append(IngestedFile(path, shas[i], pages, tables[i], file_vectors))
+
+    stats = IngestStats(
+        files=len(paths),
+        cached=len(paths) - len(todo),
+        passages=len(vectors),
+        extract_seconds=extract_seconds,
+        encode_seconds=encode_seconds,
+        seconds=time.perf_counter() - started,
+    )
+    return files, vectors, stats
+
+
+def main():
+    """CLI: загрузка корпуса в кэш индекса с отчётом о скорости и памяти."""
+    import argparse
+
+    from app.config import settings
+    from app.services import document_service
+    from app.services.document_service import DocumentService
+
+    parser = argparse.ArgumentParser(description="Загрузка корпуса документов в кэш индекса")
+    parser.add_argument("dirs", nargs="*", help="каталоги с PDF/DOCX (по умолчанию DOCS_DIRS)")
+    parser.add_argument("--workers", type=int, default=settings.ingest_workers, help="процессов разбора (0 — по числу ядер)")
+    parser.add_argument("--batch-size", type=int, default=settings.ingest_batch_size)
+    parser.add_argument("--rebuild", action="store_true", help="удалить кэш и собрать заново")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    settings.ingest_workers = args.workers
+    settings.ingest_batch_size = args.batch_size
+    if args.dirs:
+        document_service.DOCS_DIRS = args.dirs
+
+    service = DocumentService(test_mode=True)
+    if args.rebuild and service.cache is not None:
+        service.cache.clear()
+    service.load()
+    stats = service.ingest_stats
+    print(
+        f"files: {stats.files} (cached {stats.cached}), passages: {stats.passages}, "
+        f"extract: {stats.extract_seconds:.1f} s, encode: {stats.encode_seconds:.1f} s, "
+        f"total: {stats.seconds:.1f} s, {stats.files / max(stats.seconds, 1e-9):.1f} docs/s, "
+        f"peak RSS: {peak_rss_mb():.0f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# app/services/lexical_index.py
+"""
+Лексический (BM25) индекс фрагментов документов для гибридного поиска.
+
+Плотные эмбеддинги MiniLM плохо различают точные строки: номера статей
+(«ст. 55.16»), ИНН, аббревиатуры («КФ ОДО»). Этот индекс дополняет FAISS:
+строка i индекса соответствует фрагменту i (тот же порядок, что у векторов),
+а результаты обоих поисков объединяются в DocumentService (``rrf_fuse``).
+
+Токенизация: числа вместе с точками и дробями («55.16», «1/2») остаются
+одним токеном, слова приводятся к нижнему регистру (ё → е) и обрезаются
+стеммером Портера для русского языка (Snowball); короткие слова
+(аббревиатуры) и латиница не стеммируются, частые служебные слова
+отбрасываются.
+
+Постинги хранятся компактно, в формате CSR: для термина t фрагменты —
+``rows[offsets[t]:offsets[t + 1]]`` (int32), частоты — ``tfs`` (uint16).
+Массивы сохраняются в кэш индекса рядом с векторами (``to_arrays`` /
+``from_arrays``).
+"""
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Параметры BM25 (стандартные значения Okapi)
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Константа reciprocal rank fusion (Cormack et al.)
+RRF_K = 60
+
+# Числа («55.16», «7707083893», «1/2») или слова
+TOKEN_RE = re.compile(r"\d+(?:[./,]\d+)*|[а-яa-z]+")
+# Слова короче не стеммируются: это аббревиатуры и предлоги
+MIN_STEM_LENGTH = 4
+
+STOP_WORDS = frozenset("""
+а без более бы был была были было быть в вам вас весь во вот все всех вы где да даже для до его ее
+если есть еще же за здесь и из или им их к как ко когда кто ли либо мне может мы на над нам нас не
+него нее нет ни них но ну о об однако он она они оно от очень по под при с со так также такой там
+те тем то того тоже той только том ты у уже чем что чтобы чье чья эта эти это я
+""".split())
+
+
+# --- Стеммер Портера для русского языка (Snowball) ---
+
+_VOWELS = "аеиоуыэюя"
+_PERFECTIVE_GERUND = re.compile(r"(?:(?<=[ая])(?:в|вши|вшись)|ив|ивши|ившись|ыв|ывши|ывшись)$")
+_REFLEXIVE = re.compile(r"(?:ся|сь)$")
+_ADJECTIVE = re.compile(
+    r"(?:ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$"
+)
+_PARTICIPLE = re.compile(r"(?:(?<=[ая])(?:ем|нн|вш|ющ|щ)|ивш|ывш|ующ)$")
+_VERB = re.compile(
+    r"(?:(?<=[ая])(?:ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)"
+    r"|ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)$"
+)
+_NOUN = re.compile(
+    r"(?:а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$"
+)
+_SUPERLATIVE = re.compile(r"(?:ейше|ейш)$")
+_DERIVATIONAL = re.compile(r"ость?$")
+
+
+def _region_after_consonant(word: str, start: int) -> int:
+    """Начало области после первого сочетания «гласная + согласная» от start."""
+    for i in range(start + 1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            return i + 1
+    return len(word)
+
+
+@lru_cache(maxsize=200_000)
+def stem(word: str) -> str:
+    """Основа русского слова (алгоритм Snowball); слово — в нижнем регистре, ё → е."""
+    rv_start = next((i + 1 for i, ch in enumerate(word) if ch in _VOWELS), len(word))
+    prefix, rv = word[:rv_start], word[rv_start:]
+    # R2 — в координатах rv
+    r2 = _region_after_consonant(word, _region_after_consonant(word, 0)) - rv_start
+
+    # Шаг 1: деепричастие, иначе возвратность + прилагательное/причастие, глагол или существительное
+    rv, removed = _PERFECTIVE_GERUND.subn("", rv)
+    if not removed:
+        rv = _REFLEXIVE.sub("", rv)
+        rv, removed = _ADJECTIVE.subn("", rv)
+        if removed:
+            rv = _PARTICIPLE.sub("", rv)
+        else:
+            rv, removed = _VERB.subn("", rv)
+            if not removed:
+                rv = _NOUN.sub("", rv)
+    # Шаг 2
+    if rv.endswith("и"):
+        rv = rv[:-1]
+    # Шаг 3: словообразовательный суффикс в R2
+    match = _DERIVATIONAL.search(rv)
+    if match and match.start() >= r2:
+        rv = rv[:match.start()]
+    # Шаг 4
+    if rv.endswith("ь"):
+        rv = rv[:-1]
+    else:
+        rv = _SUPERLATIVE.sub("", rv)
+        if rv.endswith("нн"):
+            rv = rv[:-1]
+    return prefix + rv
+
+
+def tokenize(text: str) -> List[str]:
+    """Термины текста для индекса и запроса (одинаковая обработка с обеих сторон)."""
+    terms = []
+    for token in TOKEN_RE.findall(text.lower().replace("ё", "е")):
+        if token in STOP_WORDS:
+            continue
+        if len(token) >= MIN_STEM_LENGTH and "а" <= token[0] <= "я":
+            token = stem(token)
+        terms.append(token)
+    return terms
+
+
+def rrf_fuse(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[int]:
+    """
+    Reciprocal rank fusion: объединяет несколько ранжированных списков
+    строк в один по сумме 1 / (k + ранг). При равенстве выше строка из
+    более раннего списка.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.__getitem__, reverse=True)
+
+
+class LexicalIndex:
+    """
+    BM25-индекс фрагментов с постингами в формате CSR.
+
+    Дополнение (``add``) пересобирает массивы постингов за O(P log P), где
+    P — общее число постингов: это дёшево для редких загрузок документов,
+    а поиск всегда идёт по плотным массивам без словарей на каждый термин.
+    """
+
+    def __init__(self):
+        self.vocab: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.rows = np.empty(0, dtype=np.int32)
+        self.tfs = np.empty(0, dtype=np.uint16)
+        self.doc_len = np.empty(0, dtype=np.float32)
+        # Знаменатель BM25 без tf: k1·(1 − b + b·len/avg_len), пересчитывается в add
+        self._norm = np.empty(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    @property
+    def avg_len(self) -> float:
+        return float(self.doc_len.mean()) if len(self.doc_len) else 0.0
+
+    def add(self, texts: Iterable[str]):
+        """Добавляет фрагменты; их строки продолжают нумерацию индекса."""
+        base = len(self)
+        term_ids: List[int] = []
+        rows: List[int] = []
+        tfs: List[int] = []
+        lengths: List[int] = []
+        for row, text in enumerate(texts, start=base):
+            terms = tokenize(text)
+            lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                term_ids.append(self.vocab.setdefault(term, len(self.vocab)))
+                rows.append(row)
+                tfs.append(min(tf, np.iinfo(np.uint16).max))
+        if not lengths:
+            return
+
+        counts = np.diff(self.offsets)
+        old_terms = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+        all_terms = np.concatenate([old_terms, np.asarray(term_ids, dtype=np.int64)])
+        all_rows = np.concatenate([self.rows, np.asarray(rows, dtype=np.int32)])
+        all_tfs = np.concatenate([self.tfs, np.asarray(tfs, dtype=np.uint16)])
+        # Постинги термина упорядочены по строке: новые строки больше старых
+        order = np.argsort(all_terms, kind="stable")
+        self.rows = all_rows[order]
+        self.tfs = all_tfs[order]
+        self.offsets = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(all_terms, minlength=len(self.vocab)), out=self.offsets[1:])
+        self.doc_len = np.concatenate([self.doc_len, np.asarray(lengths, dtype=np.float32)])
+        self._update_norm()
+
+    def _update_norm(self):
+        self._norm = (BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len / max(self.avg_len, 1e-9))).astype(np.float32)
+
+    def _idf(self, df: int) -> float:
+        n = len(self)
+        return float(np.log(1 + (n - df + 0.5) / (df + 0.5)))
+
+    def max_score(self, query: str) -> float:
+        """
+        Верхняя граница BM25-оценки запроса: сумма idf·(k1 + 1) по его
+        терминам из словаря (к ней стремится оценка при большом tf).
+        Отношение ``score / max_score`` (от 0 до 1) — доля веса запроса,
+        которую покрывает фрагмент.
+        """
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        return sum(self._idf(self.offsets[t + 1] - self.offsets[t]) for t in term_ids) * (BM25_K1 + 1)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """Лучшие ``top_k`` фрагментов по BM25: список (строка, оценка) по убыванию оценки."""
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        n = len(self)
+        if not term_ids or top_k <= 0:
+            return []
+
+        rows, weights = [], []
+        for t in term_ids:
+            start, end = self.offsets[t], self.offsets[t + 1]
+            posting_rows = self.rows[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            idf = self._idf(end - start)
+            rows.append(posting_rows)
+            weights.append(idf * tf * (BM25_K1 + 1) / (tf + self._norm[posting_rows]))
+        scores = np.bincount(np.concatenate(rows), weights=np.concatenate(weights), minlength=n)
+
+        # idf > 0, поэтому ненулевая оценка — у каждого фрагмента с термином запроса
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(row), float(scores[row])) for row in candidates]
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Массивы для сохранения (np.savez); словарь — в порядке идентификаторов терминов."""
+        return {
+            "vocab": np.array(list(self.vocab), dtype=str),
+            "offsets": self.offsets,
+            "rows": self.rows,
+            "tfs": self.tfs,
+            "doc_len": self.doc_len,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays) -> Optional["LexicalIndex"]:
+        index = cls()
+        index.vocab = {str(term): i for i, term in enumerate(arrays["vocab"])}
+        index.offsets = np.asarray(arrays["offsets"], dtype=np.int64)
+        index.rows = np.asarray(arrays["rows"], dtype=np.int32)
+        index.tfs = np.asarray(arrays["tfs"], dtype=np.uint16)
+        index.doc_len = np.asarray(arrays["doc_len"], dtype=np.float32)
+        index._update_norm()
+        if len(index.offsets) != len(index.vocab) + 1 or index.offsets[-1] != len(index.rows):
+            return None
+        return index
@@ -0,0 +1,163 @@
+# app/services/registry_parser.py
+"""
+Разбор HTML-страниц реестра СРО НОСО.
+
+Несколько реализаций с общим интерфейсом:
+
+* ``selectolax`` — парсер lexbor на C (если пакет установлен);
+* ``lxml`` — потоковый HTMLPullParser: строки таблицы отдаются по мере
+  разбора, поиск ИНН останавливается на первом совпадении;
+* ``bs4`` — BeautifulSoup с ``html.parser`` (прежняя реализация, всегда доступна).
+
+``get_parser("auto")`` выбирает самую быструю доступную реализацию.
+"""
+import logging
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Iterator, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+TABLE_CLASS = "table table-bordered table-striped"
+_PAGE_RE = re.compile(r"PAGEN_1=(\d+)")
+
+# Колонки таблицы: №, Наименование, ИНН, Дата включения, Статус
+COL_NAME, COL_INN, COL_DATE, COL_STATUS = 1, 2, 3, 4
+
+
+class RegistryRow(NamedTuple):
+    name: str
+    inn: str
+    join_date: str
+    status: str
+
+
+class RegistryParser(ABC):
+    """Базовый разборщик: наследники реализуют _rows и _text."""
+
+    name = "base"
+
+    @abstractmethod
+    def _rows(self, html: str) -> Iterator[List[Any]]:
+        """Ячейки (td) строк таблицы результатов, лениво."""
+
+    @abstractmethod
+    def _text(self, cell: Any) -> str:
+        """Текст ячейки без крайних пробелов."""
+
+    def _row(self, cells: List[Any], inn: Optional[str] = None) -> RegistryRow:
+        return RegistryRow(
+            name=self._text(cells[COL_NAME]),
+            inn=inn if inn is not None else self._text(cells[COL_INN]),
+            join_date=self._text(cells[COL_DATE]),
+            status=self._text(cells[COL_STATUS]),
+        )
+
+    def iter_rows(self, html: str) -> Iterator[RegistryRow]:
+        """Все строки реестра на странице."""
+        for cells in self._rows(html):
+            if len(cells) >= 5:
+                yield self._row(cells)
+
+    def find_inn(self, html: str, inn: str) -> Optional[RegistryRow]:
+        """
+        Строка с заданным ИНН. Остальные колонки извлекаются только у
+        совпавшей строки, разбор прекращается на первом совпадении.
+        """
+        for cells in self._rows(html):
+            if len(cells) >= 5 and self._text(cells[COL_INN]) == inn:
+                return self._row(cells, inn)
+        return None
+
+    @staticmethod
+    def page_count(html: str) -> int:
+        """Число страниц реестра по ссылкам пагинации (PAGEN_1)."""
+        return max((int(n) for n in _PAGE_RE.findall(html)), default=1)
+
+
+class BS4Parser(RegistryParser):
+    name = "bs4"
+
+    def _rows(self, html):
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, "html.parser")
+        table = soup.find('table', {'class': TABLE_CLASS})
+        if not table:
+            return
+        for row in table.find_all('tr'):
+            yield row.find_all('td')
+
+    def _text(self, cell):
+        return cell.text.strip()
+
+
+class LxmlParser(RegistryParser):
+    name = "lxml"
+    chunk_size = 64 * 1024
+
+    def _rows(self, html):
+        from lxml import etree
+        parser = etree.HTMLPullParser(events=("start", "end"))
+        in_table = False
+        for pos in range(0, len(html), self.chunk_size):
+            parser.feed(html[pos:pos + self.chunk_size])
+            for event, element in parser.read_events():
+                if element.tag == "table":
+                    if event == "start" and TABLE_CLASS in (element.get("class") or ""):
+                        in_table = True
+                    elif event == "end" and in_table:
+                        return
+                elif in_table and event == "end" and element.tag == "tr":
+                    yield [cell for cell in element if cell.tag == "td"]
+                    # Разобранные строки больше не нужны
+                    element.clear()
+        parser.close()
+
+    def _text(self, cell):
+        return "".join(cell.itertext()).strip()
+
+
+class SelectolaxParser(RegistryParser):
+    name = "selectolax"
+
+    def _rows(self, html):
+        from selectolax.lexbor import LexborHTMLParser
+        table = LexborHTMLParser(html).css_first("table." + TABLE_CLASS.replace(" ", "."))
+        if table is None:
+            return
+        for row in table.css("tr"):
+            yield row.css("td")
+
+    def _text(self, cell):
+        return cell.text(strip=True)
+
+
+_BACKENDS = {
+    "selectolax": (SelectolaxParser, "selectolax.lexbor"),
+    "lxml": (LxmlParser, "lxml.etree"),
+    "bs4": (BS4Parser, "bs4"),
+}
+
+
+def available_parsers() -> List[str]:
+    """Имена установленных реализаций, от самой быстрой к самой медленной."""
+    import importlib
+    names = []
+    for name, (_, module) in _BACKENDS.items():
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_parser(name: str = "auto") -> RegistryParser:
+    """Разборщик по имени; ``auto`` — самый быстрый из установленных."""
+    available = available_parsers()
+    if name == "auto":
+        name = available[0]
+    elif name not in available:
+        logger.warning(f"[RegistryParser] Backend '{name}' is not available, falling back to '{available[0]}'")
+        name = available[0]
+    return _BACKENDS[name][0]()
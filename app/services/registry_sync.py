@@ -0,0 +1,168 @@
+# app/services/registry_sync.py
+"""
+Фоновая синхронизация локальной реплики реестра СРО НОСО.
+
+Задача постранично (PAGEN_1) обходит весь реестр на сайте и сохраняет
+организации в таблицу registry_members. Проверка ИНН при регистрации
+после этого отвечает из Postgres по первичному ключу и обращается к
+сайту только при промахе. При нескольких репликах бота синхронизацию
+выполняет одна из них (блокировка в Redis). Организации, пропавшие из
+реестра, удаляются только после полного прохода: пустая или короткая
+страница в середине обхода прерывает синхронизацию без удаления.
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from app.config import settings
+from app.database.connection import db, ensure_registry_schema, upsert_registry_members
+from app.monitoring import (
+    REGISTRY_MEMBERS,
+    REGISTRY_SYNC_DURATION,
+    REGISTRY_SYNC_ERRORS,
+    REGISTRY_SYNC_LAST_SUCCESS,
+    span,
+)
+from app.services.sro_registry_service import (
+    SRORegistryService,
+    parse_page_count,
+    parse_registry_page,
+    sro_registry_service,
+)
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "registry:sync:lock"
+
+
+class RegistrySync:
+    """Периодическая синхронизация реестра в Postgres."""
+
+    def __init__(self, service: SRORegistryService, interval: int, page_delay: float = 0.5):
+        self.service = service
+        self.interval = interval
+        self.page_delay = page_delay
+        self.last_success: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def fetch_page(self, page: int) -> str:
+        session = await self.service.get_session()
+        with span("registry_sync_fetch"):
+            async with session.get(self.service.base_url, params={"PAGEN_1": page}) as response:
+                response.raise_for_status()
+                return await response.text()
+
+    async def sync_once(self) -> int:
+        """
+        Полный проход по реестру.
+
+        Returns:
+            int: Число организаций в реплике после синхронизации.
+        """
+        started = time.monotonic()
+        await ensure_registry_schema()
+        async with db.acquire() as conn:
+            sync_started_at = await conn.fetchval("SELECT NOW()::timestamp")
+
+        html = await self.fetch_page(1)
+        pages = parse_page_count(html)
+        seen = 0
+        page_size = 0
+        for page in range(1, pages + 1):
+            if page > 1:
+                await asyncio.sleep(self.page_delay)
+                html = await self.fetch_page(page)
+            with span("registry_parse"):
+                members = parse_registry_page(html)
+            if page == 1:
+                page_size = len(members)
+            if not members and page == 1:
+                raise RuntimeError("registry pages contain no rows, replica left unchanged")
+            # Неполной может быть только последняя страница: пустая или короткая
+            # страница в середине (блокировка, смена вёрстки) — проход неполный,
+            # и удалять «пропавшие» организации нельзя
+            if page < pages and len(members) < page_size:
+                raise RuntimeError(
+                    f"registry page {page}/{pages} has {len(members)} of {page_size} rows, "
+                    f"sync incomplete, nothing pruned"
+                )
+            await upsert_registry_members(members)
+            seen += len(members)
+            logger.debug(f"[RegistrySync] Page {page}/{pages}: {len(members)} rows")
+
+        async with db.acquire() as conn:
+            # Организации, пропавшие из реестра, удаляются (только после полного прохода)
+            await conn.execute("DELETE FROM registry_members WHERE synced_at < $1", sync_started_at)
+            total = await conn.fetchval("SELECT COUNT(*) FROM registry_members")
+
+        duration = time.monotonic() - started
+        self.last_success = time.time()
+        self.last_error = None
+        REGISTRY_MEMBERS.set(total)
+        REGISTRY_SYNC_DURATION.set(duration)
+        REGISTRY_SYNC_LAST_SUCCESS.set(self.last_success)
+        logger.info(f"[RegistrySync] Synced {seen} rows from {pages} pages in {duration:.1f}s, replica size {total}")
+        return total
+
+    async def _acquire_lock(self) -> bool:
+        if db.redis is None:
+            return True
+        try:
+            return bool(await db.redis.set(LOCK_KEY, "1", nx=True, ex=max(self.interval // 2, 60)))
+        except Exception as e:
+            logger.warning(f"[RegistrySync] Redis lock unavailable, syncing anyway: {e}")
+            return True
+
+    async def _initial_delay(self) -> float:
+        # Не синхронизируем сразу после рестарта, если реплика свежая
+        try:
+            await ensure_registry_schema()
+            async with db.acquire() as conn:
+                age = await conn.fetchval(
+                    "SELECT EXTRACT(EPOCH FROM NOW() - MAX(synced_at)) FROM registry_members"
+                )
+        except Exception as e:
+            logger.warning(f"[RegistrySync] Cannot read replica age: {e}")
+            return 0.0
+        return 0.0 if age is None else max(0.0, self.interval - float(age))
+
+    async def run(self):
+        delay = await self._initial_delay()
+        while True:
+            if delay:
+                await asyncio.sleep(delay)
+            delay = self.interval
+            if not await self._acquire_lock():
+                logger.info("[RegistrySync] Another replica is syncing, skipping.")
+                continue
+            try:
+                await self.sync_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                REGISTRY_SYNC_ERRORS.inc()
+                logger.error(f"[RegistrySync] Sync failed: {e}", exc_info=True)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(), name="registry-sync")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Глобальный экземпляр синхронизации
+registry_sync = RegistrySync(
+    sro_registry_service,
+    interval=settings.registry_sync_interval,
+    page_delay=settings.registry_sync_page_delay,
+)
@@ -0,0 +1,172 @@
+# app/services/reranker.py
+"""
+Второй этап поиска: переранжирование кандидатов cross-encoder'ом.
+
+Векторный/гибридный поиск возвращает top-N фрагментов, cross-encoder
+оценивает пары (вопрос, фрагмент) совместно и точнее выбирает лучшие —
+в контекст DeepSeek уходит меньше фрагментов.
+
+* Пары всех одновременных вопросов оцениваются одним батчем (MicroBatcher)
+  в отдельном потоке: один forward-проход на CPU.
+* У каждого вопроса жёсткий бюджет времени (``settings.rerank_budget_ms``):
+  если оценка не успела, возвращается исходный порядок поиска, а
+  досчитанный результат всё равно попадает в кэш.
+* Очередь оценок ограничена (``settings.rerank_max_pending``): если
+  forward-проходы не укладываются в бюджет под нагрузкой, новые вопросы
+  не добавляют CPU-работу, которую никто не ждёт, — порядок поиска
+  возвращается сразу.
+* Результаты кэшируются по нормализованному вопросу, версии индекса и
+  набору кандидатов.
+
+Модель (sentence_transformers.CrossEncoder) загружается лениво, при первом
+вызове или в фоне из lifespan (``reranker.start()``).
+"""
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.cache import TTLCache
+from app.config import settings
+from app.monitoring import RERANK_RESULTS, span
+from app.services.batching import MicroBatcher
+from app.services.search_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина пары (вопрос + фрагмент) в токенах модели
+MAX_LENGTH = 256
+
+
+def _load_model(name: str):
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(name, max_length=MAX_LENGTH, device="cpu")
+
+
+class Reranker:
+    """
+    Args:
+        model_name: Имя модели CrossEncoder.
+        top_n: Сколько первых кандидатов поиска оценивать.
+        budget_ms: Бюджет времени на вопрос, миллисекунды.
+        cache_size: Размер кэша результатов (0 — без кэша).
+        cache_ttl: Время жизни записи кэша, секунды.
+        max_pending: Сколько вопросов может ждать оценки одновременно;
+            сверх этого переранжирование пропускается.
+    """
+
+    def __init__(self, model_name: str, top_n: int = 10, budget_ms: float = 300,
+                 cache_size: int = 1024, cache_ttl: float = 3600, max_pending: int = 32):
+        self.model_name = model_name
+        self.top_n = top_n
+        self.budget = budget_ms / 1000
+        self.max_pending = max_pending
+        # Оценки в очереди или в работе, включая те, чей бюджет уже истёк
+        self._pending = 0
+        self.cache = TTLCache("rerank", maxsize=cache_size, ttl=cache_ttl) if cache_size else None
+        self._model = None
+        self._model_lock = threading.Lock()
+        # Один поток: параллельные forward-проходы на CPU только мешают друг другу
+        self._batcher = MicroBatcher(
+            self._score_batch,
+            workers=1,
+            window_ms=settings.search_batch_window_ms,
+            max_batch=settings.search_max_batch,
+            name="rerank",
+        )
+        self._load_task: Optional[asyncio.Task] = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = _load_model(self.model_name)
+                    logger.info(f"Модель переранжирования загружена: {self.model_name}")
+        return self._model
+
+    def start(self) -> asyncio.Task:
+        """Загружает модель в рабочем потоке, чтобы первый вопрос не тратил бюджет на загрузку."""
+        if self._load_task is None:
+            self._load_task = asyncio.create_task(asyncio.to_thread(lambda: self.model), name="reranker-load")
+        return self._load_task
+
+    # Один predict на пары всех вопросов батча
+    def _score_batch(self, items: List[List[Tuple[str, str]]]) -> List[np.ndarray]:
+        pairs = [pair for item in items for pair in item]
+        with span("rerank_forward"):
+            scores = np.asarray(self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False),
+                                dtype="float32").reshape(-1)
+        bounds = np.cumsum([0] + [len(item) for item in items])
+        return [scores[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    @staticmethod
+    def _cache_key(query: str, version: str, docs: Sequence[Dict]) -> tuple:
+        return normalize_query(query), version, tuple((d["doc_id"], d["start"], d["end"]) for d in docs)
+
+    async def rerank(self, query: str, docs: List[Dict], version: str = "") -> List[Dict]:
+        """
+        Переупорядочивает первые ``top_n`` кандидатов по оценке cross-encoder'а
+        (ключ ``rerank_score``); остальные кандидаты идут следом в исходном
+        порядке. При превышении бюджета или ошибке возвращает ``docs`` как есть.
+        """
+        candidates, rest = docs[:self.top_n], docs[self.top_n:]
+        if len(candidates) < 2:
+            return docs
+
+        key = self._cache_key(query, version, candidates)
+        scores = self.cache.get(key) if self.cache is not None else None
+        if scores is not None:
+            RERANK_RESULTS.labels(result="cached").inc()
+            return self._reorder(candidates, scores) + rest
+
+        if self._pending >= self.max_pending:
+            RERANK_RESULTS.labels(result="skipped").inc()
+            logger.debug(f"[Reranker] В очереди {self._pending} оценок, порядок поиска сохранён")
+            return docs
+
+        self._pending += 1
+        task = asyncio.ensure_future(self._batcher.submit([(query, d["text"]) for d in candidates]))
+        task.add_done_callback(self._finished)
+        if self.cache is not None:
+            task.add_done_callback(lambda t: self._store(key, t))
+        try:
+            with span("rerank"):
+                scores = await asyncio.wait_for(asyncio.shield(task), self.budget)
+        except asyncio.TimeoutError:
+            RERANK_RESULTS.labels(result="timeout").inc()
+            logger.debug(f"[Reranker] Бюджет {self.budget * 1000:.0f} мс исчерпан, порядок поиска сохранён")
+            return docs
+        except Exception as e:
+            RERANK_RESULTS.labels(result="error").inc()
+            logger.warning(f"[Reranker] Ошибка переранжирования: {e}")
+            return docs
+        RERANK_RESULTS.labels(result="reranked").inc()
+        return self._reorder(candidates, scores) + rest
+
+    def _finished(self, task: asyncio.Future):
+        self._pending -= 1
+
+    def _store(self, key: tuple, task: asyncio.Future):
+        if not task.cancelled() and task.exception() is None:
+            self.cache.set(key, task.result())
+
+    @staticmethod
+    def _reorder(candidates: List[Dict], scores: np.ndarray) -> List[Dict]:
+        order = np.argsort(-np.asarray(scores), kind="stable")
+        return [{**candidates[i], "rerank_score": float(scores[i])} for i in order]
+
+    def close(self):
+        self._batcher.close()
+
+
+reranker = Reranker(
+    settings.rerank_model,
+    top_n=settings.rerank_top_n,
+    budget_ms=settings.rerank_budget_ms,
+    cache_size=settings.rerank_cache_size,
+    cache_ttl=settings.rerank_cache_ttl,
+    max_pending=settings.rerank_max_pending,
+)
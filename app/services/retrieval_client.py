@@ -0,0 +1,196 @@
+# app/services/retrieval_client.py
+"""
+Тонкий асинхронный клиент процесса поиска по документам.
+
+В режиме ``RETRIEVAL_MODE=worker`` модель эмбеддингов и FAISS-индекс живут
+в отдельном процессе (``python -m app.services.retrieval_worker``), а бот
+обращается к нему через Unix-сокет. Клиент повторяет интерфейс
+``DocumentService``, который используют хендлеры: ``search``, ``embed_query``,
+``add_document``, ``remove_document``, ``index_version``, ``start``.
+
+Протокол: одна JSON-строка запроса ``{"op": ..., ...}`` и одна JSON-строка
+ответа ``{"ok": true, "result": ..., "version": ...}`` или
+``{"ok": false, "error": ...}``. Соединения переиспользуются (небольшой пул);
+оборванное соединение из пула (процесс поиска перезапущен) заменяется новым
+с одним повтором запроса.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.monitoring import span
+
+logger = logging.getLogger(__name__)
+
+# Предел длины строки протокола (ответ поиска с текстами фрагментов)
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+class RetrievalError(RuntimeError):
+    """Ошибка, возвращённая процессом поиска."""
+
+
+async def send_message(writer: asyncio.StreamWriter, message: dict):
+    writer.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+    await writer.drain()
+
+
+async def read_message(reader: asyncio.StreamReader) -> Optional[dict]:
+    line = await reader.readline()
+    return json.loads(line) if line else None
+
+
+class RetrievalClient:
+    """
+    Клиент процесса поиска.
+
+    Args:
+        socket_path: Путь к Unix-сокету процесса поиска.
+        pool_size: Максимум одновременно открытых соединений.
+        timeout: Таймаут одного запроса, секунды.
+        fallback: Фабрика локального ``DocumentService``, если процесс поиска
+            недоступен (для тестов и однопроцессного запуска); None — без замены.
+        fallback_retry: Сколько секунд после сбоя запросы идут в локальный
+            сервис; затем клиент снова пробует сокет.
+    """
+
+    def __init__(self, socket_path: str, pool_size: int = 4, timeout: float = 30.0,
+                 fallback: Optional[Callable[[], object]] = None, fallback_retry: float = 30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.fallback_retry = fallback_retry
+        self.index_version = ""
+        self._fallback_factory = fallback
+        self._fallback = None
+        self._fallback_lock = asyncio.Lock()
+        # До какого момента (time.monotonic) запросы идут в локальный сервис
+        self._fallback_until = 0.0
+        self._idle: List[tuple] = []
+        self._slots = asyncio.Semaphore(pool_size)
+
+    @property
+    def ready(self) -> bool:
+        return self._fallback.ready if self._use_local() else True
+
+    def _use_local(self) -> bool:
+        return self._fallback is not None and time.monotonic() < self._fallback_until
+
+    async def _connect(self):
+        return await asyncio.open_unix_connection(self.socket_path, limit=STREAM_LIMIT)
+
+    @staticmethod
+    def _discard(conn):
+        if conn is not None:
+            conn[1].close()
+
+    async def _exchange(self, conn, message: dict) -> dict:
+        reader, writer = conn
+        await send_message(writer, message)
+        response = await asyncio.wait_for(read_message(reader), self.timeout)
+        if response is None:
+            raise ConnectionError("retrieval worker closed the connection")
+        return response
+
+    async def _request(self, message: dict) -> dict:
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else None
+            try:
+                if conn is not None:
+                    try:
+                        response = await self._exchange(conn, message)
+                    except ConnectionError as e:
+                        # Соединение из пула устарело (процесс поиска перезапущен):
+                        # один повтор на новом соединении
+                        logger.info(f"[RetrievalClient] Stale pooled connection ({e}), reconnecting")
+                        self._discard(conn)
+                        conn = None
+                if conn is None:
+                    conn = await self._connect()
+                    response = await self._exchange(conn, message)
+            except BaseException:
+                # Отмена или оборванный ответ: в сокете может остаться недочитанный
+                # ответ, и следующий запрос прочитал бы его — соединение не возвращается в пул
+                self._discard(conn)
+                raise
+            self._idle.append(conn)
+        return response
+
+    async def _call(self, op: str, **params):
+        if self._use_local():
+            return await self._call_local(op, **params)
+        try:
+            response = await self._request({"op": op, **params})
+        except (OSError, asyncio.TimeoutError) as e:
+            if self._fallback_factory is None:
+                raise
+            async with self._fallback_lock:
+                # Одновременные сбои создают один локальный сервис
+                if self._fallback is None:
+                    self._fallback = self._fallback_factory()
+                if not self._use_local():
+                    logger.warning(f"[RetrievalClient] Worker unavailable ({e}), "
+                                   f"using in-process search for {self.fallback_retry:.0f} s")
+                    self._fallback_until = time.monotonic() + self.fallback_retry
+            return await self._call_local(op, **params)
+
+        self.index_version = response.get("version", self.index_version)
+        if not response.get("ok"):
+            raise RetrievalError(response.get("error", "unknown error"))
+        return response.get("result")
+
+    async def _call_local(self, op: str, **params):
+        service = self._fallback
+        if op == "search":
+            result = await service.search(params["query"], params["top_k"], params.get("min_score"))
+        elif op == "embed":
+            result = (await service.embed_query(params["query"])).tolist()
+        elif op == "add":
+            result = await service.add_document(params["path"])
+        elif op == "remove":
+            result = await service.remove_document(params["doc_id"], params["delete_file"])
+        else:
+            result = None
+        self.index_version = service.index_version
+        return result
+
+    async def search(self, query: str, top_k: int = 5, min_score: Optional[float] = None) -> List[Dict]:
+        # min_score=None — порог процесса поиска (его settings.search_min_score)
+        with span("retrieval_rpc"):
+            return await self._call("search", query=query, top_k=top_k, min_score=min_score)
+
+    async def embed_query(self, query: str) -> np.ndarray:
+        return np.asarray(await self._call("embed", query=query), dtype="float32")
+
+    async def add_document(self, path: str) -> int:
+        # Файл должен быть доступен процессу поиска по тому же пути (общий том)
+        return await self._call("add", path=path)
+
+    async def remove_document(self, doc_id: int, delete_file: bool = False) -> bool:
+        return await self._call("remove", doc_id=doc_id, delete_file=delete_file)
+
+    async def ping(self) -> str:
+        """Проверка связи; возвращает версию индекса процесса поиска."""
+        await self._call("ping")
+        return self.index_version
+
+    async def wait_ready(self):
+        await self._call("ping")
+
+    def start(self) -> asyncio.Task:
+        """Проверяет связь с процессом поиска в фоне (аналог DocumentService.start)."""
+        async def check():
+            try:
+                version = await self.ping()
+                logger.info(f"[RetrievalClient] Connected to {self.socket_path}, index version {version}")
+            except Exception as e:
+                logger.error(f"[RetrievalClient] Retrieval worker is not reachable: {e}")
+        return asyncio.create_task(check(), name="retrieval-ping")
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
@@ -0,0 +1,113 @@
+# app/services/retrieval_worker.py
+"""
+Отдельный процесс поиска по документам (режим ``RETRIEVAL_MODE=worker``).
+
+Держит модель эмбеддингов и FAISS-индекс (``DocumentService``) и обслуживает
+запросы ботов через Unix-сокет (протокол описан в retrieval_client). Запросы
+разных реплик бота попадают в общий микро-батчер сервиса. Реплики бота и
+процессы поиска масштабируются независимо; в боте не загружаются torch и модель.
+
+Запуск::
+
+    python -m app.services.retrieval_worker [--socket /tmp/sro_retrieval.sock]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+
+from app.config import settings
+from app.services.document_service import DocumentService
+from app.services.retrieval_client import STREAM_LIMIT, read_message, send_message
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalServer:
+    """Обслуживает запросы RetrievalClient поверх DocumentService."""
+
+    def __init__(self, service: DocumentService, socket_path: str):
+        self.service = service
+        self.socket_path = socket_path
+        self._server = None
+
+    async def dispatch(self, request: dict):
+        op = request.get("op")
+        if op == "ping":
+            await self.service.wait_ready()
+            return None
+        if op == "search":
+            min_score = request.get("min_score")
+            return await self.service.search(
+                request["query"], int(request.get("top_k", 5)),
+                None if min_score is None else float(min_score),
+            )
+        if op == "embed":
+            return (await self.service.embed_query(request["query"])).tolist()
+        if op == "add":
+            return await self.service.add_document(request["path"])
+        if op == "remove":
+            return await self.service.remove_document(int(request["doc_id"]), bool(request.get("delete_file")))
+        raise ValueError(f"unknown op {op!r}")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await read_message(reader)
+                if request is None:
+                    break
+                try:
+                    result = await self.dispatch(request)
+                    response = {"ok": True, "result": result}
+                except Exception as e:
+                    logger.error(f"[RetrievalServer] {request.get('op')} failed: {e}", exc_info=True)
+                    response = {"ok": False, "error": str(e)}
+                response["version"] = self.service.index_version
+                await send_message(writer, response)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = await asyncio.start_unix_server(self.handle, path=self.socket_path, limit=STREAM_LIMIT)
+        logger.info(f"[RetrievalServer] Listening on {self.socket_path}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+async def serve(socket_path: str):
+    service = DocumentService()
+    server = RetrievalServer(service, socket_path)
+    await server.start()
+    # Индекс загружается в фоне; ping и запросы дождутся готовности
+    service.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Процесс поиска по документам СРО")
+    parser.add_argument("--socket", default=settings.retrieval_socket)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(args.socket))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# app/services/search_cache.py
+"""
+Двухуровневый кэш поиска по документам.
+
+Первый уровень — in-process LRU (app.cache.TTLCache) по нормализованному
+тексту запроса: эмбеддинг запроса и top-k найденных фрагментов.
+Второй уровень (опционально) — общий Redis для нескольких реплик.
+
+Эмбеддинг зависит только от модели и переживает изменения корпуса, а
+результаты (номера строк таблицы фрагментов) привязаны к версии её
+раскладки: при добавлении или удалении документа они перестают совпадать
+и пересчитываются (в Redis версия входит в ключ, старые записи истекают
+по TTL).
+"""
+import hashlib
+import json
+import logging
+import re
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.cache import TTLCache
+from app.monitoring import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Результат поиска без текста: (строка таблицы фрагментов, score, сильное совпадение BM25)
+Hits = List[Tuple[int, float, bool]]
+# Формат выдачи в ключах Redis: меняется вместе с Hits, чтобы реплики
+# со старым форматом не читали чужие записи
+HITS_FORMAT = "h4"
+
+_PUNCT_RE = re.compile(r"[^\w\s.\-]+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Приводит запрос к каноничному виду: регистр, ё, пунктуация, пробелы."""
+    text = text.lower().replace("ё", "е")
+    text = _PUNCT_RE.sub(" ", text)
+    return _SPACE_RE.sub(" ", text).strip(" .-")
+
+
+class CachedSearch(NamedTuple):
+    embedding: Optional[np.ndarray]
+    hits: Optional[Hits]
+
+
+class SearchCache:
+    """
+    Кэш эмбеддингов запросов и результатов поиска.
+
+    Args:
+        maxsize: Размер локального LRU.
+        ttl: TTL локальных записей, секунды.
+        redis: Функция, возвращающая клиент Redis (или None), для общего уровня.
+        redis_ttl: TTL записей в Redis, секунды.
+        prefix: Префикс ключей Redis.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600,
+                 redis: Optional[Callable[[], object]] = None,
+                 redis_ttl: int = 86400, prefix: str = "search"):
+        self.local = TTLCache("search", maxsize=maxsize, ttl=ttl)
+        self._redis = redis
+        self.redis_ttl = redis_ttl
+        self.prefix = prefix
+        self.redis_hits = 0
+        self.redis_misses = 0
+
+    async def get(self, query: str, version: str, top_k: int) -> CachedSearch:
+        """Ищет эмбеддинг и результаты запроса сначала локально, затем в Redis."""
+        key = normalize_query(query)
+        entry = self.local.get(key)
+        if entry is not None:
+            if entry["version"] == version and entry["top_k"] >= top_k:
+                return CachedSearch(entry["embedding"], entry["hits"][:top_k])
+            return CachedSearch(entry["embedding"], None)
+
+        client = self._client()
+        if client is None:
+            return CachedSearch(None, None)
+        digest = self._digest(key)
+        try:
+            raw_emb, raw_hits = await client.mget(
+                f"{self.prefix}:emb:{digest}",
+                f"{self.prefix}:res:{HITS_FORMAT}:{version}:{top_k}:{digest}",
+            )
+        except Exception as e:
+            logger.debug(f"[SearchCache] Redis недоступен: {e}")
+            return CachedSearch(None, None)
+
+        self._count_redis(raw_emb is not None)
+        if raw_emb is None:
+            return CachedSearch(None, None)
+        embedding = np.frombuffer(raw_emb, dtype="float32")
+        hits = [tuple(hit) for hit in json.loads(raw_hits)] if raw_hits is not None else None
+        if hits is not None:
+            self.local.set(key, {"embedding": embedding, "version": version, "top_k": top_k, "hits": hits})
+        return CachedSearch(embedding, hits)
+
+    async def set(self, query: str, version: str, top_k: int, embedding: np.ndarray, hits: Hits):
+        """Сохраняет эмбеддинг и результаты на обоих уровнях."""
+        key = normalize_query(query)
+        embedding = np.asarray(embedding, dtype="float32")
+        self.local.set(key, {"embedding": embedding, "version": version, "top_k": top_k, "hits": hits})
+
+        client = self._client()
+        if client is None:
+            return
+        digest = self._digest(key)
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.set(f"{self.prefix}:emb:{digest}", embedding.tobytes(), ex=self.redis_ttl)
+                pipe.set(f"{self.prefix}:res:{HITS_FORMAT}:{version}:{top_k}:{digest}", json.dumps(hits), ex=self.redis_ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.debug(f"[SearchCache] Не удалось записать в Redis: {e}")
+
+    def invalidate(self):
+        """Сбрасывает локальный уровень (Redis инвалидируется версией в ключе)."""
+        self.local.clear()
+
+    def stats(self) -> dict:
+        return {
+            "local": self.local.stats(),
+            "redis": {"hits": self.redis_hits, "misses": self.redis_misses},
+        }
+
+    def _client(self):
+        return self._redis() if self._redis is not None else None
+
+    def _count_redis(self, hit: bool):
+        if hit:
+            self.redis_hits += 1
+        else:
+            self.redis_misses += 1
+        CACHE_REQUESTS.labels(cache="search", level="redis", result="hit" if hit else "miss").inc()
+
+    @staticmethod
+    def _digest(key: str) -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
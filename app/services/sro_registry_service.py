@@ -4,21 +4,95 @@
 """
 import logging
 import aiohttp
-from bs4 import BeautifulSoup
-from typing import Optional, Dict
+from functools import lru_cache
+from typing import Optional, Dict, List
+from app.config import settings
+from app.database.connection import get_registry_member, upsert_registry_members
+from app.monitoring import REGISTRY_LOOKUPS, span
+from app.services.registry_parser import RegistryParser, get_parser
 
 logger = logging.getLogger(__name__)
 
+# Статусы реестра, которые считаются членством
+MEMBER_STATUSES = ('член сро', 'член совета сро', 'претендент')
+
+
+def is_member_status(status: str) -> bool:
+    return status.lower() in MEMBER_STATUSES
+
+
+def parse_registry_page(html: str, parser: Optional[RegistryParser] = None) -> List[Dict]:
+    """
+    Извлекает все строки таблицы реестра со страницы.
+
+    Returns:
+        List[Dict]: Записи с ключами name, inn, status, join_date, is_member.
+    """
+    parser = parser or get_registry_parser()
+    return [
+        {**row._asdict(), "is_member": is_member_status(row.status)}
+        for row in parser.iter_rows(html)
+    ]
+
+
+def parse_page_count(html: str) -> int:
+    """Число страниц реестра по ссылкам пагинации (PAGEN_1)."""
+    return RegistryParser.page_count(html)
+
+
+@lru_cache(maxsize=None)
+def get_registry_parser() -> RegistryParser:
+    """
+    Разборщик HTML реестра (settings.registry_parser, по умолчанию самый
+    быстрый из установленных). Выбирается при первом разборе: поиск
+    установленных реализаций импортирует их, при старте бота это не нужно.
+    """
+    return get_parser(settings.registry_parser)
+
+
 class SRORegistryService:
     """Сервис для работы с реестром СРО НОСО."""
 
     def __init__(self):
         self.base_url = "https://www.sronoso.ru/reestr/"
-        self.timeout = aiohttp.ClientTimeout(total=15) # Увеличен таймаут
+        # Раздельные таймауты: быстрый отказ при недоступном хосте, запас на чтение страницы
+        self.timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=settings.registry_connect_timeout,
+            sock_read=settings.registry_read_timeout,
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def parser(self) -> RegistryParser:
+        return get_registry_parser()
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Долгоживущая сессия с пулом keep-alive соединений (создаётся при первом запросе)."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.registry_http_limit,
+                limit_per_host=settings.registry_http_limit_per_host,
+                ttl_dns_cache=300,
+                keepalive_timeout=30,
+            )
+            self._session = aiohttp.ClientSession(timeout=self.timeout, connector=connector)
+        return self._session
+
+    async def close(self):
+        """Закрывает сессию (вызывается из lifespan)."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("[SRORegistryService] HTTP session closed.")
+        self._session = None
 
     async def check_membership_by_inn(self, inn: str) -> Optional[Dict]:
         """
         Проверяет статус членства организации в СРО НОСО по ИНН.
+
+        Сначала ищет в локальной реплике реестра (registry_members), при
+        промахе или устаревшей записи — на сайте СРО, найденная запись
+        сохраняется в реплику.
         
         Args:
             inn (str): ИНН организации (10 или 12 цифр).
@@ -32,18 +106,40 @@ class SRORegistryService:
             return None
 
         try:
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                # Параметры для поиска по ИНН
-                # Исправлена ошибка: ключ 'arrFilter_ff[INNNumber]' заменен на правильный 'arrFilter_pf[INNNumber]'
-                # Также добавлено точное совпадение по ИНН с 'EXACT_MATCH_1=Y'
-                params = {
-                    "PAGEN_1": 1,
-                    "arrFilter_pf[INNNumber]": inn,
-                    "set_filter": "Y",
-                    "EXACT_MATCH_1": "Y" # Для точного совпадения по ИНН
-                }
-                
-                logger.debug(f"[SRORegistryService] Requesting URL: {self.base_url} with params: {params}")
+            member = await get_registry_member(inn, settings.registry_freshness_ttl)
+        except Exception as e:
+            logger.warning(f"[SRORegistryService] Registry replica lookup failed for INN {inn}: {e}")
+            member = None
+        if member is not None:
+            REGISTRY_LOOKUPS.labels(source="replica").inc()
+            logger.info(f"[SRORegistryService] INN {inn} found in local replica. Status: '{member['status']}'")
+            return {"registry": "СРО НОСО", **member, "registry_url": self.base_url}
+
+        REGISTRY_LOOKUPS.labels(source="live").inc()
+        result = await self._check_live(inn)
+        if result is not None:
+            try:
+                await upsert_registry_members([result])
+            except Exception as e:
+                logger.warning(f"[SRORegistryService] Failed to store INN {inn} in replica: {e}")
+        return result
+
+    # Проверка по ИНН непосредственно на сайте СРО
+    async def _check_live(self, inn: str) -> Optional[Dict]:
+        try:
+            session = await self.get_session()
+            # Параметры для поиска по ИНН
+            # Исправлена ошибка: ключ 'arrFilter_ff[INNNumber]' заменен на правильный 'arrFilter_pf[INNNumber]'
+            # Также добавлено точное совпадение по ИНН с 'EXACT_MATCH_1=Y'
+            params = {
+                "PAGEN_1": 1,
+                "arrFilter_pf[INNNumber]": inn,
+                "set_filter": "Y",
+                "EXACT_MATCH_1": "Y" # Для точного совпадения по ИНН
+            }
+            
+            logger.debug(f"[SRORegistryService] Requesting URL: {self.base_url} with params: {params}")
+            with span("registry_live_fetch"):
                 async with session.get(self.base_url, params=params) as response:
                     logger.debug(f"[SRORegistryService] Response status: {response.status}")
                     if response.status != 200:
@@ -52,74 +148,30 @@ class SRORegistryService:
                         error_text = await response.text()
                         logger.debug(f"[SRORegistryService] Error response body: {error_text[:500]}...")
                         return None
-                    
+
                     html = await response.text()
                     logger.debug(f"[SRORegistryService] Received HTML length: {len(html)}")
                     
-            soup = BeautifulSoup(html, "html.parser")
-            
-            # Найдем таблицу результатов
-            # Структура таблицы на сайте: 
-            # Заголовки: №, Полное наименование legal entity, ИНН, Дата включения в реестр членов СРО, Статус
-            table = soup.find('table', {'class': 'table table-bordered table-striped'})
-            
-            if not table:
-                logger.warning("[SRORegistryService] Results table not found in HTML.")
-                # Возможно, страница просто не содержит результатов, но структура таблицы отсутствует
+            with span("registry_parse"):
+                row = self.parser.find_inn(html, inn)
+            if row is None:
                 # Проверим, есть ли сообщение "ничего не найдено"
-                if "ничего не найдено" in html.lower() or "не найдено" in html.lower():
-                     logger.info("[SRORegistryService] Search returned 'not found' message.")
-                else:
-                     logger.warning("[SRORegistryService] Unexpected HTML structure, no table and no 'not found' message.")
+                if "не найдено" in html.lower():
+                    logger.info("[SRORegistryService] Search returned 'not found' message.")
+                logger.info(f"[SRORegistryService] INN {inn} not found in the results table.")
                 return None
-                
-            rows = table.find_all('tr')
-            logger.debug(f"[SRORegistryService] Found {len(rows)} rows in table.")
-            
-            if len(rows) <= 1:  # Только заголовок или пустая таблица
-                logger.info("[SRORegistryService] No results found in the table (only header or empty).")
-                return None
-                
-            # Обычно первая строка - заголовок, начинаем со второй (rows[1:])
-            for row in rows[1:]:
-                cols = row.find_all('td')
-                logger.debug(f"[SRORegistryService] Processing row with {len(cols)} columns.")
-                # Ожидаем как минимум 5 колонок: №, Название, ИНН, Дата, Статус
-                if len(cols) >= 5:
-                    # Индексы могут отличаться, проверяем по содержимому или позиции
-                    # Согласно структуре сайта:
-                    # 0 - № (td)
-                    # 1 - Полное наименование legal entity (td)
-                    # 2 - ИНН (td)
-                    # 3 - Дата включения (td)
-                    # 4 - Статус (td)
-                    org_inn = cols[2].text.strip()
-                    status = cols[4].text.strip()
-                    org_name = cols[1].text.strip()
-                    join_date = cols[3].text.strip()
-                    
-                    logger.debug(f"[SRORegistryService] Row data - INN: '{org_inn}', Status: '{status}', Name: '{org_name}'")
-                    
-                    # Проверяем точное совпадение ИНН
-                    if inn == org_inn:
-                        is_member = status.lower() in ['член сро', 'член совета сро', 'претендент'] # Определяем, что считается "членом"
-                        logger.info(f"[SRORegistryService] INN {inn} found. Status: '{status}', Is Member: {is_member}")
-                        return {
-                            "registry": "СРО НОСО",
-                            "name": org_name,
-                            "inn": org_inn,
-                            "status": status,
-                            "join_date": join_date,
-                            "is_member": is_member,
-                            "registry_url": str(response.url) if 'response' in locals() else self.base_url
-                        }
-                    else:
-                        logger.debug(f"[SRORegistryService] INN mismatch in row: expected '{inn}', got '{org_inn}'")
-                else:
-                    logger.warning(f"[SRORegistryService] Row has less than 5 columns: {len(cols)}. Content: {[c.text.strip() for c in cols]}")
-            
-            logger.info(f"[SRORegistryService] INN {inn} not found in the results table.")
-            return None
+
+            is_member = is_member_status(row.status) # Определяем, что считается "членом"
+            logger.info(f"[SRORegistryService] INN {inn} found. Status: '{row.status}', Is Member: {is_member}")
+            return {
+                "registry": "СРО НОСО",
+                "name": row.name,
+                "inn": row.inn,
+                "status": row.status,
+                "join_date": row.join_date,
+                "is_member": is_member,
+                "registry_url": str(response.url)
+            }
             
         except aiohttp.ClientError as e:
             logger.error(f"[SRORegistryService] Network error while checking INN {inn}: {e}")
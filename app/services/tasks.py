@@ -0,0 +1,281 @@
+# app/services/tasks.py
+"""
+Фоновые задачи Celery: распределённая переиндексация корпуса документов.
+
+Полная пересборка (``rebuild_corpus``) делится на шарды по
+``settings.reindex_shard_size`` файлов:
+
+1. ``index_shard`` на любом воркере разбирает и кодирует свои файлы
+   (конвейер app.services.ingest, общий дисковый кэш записей) и сохраняет
+   результат шарда в рабочий каталог сборки;
+2. ``merge_shards`` (тело chord) склеивает шарды в порядке файлов, строит
+   FAISS- и BM25-индексы и публикует версионированный артефакт
+   (app.services.index_artifact), который загружают боты.
+
+Идемпотентность: версия выводится из содержимого корпуса, готовый шард
+(его json пишется последним) при повторе не пересчитывается, а уже
+опубликованная версия не собирается заново. Поэтому повтор задачи после
+сбоя или перезапуск всей сборки продолжают работу с места остановки.
+Прогресс (``rebuild_progress``) считается по готовым шардам на диске.
+
+Каталоги сборки и кэша (``INDEX_ARTIFACT_DIR``, ``INDEX_CACHE_DIR``) должны
+быть общими для всех воркеров. Для локальной проверки без брокера —
+``CELERY_EAGER=true`` (задачи выполняются синхронно в текущем процессе)::
+
+    python -m app.services.tasks [--eager] [--shard-size 50] [dirs ...]
+"""
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from celery import chord, group
+
+from app.celery import celery
+from app.config import settings
+from app.services.chunking import PASSAGE_DTYPE, join_pages
+from app.services.index_artifact import artifact_exists, artifact_version, write_artifact
+from app.services.index_cache import file_sha256
+from app.services.ingest import ingest, list_documents
+
+logger = logging.getLogger(__name__)
+
+_service = None
+
+
+def _worker_service():
+    # Модель эмбеддингов и кэш записей — одни на процесс воркера
+    global _service
+    if _service is None:
+        from app.services.document_service import DocumentService
+        _service = DocumentService(test_mode=True)
+    return _service
+
+
+def _build_dir(version: str) -> str:
+    # Скрытый каталог: prune_versions и читатели артефакта его не видят
+    return os.path.join(settings.index_artifact_dir, f".build-{version}")
+
+
+def _shard_path(version: str, shard_no: int) -> str:
+    return os.path.join(_build_dir(version), "shards", f"{shard_no:05d}")
+
+
+def _write_json(path: str, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def plan_rebuild(dirs: Optional[List[str]] = None, shard_size: Optional[int] = None) -> Dict:
+    """Файлы корпуса, их хэши, версия артефакта и разбиение на шарды."""
+    from app.services import document_service
+    paths = list_documents(dirs or document_service.DOCS_DIRS)
+    shas = [file_sha256(path) for path in paths]
+    size = max(1, shard_size or settings.reindex_shard_size)
+    return {
+        "version": artifact_version(document_service.CACHE_FINGERPRINT, shas, settings.vector_index_type),
+        "paths": paths,
+        "shas": shas,
+        "shards": [paths[i:i + size] for i in range(0, len(paths), size)],
+    }
+
+
+@celery.task(name="app.services.tasks.rebuild_corpus")
+def rebuild_corpus(dirs: Optional[List[str]] = None, shard_size: Optional[int] = None) -> Dict:
+    """
+    Запускает пересборку корпуса: chord из index_shard и merge_shards.
+
+    Returns:
+        dict: ``version``, ``state`` (``done`` — версия уже опубликована,
+        ``running`` — сборка запущена), число шардов и id задачи слияния.
+    """
+    plan = plan_rebuild(dirs, shard_size)
+    version = plan["version"]
+    if artifact_exists(settings.index_artifact_dir, version):
+        logger.info(f"[Reindex] Версия {version} уже собрана")
+        return {"version": version, "state": "done", "shards": 0}
+
+    os.makedirs(os.path.join(_build_dir(version), "shards"), exist_ok=True)
+    build_file = os.path.join(_build_dir(version), "build.json")
+    if os.path.exists(build_file):
+        # Продолжение сборки: разбиение на шарды — из начатой сборки, даже если
+        # shard_size теперь другой, иначе готовые шарды не совпадут с новыми
+        with open(build_file, encoding="utf-8") as f:
+            shards = json.load(f)["shards"]
+    else:
+        shards = plan["shards"]
+        _write_json(build_file, {
+            "version": version,
+            "shas": plan["shas"],
+            "shards": shards,
+            "started_at": time.time(),
+        })
+    logger.info(f"[Reindex] Сборка {version}: {len(plan['paths'])} файлов, {len(shards)} шардов")
+
+    if not shards:
+        result = merge_shards.delay([], version)
+    else:
+        header = group(index_shard.s(version, n, shard) for n, shard in enumerate(shards))
+        result = chord(header)(merge_shards.s(version))
+    return {"version": version, "state": "running", "shards": len(shards), "task_id": result.id}
+
+
+@celery.task(name="app.services.tasks.index_shard", bind=True, acks_late=True,
+             autoretry_for=(Exception,), retry_backoff=True, max_retries=settings.reindex_max_retries)
+def index_shard(self, version: str, shard_no: int, paths: List[str]) -> Dict:
+    """
+    Разбирает и кодирует файлы шарда; готовый шард не пересчитывается.
+
+    Файлы шарда разбираются в процессе задачи (``workers=1``), а не в пуле
+    ``INGEST_WORKERS``: дочерний процесс prefork-воркера Celery — демон и не
+    может порождать процессы. Параллелизм сборки задаётся числом шардов и
+    ``--concurrency`` воркеров.
+    """
+    out = _shard_path(version, shard_no)
+    if os.path.exists(out + ".json"):
+        with open(out + ".json", encoding="utf-8") as f:
+            done = json.load(f)
+        return {"shard": shard_no, "files": len(done["documents"]), "passages": done["passages"]}
+
+    service = _worker_service()
+    from app.services.document_service import EMBEDDING_DIM
+    files, vectors, stats = ingest(
+        paths, service._encode, EMBEDDING_DIM,
+        cache=service.cache,
+        workers=1,
+        batch_size=settings.ingest_batch_size,
+    )
+    tables = [np.empty(0, dtype=PASSAGE_DTYPE)]
+    for doc_id, f in enumerate(files):
+        table = f.table.copy()
+        table["doc_id"] = doc_id
+        tables.append(table)
+    passages = np.concatenate(tables)
+
+    np.savez(out + ".tmp.npz", vectors=vectors, passages=passages)
+    os.replace(out + ".tmp.npz", out + ".npz")
+    # json — признак готового шарда, пишется последним
+    _write_json(out + ".json", {
+        "documents": [
+            {"name": os.path.basename(f.path), "path": f.path, "sha256": f.sha256, "pages": f.pages}
+            for f in files
+        ],
+        "passages": len(vectors),
+    })
+    logger.info(f"[Reindex] Шард {shard_no} версии {version}: {len(files)} файлов, {len(vectors)} фрагментов, "
+                f"{stats.seconds:.1f} с (попытка {self.request.retries + 1})")
+    return {"shard": shard_no, "files": len(files), "passages": len(vectors)}
+
+
+@celery.task(name="app.services.tasks.merge_shards", bind=True, acks_late=True,
+             autoretry_for=(OSError,), retry_backoff=True, max_retries=settings.reindex_max_retries)
+def merge_shards(self, results: List[Dict], version: str) -> Dict:
+    """Склеивает шарды в порядке файлов, строит индексы и публикует артефакт."""
+    import faiss
+    from app.services.document_service import CACHE_FINGERPRINT, EMBEDDING_DIM
+    from app.services.lexical_index import LexicalIndex
+    from app.services.vector_index import build_index, index_type_of, resolve_index_type
+
+    root = settings.index_artifact_dir
+    if artifact_exists(root, version):
+        return {"version": version, "state": "done"}
+
+    with open(os.path.join(_build_dir(version), "build.json"), encoding="utf-8") as f:
+        build = json.load(f)
+    shards = []
+    for n in range(len(build["shards"])):
+        with open(_shard_path(version, n) + ".json", encoding="utf-8") as f:
+            shards.append(json.load(f))
+
+    documents = [doc for shard in shards for doc in shard["documents"]]
+    if [doc["sha256"] for doc in documents] != build["shas"]:
+        # Файл изменился между планированием и разбором: нужна новая версия
+        raise RuntimeError(f"Corpus changed while building {version}, restart rebuild_corpus")
+
+    # Векторы всех шардов — в один заранее выделенный массив
+    total = sum(shard["passages"] for shard in shards)
+    vectors = np.empty((total, EMBEDDING_DIM), dtype="float32")
+    tables = [np.empty(0, dtype=PASSAGE_DTYPE)]
+    row, doc_offset = 0, 0
+    for n, shard in enumerate(shards):
+        with np.load(_shard_path(version, n) + ".npz") as data:
+            vectors[row:row + shard["passages"]] = data["vectors"]
+            table = data["passages"].copy()
+        table["doc_id"] += doc_offset
+        tables.append(table)
+        row += shard["passages"]
+        doc_offset += len(shard["documents"])
+    passages = np.concatenate(tables)
+
+    kind = resolve_index_type(settings.vector_index_type, total)
+    index = build_index(
+        kind, vectors, EMBEDDING_DIM,
+        metric=faiss.METRIC_INNER_PRODUCT,
+        nprobe=settings.vector_index_nprobe,
+        ef_search=settings.vector_index_ef_search,
+    )
+    lexical = None
+    if settings.search_hybrid:
+        texts = [join_pages(doc["pages"]) for doc in documents]
+        lexical_index = LexicalIndex()
+        lexical_index.add(texts[p["doc_id"]][p["start"]:p["end"]] for p in passages)
+        lexical = lexical_index.to_arrays()
+
+    # В манифест — собранный тип: на маленьком корпусе IVF/PQ заменяется flat
+    write_artifact(root, version, documents, passages, index, lexical,
+                   manifest={"fingerprint": CACHE_FINGERPRINT, "index_type": index_type_of(index)},
+                   keep=settings.reindex_keep_versions)
+    shutil.rmtree(_build_dir(version), ignore_errors=True)
+    return {"version": version, "state": "done", "documents": len(documents), "passages": total,
+            "index_type": index_type_of(index)}
+
+
+def rebuild_progress(version: str) -> Dict:
+    """Состояние сборки версии по файлам на диске (без брокера и бэкенда результатов)."""
+    root = settings.index_artifact_dir
+    if artifact_exists(root, version):
+        with open(os.path.join(root, version, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        return {"version": version, "state": "done", "documents": manifest["documents"],
+                "passages": manifest["passages"]}
+    try:
+        with open(os.path.join(_build_dir(version), "build.json"), encoding="utf-8") as f:
+            build = json.load(f)
+    except FileNotFoundError:
+        return {"version": version, "state": "unknown"}
+    done = [n for n in range(len(build["shards"])) if os.path.exists(_shard_path(version, n) + ".json")]
+    return {
+        "version": version,
+        "state": "running",
+        "shards_done": len(done),
+        "shards_total": len(build["shards"]),
+        "files_done": sum(len(build["shards"][n]) for n in done),
+        "files_total": len(build["shas"]),
+        "elapsed": time.time() - build["started_at"],
+    }
+
+
+def main():
+    """CLI: запуск пересборки (с --eager — синхронно, без брокера)."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Пересборка индекса документов через Celery")
+    parser.add_argument("dirs", nargs="*", help="каталоги с PDF/DOCX (по умолчанию DOCS_DIRS)")
+    parser.add_argument("--shard-size", type=int, default=settings.reindex_shard_size)
+    parser.add_argument("--eager", action="store_true", help="выполнить задачи в текущем процессе")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.eager:
+        celery.conf.task_always_eager = True
+    result = rebuild_corpus.delay(args.dirs or None, args.shard_size).get()
+    print(json.dumps({**result, "progress": rebuild_progress(result["version"])}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
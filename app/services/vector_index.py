@@ -0,0 +1,188 @@
+# app/services/vector_index.py
+"""
+Выбор и построение FAISS-индекса для эмбеддингов фрагментов.
+
+Поддерживаемые типы (``settings.vector_index_type``):
+
+* ``flat`` — точный поиск, float32 (эталон для recall);
+* ``sq_fp16`` / ``sq8`` — скалярное квантование до float16 / int8 (память в 2 / 4 раза меньше);
+* ``hnsw`` — граф HNSW поверх float32 (быстрый поиск, память чуть больше flat);
+* ``ivf_flat`` — инвертированные списки (поиск в ``nprobe`` ближайших кластерах);
+* ``ivf_sq8`` — IVF с int8-квантованием векторов;
+* ``ivf_pq`` — IVF с product quantization (самый компактный, recall ниже);
+* ``auto`` — выбор по размеру корпуса (``choose_index_type``).
+
+Типы с кластеризацией (IVF, PQ) обучаются на векторах корпуса при полной
+сборке; при слишком маленьком корпусе число кластеров и бит PQ уменьшается,
+а если обучать не на чем — используется ``flat``. Документы, добавленные
+после сборки, дописываются в обученный индекс без переобучения.
+"""
+import logging
+import math
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import faiss
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "sq_fp16", "sq8", "hnsw", "ivf_flat", "ivf_sq8", "ivf_pq")
+
+# Минимум обучающих векторов на кластер k-means (рекомендация FAISS — 39)
+MIN_POINTS_PER_CENTROID = 39
+HNSW_M = 32
+# Число подвекторов PQ: 384 / 48 = 8 измерений на подвектор
+PQ_SUBVECTORS = 48
+
+# Пороги автоматического выбора (число векторов)
+AUTO_FLAT_MAX = 20_000
+AUTO_HNSW_MAX = 200_000
+
+
+def choose_index_type(n_vectors: int) -> str:
+    """
+    Тип индекса по размеру корпуса: до десятков тысяч фрагментов точный
+    поиск дешевле всего; затем HNSW; для очень больших корпусов — IVF-PQ
+    ради памяти.
+    """
+    if n_vectors <= AUTO_FLAT_MAX:
+        return "flat"
+    if n_vectors <= AUTO_HNSW_MAX:
+        return "hnsw"
+    return "ivf_pq"
+
+
+def resolve_index_type(kind: str, n_vectors: int) -> str:
+    if kind == "auto":
+        return choose_index_type(n_vectors)
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type '{kind}', expected one of {INDEX_TYPES} or 'auto'")
+    return kind
+
+
+def _nlist(n_vectors: int) -> int:
+    # ~4·sqrt(N) кластеров, но не меньше MIN_POINTS_PER_CENTROID векторов на кластер
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // MIN_POINTS_PER_CENTROID))
+
+
+def _pq_bits(n_vectors: int) -> int:
+    # 2**bits центроидов на подвектор должны обучаться на достаточном числе точек
+    return max(1, min(8, int(math.log2(max(2, n_vectors // MIN_POINTS_PER_CENTROID)))))
+
+
+def factory_string(kind: str, n_vectors: int, dim: int) -> str:
+    """Строка faiss.index_factory для типа индекса и размера обучающей выборки."""
+    if kind == "flat":
+        return "Flat"
+    if kind == "sq_fp16":
+        return "SQfp16"
+    if kind == "sq8":
+        return "SQ8"
+    if kind == "hnsw":
+        return f"HNSW{HNSW_M}"
+    nlist = _nlist(n_vectors)
+    if kind == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if kind == "ivf_sq8":
+        return f"IVF{nlist},SQ8"
+    if kind == "ivf_pq":
+        m = PQ_SUBVECTORS if dim % PQ_SUBVECTORS == 0 else dim
+        # np — без polysemous-обучения: оно долгое, а polysemous-фильтрация не используется
+        return f"IVF{nlist},PQ{m}x{_pq_bits(n_vectors)}np"
+    raise ValueError(f"Unknown vector index type '{kind}'")
+
+
+def needs_training(kind: str) -> bool:
+    return kind.startswith("ivf") or kind == "sq8"
+
+
+def build_index(kind: str, vectors: np.ndarray, dim: int, metric: Optional[int] = None,
+                nprobe: int = 16, ef_search: int = 64) -> "faiss.Index":
+    """
+    Создаёт индекс заданного типа, обучает его на ``vectors`` (если нужно)
+    и добавляет их.
+
+    Args:
+        kind: Тип индекса (см. INDEX_TYPES) или ``auto``.
+        vectors: Матрица float32 (n × dim); может быть пустой.
+        metric: faiss.METRIC_L2 (по умолчанию) или faiss.METRIC_INNER_PRODUCT.
+    """
+    import faiss
+    metric = faiss.METRIC_L2 if metric is None else metric
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n = len(vectors)
+    kind = resolve_index_type(kind, n)
+    if needs_training(kind) and n < MIN_POINTS_PER_CENTROID:
+        logger.warning(f"[VectorIndex] {n} vectors are not enough to train '{kind}', using 'flat'")
+        kind = "flat"
+
+    index = faiss.index_factory(dim, factory_string(kind, n, dim), metric)
+    if not index.is_trained:
+        index.train(vectors)
+    if n:
+        index.add(vectors)
+    configure_search(index, nprobe=nprobe, ef_search=ef_search)
+    enable_reconstruct(index)
+    logger.info(f"[VectorIndex] Built '{kind}' index ({factory_string(kind, n, dim)}) over {n} vectors")
+    return index
+
+
+def configure_search(index: "faiss.Index", nprobe: int = 16, ef_search: int = 64):
+    """Параметры поиска, которые не сохраняются в файле индекса (nprobe, efSearch)."""
+    import faiss
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        pass
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search
+
+
+def enable_reconstruct(index: "faiss.Index"):
+    """
+    Разрешает index.reconstruct(i) (вектор по номеру): IVF нужна прямая
+    карта номер → список. Карта сохраняется вместе с индексом.
+    """
+    import faiss
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return
+    if ivf.direct_map.no():
+        ivf.make_direct_map()
+
+
+def index_type_of(index: "faiss.Index") -> str:
+    """Тип индекса (из INDEX_TYPES) по объекту FAISS."""
+    import faiss
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVFScalarQuantizer):
+        return "ivf_sq8"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq_fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "flat"
+
+
+def index_memory_bytes(index: "faiss.Index") -> int:
+    """Размер сериализованного индекса — оценка занимаемой памяти."""
+    import faiss
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def recall_at_k(index: "faiss.Index", baseline: "faiss.Index", queries: np.ndarray, k: int = 10) -> float:
+    """Доля истинных k ближайших соседей (по baseline, обычно flat), найденных индексом."""
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    _, truth = baseline.search(queries, k)
+    _, found = index.search(queries, k)
+    hits = sum(len(set(t[t >= 0]) & set(f[f >= 0])) for t, f in zip(truth, found))
+    total = int((truth >= 0).sum())
+    return hits / total if total else 1.0
@@ -0,0 +1,101 @@
+# benchmarks/bench_ingest.py
+"""
+Скорость загрузки корпуса (app.services.ingest) на синтетических PDF.
+
+Генерирует ``--docs`` PDF-файлов по ``--pages`` страниц (латинский текст,
+шрифт Helvetica — без внешних зависимостей) и загружает их конвейером с
+пустым кэшем. Выводит документы/с, фрагменты/с, время разбора и
+кодирования и пиковый RSS (процесс + пул разбора).
+
+``--encoder hash`` заменяет модель детерминированным «мешком слов», чтобы
+измерить сам конвейер без трансформера (и без загрузки модели).
+Каждую конфигурацию удобно запускать отдельным процессом — пиковый RSS
+накапливается за всё время жизни процесса.
+
+Запуск::
+
+    python -m benchmarks.bench_ingest [--docs 2000] [--pages 5] [--workers 0] [--batch-size 64]
+"""
+import argparse
+import os
+import tempfile
+import zlib
+
+import numpy as np
+
+from app.services.document_service import EMBEDDING_DIM, DocumentService, normalize
+from app.services.ingest import ingest, list_documents, peak_rss_mb
+
+WORDS = ("member", "fund", "compensation", "contract", "liability", "insurance", "statute", "article",
+         "organisation", "board", "meeting", "report", "payment", "register", "inspection", "rules")
+
+
+def write_pdf(path: str, pages):
+    """Минимальный PDF: по потоку текста Helvetica на страницу."""
+    n = len(pages)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(n))
+               + b"] /Count %d >>" % n,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i, lines in enumerate(pages):
+        stream = b"BT /F1 10 Tf 12 TL 40 800 Td " + b" ".join(
+            b"(" + line.encode("ascii") + b") '" for line in lines) + b" ET"
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (5 + 2 * i))
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def synthetic_corpus(directory: str, docs: int, pages: int, lines: int = 60, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    for d in range(docs):
+        content = [[" ".join(rng.choice(WORDS, 12)) + "." for _ in range(lines)] for _ in range(pages)]
+        write_pdf(os.path.join(directory, f"doc{d:05d}.pdf"), content)
+
+
+def hash_encode(texts):
+    out = np.zeros((len(texts), EMBEDDING_DIM), dtype="float32")
+    for i, text in enumerate(texts):
+        for word in text.split():
+            out[i, zlib.crc32(word.encode()) % EMBEDDING_DIM] += 1
+    return normalize(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=0, help="процессов разбора (0 — по числу ядер)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--encoder", choices=("model", "hash"), default="model")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        synthetic_corpus(directory, args.docs, args.pages)
+        if args.encoder == "model":
+            service = DocumentService(test_mode=True, cache_dir="")
+            encode = service._encode
+            service.model  # загрузка модели не входит в замер
+        else:
+            encode = hash_encode
+
+        files, vectors, stats = ingest(list_documents([directory]), encode, EMBEDDING_DIM,
+                                       workers=args.workers, batch_size=args.batch_size)
+    print(f"docs: {stats.files}, passages: {stats.passages}, vectors: {vectors.nbytes / 2**20:.1f} MB")
+    print(f"extract: {stats.extract_seconds:.1f} s, encode: {stats.encode_seconds:.1f} s, total: {stats.seconds:.1f} s")
+    print(f"{stats.files / stats.seconds:.1f} docs/s, {stats.passages / stats.seconds:.0f} passages/s, "
+          f"peak RSS: {peak_rss_mb():.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# benchmarks/bench_lexical_index.py
+"""
+Стоимость BM25-части гибридного поиска на синтетическом корпусе.
+
+Фрагменты собираются из псевдослов с русскими окончаниями (частоты по
+закону Ципфа), номеров статей и ИНН. Измеряются сборка индекса, размер
+постингов и латентность ``LexicalIndex.search`` + ``rrf_fuse`` на один
+запрос — то, что гибридный режим добавляет к векторному поиску.
+
+Запуск::
+
+    python -m benchmarks.bench_lexical_index [--passages 50000] [--queries 500]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.lexical_index import LexicalIndex, rrf_fuse
+
+SYLLABLES = ["ком", "пен", "са", "ци", "он", "фон", "вз", "нос", "стра", "хо", "ва", "ни", "ор", "га", "чле", "до", "гов"]
+ENDINGS = ["", "а", "ов", "ого", "ый", "ая", "ой", "ии", "ие", "ами", "ость", "ения"]
+
+
+def synthetic_passages(n: int, words_per_passage: int = 80, vocab: int = 20000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    stems = ["".join(rng.choice(SYLLABLES, rng.integers(2, 5))) for _ in range(vocab)]
+    ranks = np.minimum(rng.zipf(1.2, size=n * words_per_passage), vocab) - 1
+    endings = rng.choice(ENDINGS, size=len(ranks))
+    words = [stems[r] + e for r, e in zip(ranks, endings)]
+    passages = []
+    for i in range(n):
+        chunk = words[i * words_per_passage:(i + 1) * words_per_passage]
+        chunk.append(f"ст. {rng.integers(1, 99)}.{rng.integers(1, 30)}")
+        chunk.append(str(rng.integers(10**9, 10**10)))
+        passages.append(" ".join(chunk))
+    return passages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--passages", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    passages = synthetic_passages(args.passages)
+    started = time.perf_counter()
+    index = LexicalIndex()
+    index.add(passages)
+    build = time.perf_counter() - started
+    postings_mb = sum(a.nbytes for name, a in index.to_arrays().items() if name != "vocab") / 2**20
+    print(f"passages: {len(index)}, terms: {len(index.vocab)}, "
+          f"build: {build:.1f} s, postings: {postings_mb:.1f} MB")
+
+    rng = np.random.default_rng(1)
+    queries = []
+    for row in rng.choice(len(passages), args.queries):
+        words = passages[row].split()
+        queries.append(" ".join(rng.choice(words, 4)))
+    vector_ranking = list(range(args.k))
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        lexical = [row for row, _ in index.search(query, args.k)]
+        rrf_fuse([vector_ranking, lexical])
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    print(f"bm25 + rrf per query: p50 {np.median(latencies) * 1000:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/bench_rate_limiter.py
+"""
+Нагрузочный тест лимита вопросов на живом Redis (REDIS_URL).
+
+Для каждой политики выполняется ``--checks`` проверок с ``--concurrency``
+одновременными запросами от ``--users`` пользователей. По INFO commandstats
+считается, сколько команд Redis пришлось на одну проверку (ожидается ровно
+одна — EVALSHA), и выводятся латентность p50/p99 и пропускная способность.
+
+Запуск::
+
+    python -m benchmarks.bench_rate_limiter [--checks 5000] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import redis.asyncio as redis
+
+from app.rate_limiter import RateLimiter
+
+
+async def command_count(client) -> int:
+    stats = await client.info("commandstats")
+    # Служебные INFO самого теста не учитываются
+    return sum(v["calls"] for k, v in stats.items() if k != "cmdstat_info")
+
+
+async def run_policy(client, spec: str, args) -> dict:
+    limiter = RateLimiter(lambda: client, {"guest": spec}, prefix=f"bench:{time.time_ns()}")
+    # Скрипт загружается заранее, чтобы первый NOSCRIPT не попал в подсчёт
+    await client.script_load(limiter._get_script(client).script)
+
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await limiter.check(i % args.users, "guest")
+            latencies.append(time.perf_counter() - started)
+
+    before = await command_count(client)
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.checks)))
+    elapsed = time.perf_counter() - started
+    commands = await command_count(client) - before
+
+    latencies.sort()
+    return {
+        "commands_per_check": commands / args.checks,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "checks_per_s": args.checks / elapsed,
+    }
+
+
+async def main_async(args):
+    client = redis.from_url(args.redis_url)
+    try:
+        print(f"{'policy':<20}{'cmds/check':>12}{'p50 ms':>10}{'p99 ms':>10}{'checks/s':>12}")
+        for spec in args.policies:
+            r = await run_policy(client, spec, args)
+            print(f"{spec:<20}{r['commands_per_check']:>12.2f}{r['p50_ms']:>10.3f}"
+                  f"{r['p99_ms']:>10.3f}{r['checks_per_s']:>12.0f}")
+    finally:
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    parser.add_argument("--checks", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--policies", nargs="+", default=["fixed:3/86400", "sliding:3/86400", "bucket:3/86400"])
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
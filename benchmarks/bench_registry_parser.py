@@ -0,0 +1,59 @@
+# benchmarks/bench_registry_parser.py
+"""
+Сравнение разборщиков страниц реестра СРО НОСО на сохранённых страницах.
+
+Для каждой установленной реализации (selectolax, lxml, bs4) измеряется:
+
+* ``all rows``  — разбор всех строк страницы (синхронизация реплики);
+* ``find first`` / ``find last`` — поиск ИНН с остановкой на совпадении;
+* ``search page`` — страница результатов фильтра по ИНН (живая проверка).
+
+Запуск::
+
+    python -m benchmarks.bench_registry_parser [--repeat 200]
+"""
+import argparse
+import os
+import timeit
+
+from app.services.registry_parser import available_parsers, get_parser
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+def load(name: str) -> str:
+    with open(os.path.join(DATA_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    page = load("registry_page.html")
+    search = load("registry_search.html")
+    reference = list(get_parser("bs4").iter_rows(page))
+    first_inn, last_inn = reference[0].inn, reference[-1].inn
+    search_inn = next(get_parser("bs4").iter_rows(search)).inn
+
+    cases = {
+        "all rows": lambda p: list(p.iter_rows(page)),
+        "find first": lambda p: p.find_inn(page, first_inn),
+        "find last": lambda p: p.find_inn(page, last_inn),
+        "search page": lambda p: p.find_inn(search, search_inn),
+    }
+
+    print(f"{'backend':<12}" + "".join(f"{name:>14}" for name in cases) + "   (ms per call)")
+    for backend in available_parsers():
+        p = get_parser(backend)
+        assert list(p.iter_rows(page)) == reference, f"{backend}: rows differ from bs4"
+        timings = [
+            timeit.timeit(lambda: case(p), number=args.repeat) / args.repeat * 1000
+            for case in cases.values()
+        ]
+        print(f"{backend:<12}" + "".join(f"{t:>14.3f}" for t in timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# benchmarks/bench_vector_index.py
+"""
+Сравнение типов FAISS-индекса: память, латентность и recall@k против flat.
+
+По умолчанию корпус синтетический (кластеризованные векторы размерности
+384, как у MiniLM); ``--vectors`` позволяет взять реальные эмбеддинги из
+кэша индекса (``data/index_cache/<fp>/entries/*.vectors.npy``). Запросы —
+зашумлённые векторы корпуса, поиск по одному запросу (как в боте). Векторы
+нормируются и ищутся по скалярному произведению (косинус), как в DocumentService.
+
+Запуск::
+
+    python -m benchmarks.bench_vector_index [--n 20000] [--queries 200] [--k 10]
+    python -m benchmarks.bench_vector_index --vectors "data/index_cache/*/entries/*.vectors.npy"
+"""
+import argparse
+import glob
+import time
+
+import faiss
+import numpy as np
+
+from app.services.document_service import normalize
+from app.services.vector_index import (
+    INDEX_TYPES,
+    build_index,
+    choose_index_type,
+    index_memory_bytes,
+    recall_at_k,
+)
+
+
+def synthetic_corpus(n: int, dim: int, clusters: int = 200, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(0, clusters, n)] + 0.5 * rng.normal(size=(n, dim))
+    return vectors.astype("float32")
+
+
+def load_vectors(pattern: str) -> np.ndarray:
+    arrays = [np.load(path) for path in sorted(glob.glob(pattern))]
+    arrays = [a for a in arrays if len(a)]
+    if not arrays:
+        raise SystemExit(f"no vectors match {pattern}")
+    return np.vstack(arrays).astype("float32")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--n", type=int, default=20000, help="размер синтетического корпуса")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--vectors", help="glob .npy файлов с реальными эмбеддингами")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES))
+    args = parser.parse_args()
+
+    vectors = normalize(load_vectors(args.vectors) if args.vectors else synthetic_corpus(args.n, args.dim))
+    n, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(n, min(args.queries, n), replace=False)]
+    queries = normalize(queries + 0.05 * rng.normal(size=queries.shape))
+    print(f"corpus: {n} x {dim}, queries: {len(queries)}, auto -> {choose_index_type(n)}")
+
+    ip = faiss.METRIC_INNER_PRODUCT
+    flat = build_index("flat", vectors, dim, metric=ip)
+    print(f"{'type':<10}{'build s':>10}{'memory MB':>12}{'ms/query':>10}{'recall@' + str(args.k):>11}")
+    for kind in args.types:
+        started = time.perf_counter()
+        index = build_index(kind, vectors, dim, metric=ip, nprobe=args.nprobe, ef_search=args.ef_search)
+        build = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for q in queries:
+            index.search(q[None, :], args.k)
+        latency = (time.perf_counter() - started) / len(queries) * 1000
+
+        recall = recall_at_k(index, flat, queries, args.k)
+        memory = index_memory_bytes(index) / 2**20
+        print(f"{kind:<10}{build:>10.2f}{memory:>12.1f}{latency:>10.3f}{recall:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,56 @@
+import zlib
+import docx
+import numpy as np
 import pytest
 from unittest.mock import MagicMock, Mock, AsyncMock
-from app.services.document_service import DocumentService
+from app.services import document_service
+from app.services.document_service import DocumentService, EMBEDDING_DIM
+
+# Небольшой корпус для тестов загрузки и переиндексации
+CORPUS_TEXTS = {
+    "a.docx": "Компенсационный фонд возмещения вреда. " * 40,
+    "b.docx": "Страхование ответственности членов.",
+    "c.docx": "Членские взносы уплачиваются ежеквартально. " * 15,
+}
+
+
+def _fake_encode(texts, **kwargs):
+    # Детерминированный «эмбеддинг»: мешок слов по crc32 (не зависит от PYTHONHASHSEED)
+    out = np.zeros((len(texts), EMBEDDING_DIM), dtype="float32")
+    for i, text in enumerate(texts):
+        for word in text.lower().split():
+            out[i, zlib.crc32(word.encode()) % EMBEDDING_DIM] += 1
+    return out
+
+
+def _make_docx(directory, name, text):
+    document = docx.Document()
+    document.add_paragraph(text)
+    document.save(str(directory / name))
+
+
+@pytest.fixture
+def fake_encode():
+    return _fake_encode
+
+
+@pytest.fixture
+def embedding_model(monkeypatch):
+    """Модель эмбеддингов на fake_encode вместо sentence-transformers."""
+    model = MagicMock()
+    model.encode.side_effect = _fake_encode
+    monkeypatch.setattr(document_service, "_load_model", MagicMock(return_value=model))
+    return model
+
+
+@pytest.fixture
+def corpus_texts():
+    return dict(CORPUS_TEXTS)
+
+
+@pytest.fixture
+def make_docx():
+    return _make_docx
 
 @pytest.fixture
 def mock_doc_service():
@@ -8,8 +58,8 @@ def mock_doc_service():
     mock.search = AsyncMock(return_value=[])
     mock._load_documents = Mock(return_value=None)
     mock._build_index = Mock(return_value=None)
-    mock._extract_text_from_pdf = Mock(return_value="")
-    mock._extract_text_from_docx = Mock(return_value="")
+    mock._extract_pages_from_pdf = Mock(return_value=[])
+    mock._extract_pages_from_docx = Mock(return_value=[])
     return mock
 
 @pytest.fixture
@@ -43,3 +43,39 @@ async def test_ask_ai_with_context():
     with patch('app.services.ai_service.client', mock_client):
         result = await ask_ai("Что такое СРО?", "Контекст из документов")
         assert "Ответ с контекстом" in result
+
+@pytest.mark.asyncio
+async def test_ask_ai_semantic_cache(mock_doc_service):
+    import numpy as np
+    from app.services.ai_service import answer_cache
+    answer_cache.clear()
+    mock_doc_service.embed_query = AsyncMock(return_value=np.ones(384, dtype="float32"))
+    mock_client = AsyncMock()
+    mock_response = AsyncMock()
+    mock_response.choices = [AsyncMock(message=AsyncMock(content="Ответ из DeepSeek"))]
+    mock_client.chat.completions.create.return_value = mock_response
+
+    with patch('app.services.ai_service.client', mock_client):
+        first = await ask_ai("Сколько взнос?", "Контекст", context_key="ctx")
+        second = await ask_ai("Сколько взнос ?", "Контекст", context_key="ctx")
+        other = await ask_ai("Сколько взнос?", "Другой контекст", context_key="ctx2")
+
+    assert first == second == other == "Ответ из DeepSeek"
+    assert mock_client.chat.completions.create.call_count == 2
+
+@pytest.mark.asyncio
+async def test_ask_ai_stream_yields_chunks():
+    from app.services.ai_service import ask_ai_stream
+
+    async def fake_stream():
+        for text in ["Ответ ", "по ", "частям"]:
+            yield AsyncMock(choices=[AsyncMock(delta=AsyncMock(content=text))])
+
+    mock_client = AsyncMock()
+    mock_client.chat.completions.create.return_value = fake_stream()
+
+    with patch('app.services.ai_service.client', mock_client):
+        chunks = [chunk async for chunk in ask_ai_stream("Что такое СРО?")]
+
+    assert chunks == ["Ответ ", "по ", "частям"]
+    assert mock_client.chat.completions.create.call_args.kwargs["stream"] is True
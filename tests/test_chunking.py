@@ -0,0 +1,29 @@
+from app.services.chunking import split_passages, join_pages
+
+
+def test_passages_respect_size_and_pages():
+    pages = ["Слово " * 300, "Вторая страница " * 100]
+    text = join_pages(pages)
+    passages = split_passages(pages, chunk_size=400, overlap=80)
+
+    assert passages
+    assert all(p.end - p.start <= 400 for p in passages)
+    assert {p.page for p in passages} == {1, 2}
+    # Фрагмент не пересекает границу страницы
+    boundary = len(pages[0])
+    assert all(p.end <= boundary or p.start > boundary for p in passages)
+    assert "страница" in text[passages[-1].start:passages[-1].end]
+
+
+def test_passages_overlap():
+    pages = ["Текст пункта. " * 100]
+    passages = split_passages(pages, chunk_size=300, overlap=60)
+    assert len(passages) > 1
+    assert all(b.start < a.end for a, b in zip(passages, passages[1:]))
+
+
+def test_sections_start_new_passage():
+    pages = ["Статья 1\n" + "Первая статья. " * 20 + "\nСтатья 2\n" + "Вторая статья. " * 20]
+    text = join_pages(pages)
+    passages = split_passages(pages, chunk_size=600, overlap=100)
+    assert any(text[p.start:p.end].startswith("Статья 2") for p in passages)
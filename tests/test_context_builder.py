@@ -0,0 +1,67 @@
+from unittest.mock import patch
+from app.services.ai_service import _build_messages
+from app.services.context_builder import (
+    TokenCounter,
+    build_context,
+    estimate_tokens,
+    trim_to_tokens,
+)
+
+TEXT = ("Компенсационный фонд формируется из взносов членов. "
+        "Размер взноса зависит от уровня ответственности. "
+        "Средства фонда размещаются в банке. ")
+
+
+class WordCounter(TokenCounter):
+    # Один токен на слово: предсказуемые числа в тестах
+    def count(self, text):
+        return len(text.split())
+
+
+def passage(doc_id, start, text, name="Устав.pdf", page=1):
+    return {"doc_id": doc_id, "name": name, "page": page, "start": start, "end": start + len(text),
+            "text": text, "score": 0.5}
+
+
+def test_estimate_tokens_is_conservative():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("ст. 55.16") == 1 + 1 + 1 + 1 + 1
+    assert estimate_tokens("фонд") == 2
+    assert estimate_tokens("fund") == 1
+
+
+def test_trim_to_tokens_cuts_at_sentence_boundary():
+    counter = WordCounter()
+    assert trim_to_tokens(TEXT, 12, counter) == "Компенсационный фонд формируется из взносов членов. " \
+                                                "Размер взноса зависит от уровня ответственности."
+    assert trim_to_tokens(TEXT, 5, counter) == ""
+
+
+def test_build_context_respects_budget_and_order():
+    counter = WordCounter()
+    docs = [passage(0, 0, TEXT * 5), passage(1, 0, TEXT, name="Положение.pdf")]
+    context = build_context(docs, 60, counter)
+    assert context.tokens <= 60
+    assert counter.count(context.text) <= 60
+    assert [d["name"] for d in context.docs] == ["Устав.pdf"]
+    assert context.text.startswith("Документ: Устав.pdf, стр. 1\n")
+    assert context.text.endswith(".")
+
+
+def test_build_context_merges_overlapping_passages():
+    counter = WordCounter()
+    full = TEXT * 2
+    first, second = full[:120], full[80:200]
+    context = build_context([passage(0, 0, first), passage(0, 80, second)], 1000, counter)
+    assert len(context.docs) == 1
+    assert context.docs[0]["text"] == full[:200]
+    assert (context.docs[0]["start"], context.docs[0]["end"]) == (0, 200)
+    # Вложенный фрагмент ничего не добавляет
+    again = build_context([passage(0, 0, full[:200]), passage(0, 50, full[50:100])], 1000, counter)
+    assert again.text == context.text
+
+
+def test_build_messages_clips_unbounded_context():
+    with patch("app.services.ai_service.settings.context_max_tokens", 20):
+        msgs = _build_messages("Что такое СРО?", TEXT * 50)
+    assert len(msgs[0]["content"]) < len(TEXT * 2) + 300
@@ -0,0 +1,190 @@
+import asyncio
+import numpy as np
+import pytest
+from app.services import document_service
+from app.services.document_service import DocumentService
+
+
+@pytest.fixture
+def service(embedding_model):
+    return DocumentService(test_mode=True, cache_dir="")
+
+
+@pytest.fixture
+def make_doc(service, tmp_path, monkeypatch):
+    def _make(name, text):
+        path = tmp_path / name
+        path.write_text(text, encoding="utf-8")
+        return str(path)
+    monkeypatch.setattr(service, "_extract_pages_from_docx", lambda path: [open(path, encoding="utf-8").read()])
+    return _make
+
+
+@pytest.mark.asyncio
+async def test_add_document_is_searchable(service, make_doc):
+    doc_id = await service.add_document(make_doc("fund.docx", "компенсационный фонд взносы"))
+    await service.add_document(make_doc("other.docx", "страхование ответственности"))
+
+    results = await service.search("компенсационный фонд", top_k=1)
+    assert results[0]["doc_id"] == doc_id
+    assert results[0]["name"] == "fund.docx"
+    assert "компенсационный" in results[0]["text"]
+
+
+@pytest.mark.asyncio
+async def test_add_same_content_is_idempotent(service, make_doc):
+    path = make_doc("fund.docx", "компенсационный фонд")
+    first = await service.add_document(path)
+    second = await service.add_document(path)
+    assert first == second
+    assert service.index.ntotal == 1
+
+
+@pytest.mark.asyncio
+async def test_remove_document_hides_passages(service, make_doc):
+    doc_id = await service.add_document(make_doc("fund.docx", "компенсационный фонд"))
+    await service.add_document(make_doc("other.docx", "страхование ответственности"))
+
+    assert await service.remove_document(doc_id)
+    assert not await service.remove_document(doc_id)
+    results = await service.search("компенсационный фонд", top_k=5)
+    assert all(r["doc_id"] != doc_id for r in results)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_searches_are_batched(service, make_doc):
+    await service.add_document(make_doc("fund.docx", "компенсационный фонд"))
+    await service.add_document(make_doc("other.docx", "страхование ответственности"))
+    service.model.encode.reset_mock()
+
+    results = await asyncio.gather(
+        service.search("компенсационный фонд", top_k=1),
+        service.search("страхование", top_k=1),
+        service.search("взносы", top_k=2, min_score=0.0),
+    )
+    assert service.model.encode.call_count == 1
+    assert results[0][0]["name"] == "fund.docx"
+    assert results[1][0]["name"] == "other.docx"
+    assert len(results[2]) == 2
+
+
+@pytest.mark.asyncio
+async def test_scores_are_cosine_similarities(service, make_doc):
+    await service.add_document(make_doc("fund.docx", "компенсационный фонд"))
+    await service.add_document(make_doc("other.docx", "компенсационный фонд страхование"))
+
+    results = await service.search("компенсационный фонд", min_score=0.0)
+    assert [r["name"] for r in results] == ["fund.docx", "other.docx"]
+    assert results[0]["score"] == pytest.approx(1.0, abs=1e-5)
+    assert results[1]["score"] == pytest.approx(2 / 6 ** 0.5, abs=1e-5)
+    embedding = await service.embed_query("компенсационный фонд")
+    assert np.linalg.norm(embedding) == pytest.approx(1.0, abs=1e-5)
+
+
+@pytest.mark.asyncio
+async def test_min_score_drops_irrelevant_passages(service, make_doc):
+    await service.add_document(make_doc("fund.docx", "компенсационный фонд"))
+    await service.add_document(make_doc("other.docx", "страхование ответственности"))
+
+    results = await service.search("компенсационный фонд", top_k=5, min_score=0.5)
+    assert [r["name"] for r in results] == ["fund.docx"]
+    assert await service.search("членские взносы", min_score=0.5) == []
+    # Порог применяется к закэшированной выдаче, а не к ключу кэша
+    assert len(await service.search("компенсационный фонд", top_k=5, min_score=-1.0)) == 2
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_finds_other_word_forms(service, make_doc):
+    # Мешок слов не связывает «фонда» и «фонд»: такой фрагмент находит только BM25 со стеммингом
+    await service.add_document(make_doc("insurance.docx", "фонд страхования"))
+    await service.add_document(make_doc("fees.docx", "фонд взносы"))
+    await service.add_document(make_doc("fund.docx", "компенсационного фонда"))
+
+    results = await service.search("компенсационный фонд", top_k=2, min_score=-1.0)
+    assert "fund.docx" in [r["name"] for r in results]
+    # score — по-прежнему косинусное сходство, а не оценка слияния
+    assert [r["score"] for r in results if r["name"] == "fund.docx"] == [pytest.approx(0.0, abs=1e-5)]
+
+    service.hybrid = False
+    service.search_cache.invalidate()
+    results = await service.search("компенсационный фонд", top_k=2, min_score=-1.0)
+    assert "fund.docx" not in [r["name"] for r in results]
+
+
+@pytest.mark.asyncio
+async def test_lexical_matches_bypass_min_score(service, make_doc):
+    # Порог по умолчанию (0.3) отсекает только фрагменты, которые нашёл один векторный поиск
+    await service.add_document(make_doc("fund.docx", "компенсационного фонда"))
+    await service.add_document(make_doc("fees.docx", "членские взносы"))
+
+    results = await service.search("компенсационный фонд", top_k=2)
+    assert [r["name"] for r in results] == ["fund.docx"]
+    assert results[0]["score"] < service.min_score
+
+
+@pytest.mark.asyncio
+async def test_weak_lexical_match_keeps_min_score(service, make_doc):
+    # Совпадение только по частому слову «фонд» не обходит порог косинуса
+    await service.add_document(make_doc("insurance.docx", "фонда страхования"))
+    await service.add_document(make_doc("fees.docx", "фонда взносы"))
+    await service.add_document(make_doc("fund.docx", "компенсационного фонда"))
+
+    results = await service.search("компенсационный фонд", top_k=3)
+    assert [r["name"] for r in results] == ["fund.docx"]
+    assert results[0]["score"] < service.min_score
+
+
+@pytest.mark.asyncio
+async def test_repeated_query_served_from_cache(service, make_doc):
+    await service.add_document(make_doc("fund.docx", "компенсационный фонд"))
+    service.model.encode.reset_mock()
+
+    first = await service.search("Компенсационный  фонд?")
+    second = await service.search("компенсационный фонд")
+    assert first == second
+    assert service.model.encode.call_count == 1
+    assert service.search_cache.local.hits == 1
+
+    # Новая версия индекса: результаты пересчитываются, эмбеддинг берётся из кэша
+    await service.add_document(make_doc("other.docx", "компенсационный фонд страхование"))
+    service.model.encode.reset_mock()
+    third = await service.search("компенсационный фонд")
+    assert len(third) == 2
+    assert service.model.encode.call_count == 0
+
+
+@pytest.mark.asyncio
+async def test_shared_cache_separates_passage_layouts(service, make_doc):
+    # Реплика A: документ удалён, но его строки остались в таблице фрагментов
+    removed = await service.add_document(make_doc("old.docx", "страхование ответственности"))
+    await service.add_document(make_doc("fund.docx", "компенсационный фонд"))
+    await service.remove_document(removed)
+    # Реплика B с тем же активным корпусом и общим кэшем (как общий Redis)
+    replica = DocumentService(test_mode=True, cache_dir="")
+    replica._extract_pages_from_docx = service._extract_pages_from_docx
+    replica.search_cache = service.search_cache
+    await replica.add_document(make_doc("fund.docx", "компенсационный фонд"))
+    assert replica.index_version == service.index_version
+    assert replica.layout_version != service.layout_version
+
+    first = await service.search("компенсационный фонд", min_score=0.0)
+    second = await replica.search("компенсационный фонд", min_score=0.0)
+    assert [r["text"] for r in first] == [r["text"] for r in second] == ["компенсационный фонд"]
+
+
+@pytest.mark.asyncio
+async def test_corpus_is_loaded_lazily(embedding_model, monkeypatch, tmp_path):
+    (tmp_path / "fund.docx").write_text("компенсационный фонд", encoding="utf-8")
+    load_model = document_service._load_model
+    monkeypatch.setattr(document_service, "DOCS_DIRS", [str(tmp_path)])
+
+    service = DocumentService(cache_dir="")
+    monkeypatch.setattr(service, "_extract_pages_from_docx", lambda path: [open(path, encoding="utf-8").read()])
+    # Создание сервиса не загружает модель и корпус
+    assert not service.ready
+    load_model.assert_not_called()
+
+    results = await service.search("компенсационный фонд")
+    assert service.ready
+    assert results[0]["name"] == "fund.docx"
+    load_model.assert_called_once()
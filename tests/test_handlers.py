@@ -1,5 +1,5 @@
 import pytest
-from unittest.mock import AsyncMock, patch, ANY
+from unittest.mock import AsyncMock, MagicMock, patch, ANY
 from aiogram.types import Message
 from app.bot.handlers import profile_handler, start_registration, process_inn
 from app.database.connection import get_user, upsert_user
@@ -18,3 +18,65 @@ async def test_profile_handler_member(mock_message):
         mock_message.answer.assert_called_with("ИНН: 123456789012\nСтатус: Член СРО", reply_markup=ANY)
 
 # Другие unit-тесты для handlers
+
+@pytest.mark.asyncio
+async def test_stream_reply_throttles_edits(mock_message):
+    from app.bot.handlers import _stream_reply
+
+    async def chunks():
+        for text in ["Первая ", "вторая ", "третья"]:
+            yield text
+
+    placeholder = AsyncMock()
+    with patch('app.bot.handlers.settings.stream_edit_interval', 60):
+        await _stream_reply(placeholder, chunks(), "\n\nИсточники")
+
+    # Первая часть показывается сразу, затем только финальная правка
+    edits = [call.args[0] for call in placeholder.edit_text.call_args_list]
+    assert edits == ["Первая ", "Первая вторая третья\n\nИсточники"]
+
+
+@pytest.mark.asyncio
+async def test_streamed_answer_edits_placeholder(mock_message):
+    from aiogram.exceptions import TelegramBadRequest
+    from aiogram.types import ReplyKeyboardMarkup
+    from app.bot.handlers import ai_answer
+
+    placeholder = AsyncMock()
+
+    async def answer(text, reply_markup=None, **kwargs):
+        # Как Telegram: сообщение с reply-клавиатурой редактировать нельзя
+        if isinstance(reply_markup, ReplyKeyboardMarkup):
+            placeholder.edit_text.side_effect = TelegramBadRequest(MagicMock(), "message can't be edited")
+        return placeholder
+
+    async def stream(*args):
+        yield "Ответ"
+
+    mock_message.text = "Размер компенсационного фонда?"
+    mock_message.answer = AsyncMock(side_effect=answer)
+    with patch('app.bot.handlers.get_user', AsyncMock(return_value=None)), \
+            patch('app.bot.handlers.check_question_limit', AsyncMock(return_value=MagicMock(allowed=True))), \
+            patch('app.bot.handlers.doc_service.search', AsyncMock(return_value=[])), \
+            patch('app.bot.handlers.ask_ai_stream', stream), \
+            patch('app.bot.handlers.settings.stream_answers', True), \
+            patch('app.bot.handlers.settings.rerank_enabled', False):
+        await ai_answer(mock_message)
+
+    mock_message.answer.assert_awaited_once()
+    assert placeholder.edit_text.await_args.args[0] == "Ответ"
+    placeholder.answer.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_failed_final_edit_sends_answer():
+    from aiogram.exceptions import TelegramBadRequest
+    from app.bot.handlers import _stream_reply
+
+    async def chunks():
+        yield "Ответ"
+
+    placeholder = AsyncMock()
+    placeholder.edit_text.side_effect = TelegramBadRequest(MagicMock(), "message can't be edited")
+    await _stream_reply(placeholder, chunks(), "")
+    placeholder.answer.assert_awaited_once_with("Ответ", reply_markup=ANY)
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from app.services.document_service import EMBEDDING_DIM
+from app.services.index_cache import IndexCache
+from app.services import ingest as ingest_module
+from app.services.ingest import extract_pdf_pages, ingest, list_documents
+
+
+@pytest.fixture
+def read_text(corpus_texts):
+    # Разбор без файлов: текст берётся из корпуса по имени файла
+    return lambda path: [corpus_texts[path.rsplit("/", 1)[-1]]]
+
+
+def test_vectors_follow_document_order(tmp_path, corpus_texts, read_text, fake_encode):
+    for name in corpus_texts:
+        (tmp_path / name).write_text("", encoding="utf-8")
+    encode = MagicMock(side_effect=fake_encode)
+    files, vectors, stats = ingest(list_documents([str(tmp_path)]), encode, EMBEDDING_DIM,
+                                   workers=1, batch_size=4, extract=read_text)
+
+    assert [f.path.rsplit("/", 1)[-1] for f in files] == sorted(corpus_texts)
+    assert vectors.dtype == np.float32 and vectors.shape == (stats.passages, EMBEDDING_DIM)
+    for f in files:
+        assert np.shares_memory(f.vectors, vectors)
+        text = "\n".join(f.pages)
+        expected = fake_encode([text[s:e] for s, e in zip(f.table["start"], f.table["end"])])
+        assert np.array_equal(f.vectors, expected)
+
+    # Батчи не больше batch_size, фрагменты — по убыванию длины
+    batches = [call.args[0] for call in encode.call_args_list]
+    assert all(len(batch) <= 4 for batch in batches)
+    lengths = [len(text) for batch in batches for text in batch]
+    assert lengths == sorted(lengths, reverse=True)
+
+
+def test_cached_files_are_not_reencoded(tmp_path, corpus_texts, read_text, fake_encode):
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    for name in corpus_texts:
+        (docs_dir / name).write_text(name, encoding="utf-8")
+    cache = IndexCache(str(tmp_path / "cache"), "fp")
+    paths = list_documents([str(docs_dir)])
+    _, first, _ = ingest(paths, fake_encode, EMBEDDING_DIM, cache=cache, workers=1, extract=read_text)
+
+    encode = MagicMock(side_effect=fake_encode)
+    _, second, stats = ingest(paths, encode, EMBEDDING_DIM, cache=cache, workers=1, extract=read_text)
+    encode.assert_not_called()
+    assert stats.cached == len(corpus_texts)
+    assert np.array_equal(first, second)
+
+
+def test_process_pool_extraction(tmp_path, corpus_texts, make_docx, fake_encode):
+    for name, text in corpus_texts.items():
+        make_docx(tmp_path, name, text)
+    paths = list_documents([str(tmp_path)])
+    files, vectors, stats = ingest(paths, fake_encode, EMBEDDING_DIM, workers=2)
+    inline_files, inline_vectors, _ = ingest(paths, fake_encode, EMBEDDING_DIM, workers=1)
+
+    assert stats.passages > len(corpus_texts)
+    assert [f.pages for f in files] == [f.pages for f in inline_files]
+    assert np.array_equal(vectors, inline_vectors)
+
+
+def test_encoding_overlaps_extraction(tmp_path, corpus_texts, read_text, fake_encode, monkeypatch):
+    for name in corpus_texts:
+        (tmp_path / name).write_text("", encoding="utf-8")
+    monkeypatch.setattr(ingest_module, "ENCODE_WINDOW_BATCHES", 1)
+    calls = []
+
+    def extract(path):
+        calls.append("extract")
+        return read_text(path)
+
+    def encode(texts):
+        calls.append("encode")
+        return fake_encode(texts)
+
+    paths = list_documents([str(tmp_path)])
+    _, vectors, _ = ingest(paths, encode, EMBEDDING_DIM, workers=1, batch_size=1, extract=extract)
+    _, expected, _ = ingest(paths, fake_encode, EMBEDDING_DIM, workers=1, extract=read_text)
+    # Первые фрагменты кодируются до разбора последнего файла
+    assert calls.index("encode") < len(calls) - 1 - calls[::-1].index("extract")
+    assert np.array_equal(vectors, expected)
+
+
+def test_unreadable_pdf_is_logged(tmp_path, caplog):
+    path = tmp_path / "broken.pdf"
+    path.write_bytes(b"not a pdf")
+    assert extract_pdf_pages(str(path)) == []
+    assert "broken.pdf" in caplog.text
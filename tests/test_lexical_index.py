@@ -0,0 +1,63 @@
+import numpy as np
+from app.services.index_cache import IndexCache
+from app.services.lexical_index import LexicalIndex, rrf_fuse, stem, tokenize
+
+
+def test_stem_merges_word_forms():
+    assert stem("компенсационного") == stem("компенсационный")
+    assert stem("фонда") == stem("фондов") == "фонд"
+    assert stem("ответственности") == "ответствен"
+
+
+def test_tokenize_keeps_numbers_and_abbreviations():
+    tokens = tokenize("Согласно ст. 55.16 ГрК РФ взносы в КФ ОДО, ИНН 7707083893")
+    assert "55.16" in tokens
+    assert "7707083893" in tokens
+    assert {"кф", "одо", "грк", "ст"} <= set(tokens)
+    # Служебные слова отбрасываются
+    assert "в" not in tokens
+
+
+def test_bm25_ranks_exact_matches_first():
+    index = LexicalIndex()
+    index.add([
+        "Компенсационный фонд возмещения вреда",
+        "Статья 55.16 Градостроительного кодекса: компенсационный фонд обеспечения договорных обязательств",
+        "Страхование гражданской ответственности членов",
+    ])
+    assert index.search("ст. 55.16", top_k=3)[0][0] == 1
+    assert index.search("компенсационного фонда", top_k=3)[0][0] == 0
+    assert index.search("страхованием", top_k=1) == [(2, index.search("страхование", top_k=1)[0][1])]
+    assert index.search("налог", top_k=3) == []
+
+
+def test_max_score_bounds_search_scores():
+    index = LexicalIndex()
+    index.add(["компенсационный фонд", "фонд страхования", "фонд взносы"])
+    ceiling = index.max_score("компенсационного фонда")
+    (best, best_score), *rest = index.search("компенсационного фонда", top_k=3)
+    assert best == 0
+    assert 0.3 * ceiling < best_score < ceiling
+    assert all(score < 0.3 * ceiling for _, score in rest)
+    assert index.max_score("налог") == 0.0
+
+
+def test_add_appends_rows_and_roundtrips(tmp_path):
+    index = LexicalIndex()
+    index.add(["компенсационный фонд", "страхование"])
+    index.add(["фонд ОДО"])
+    assert len(index) == 3
+    assert sorted(row for row, _ in index.search("фонд", top_k=5)) == [0, 2]
+
+    cache = IndexCache(str(tmp_path), "fp")
+    cache.save_lexical(index.to_arrays(), ["a", "b"])
+    assert cache.load_lexical(["b", "a"]) is None
+    restored = LexicalIndex.from_arrays(cache.load_lexical(["a", "b"]))
+    assert restored.vocab == index.vocab
+    assert np.array_equal(restored.rows, index.rows)
+    assert restored.search("одо", top_k=5) == index.search("одо", top_k=5)
+
+
+def test_rrf_fuse_prefers_rows_ranked_by_both():
+    assert rrf_fuse([[1, 2, 3], [3, 1]]) == [1, 3, 2]
+    assert rrf_fuse([[], [5]]) == [5]
@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock
+from app.database.log_writer import BotLogWriter
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    conn = MagicMock()
+    conn.prepared = {}
+    conn.execute = AsyncMock()
+    conn.copy_records_to_table = AsyncMock()
+
+    @asynccontextmanager
+    async def acquire(timeout=None):
+        yield conn
+
+    pool = MagicMock()
+    pool.acquire = acquire
+    monkeypatch.setattr("app.database.log_writer.db.pool", pool)
+    return conn
+
+
+def _written(conn):
+    return [len(call.kwargs["records"]) for call in conn.copy_records_to_table.await_args_list]
+
+
+@pytest.mark.asyncio
+async def test_flushes_every_batch_size_records(fake_pool):
+    writer = BotLogWriter(batch_size=3, flush_ms=10000)
+    await writer.start()
+    for i in range(7):
+        await writer.log(i, "ai_answer", "ok", 12.5)
+    await asyncio.sleep(0.05)
+    # Две полные пачки записаны сразу, хвост ждёт таймера
+    assert _written(fake_pool) == [3, 3]
+
+    await writer.stop()
+    assert _written(fake_pool) == [3, 3, 1]
+    record = fake_pool.copy_records_to_table.await_args_list[0].kwargs["records"][0]
+    assert record[:4] == (0, "ai_answer", "ok", 12)
+
+
+@pytest.mark.asyncio
+async def test_flushes_after_interval(fake_pool):
+    writer = BotLogWriter(batch_size=100, flush_ms=20)
+    await writer.start()
+    await writer.log(1, "profile_handler", "ok", 3)
+    await asyncio.sleep(0.1)
+    assert _written(fake_pool) == [1]
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_drops_when_queue_is_full(fake_pool):
+    writer = BotLogWriter(maxsize=2, batch_size=100, flush_ms=10000)
+    await writer.start()
+    # Фоновая задача ещё не забрала записи: очередь заполняется
+    for i in range(5):
+        await writer.log(i, "ai_answer", "ok", 1)
+    assert writer.dropped >= 2
+
+    await writer.stop()
+    # Записи после остановки игнорируются
+    await writer.log(99, "ai_answer", "ok", 1)
+    assert sum(_written(fake_pool)) == 5 - writer.dropped
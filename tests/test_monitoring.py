@@ -0,0 +1,24 @@
+from types import SimpleNamespace
+from app.monitoring import LLM_TOKENS, STAGE_LATENCY, record_usage, span
+
+
+def _sample(metric, name, **labels):
+    for family in metric.collect():
+        for sample in family.samples:
+            if sample.name == name and sample.labels == labels:
+                return sample.value
+    return 0.0
+
+
+def test_span_observes_stage():
+    before = _sample(STAGE_LATENCY, "sro_bot_stage_latency_seconds_count", stage="test_stage")
+    with span("test_stage"):
+        pass
+    assert _sample(STAGE_LATENCY, "sro_bot_stage_latency_seconds_count", stage="test_stage") == before + 1
+
+
+def test_record_usage_counts_tokens():
+    before = _sample(LLM_TOKENS, "sro_bot_llm_tokens_total", kind="completion")
+    record_usage(SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15))
+    record_usage(None)
+    assert _sample(LLM_TOKENS, "sro_bot_llm_tokens_total", kind="completion") == before + 5
@@ -0,0 +1,57 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.rate_limiter import RateLimiter, Policy, format_reset, parse_policy
+
+
+def _redis(result):
+    client = MagicMock()
+    script = AsyncMock(return_value=result)
+    client.register_script.return_value = script
+    return client, script
+
+
+def test_parse_policy():
+    assert parse_policy("fixed:3/86400") == Policy("fixed", 3, 86400)
+    assert parse_policy("bucket:10/3600").kind == "bucket"
+    with pytest.raises(ValueError):
+        parse_policy("daily:3/86400")
+    with pytest.raises(ValueError):
+        parse_policy("fixed:3")
+
+
+@pytest.mark.asyncio
+async def test_check_is_one_script_call():
+    client, script = _redis([1, 2, 3_600_000])
+    limiter = RateLimiter(lambda: client, {"guest": "sliding:3/86400"})
+
+    result = await limiter.check(123, "guest")
+    assert result.allowed is True
+    assert result.remaining == 2
+    assert result.reset_in == 3600.0
+    # Один EVALSHA на проверку: подсчёт, TTL и отказ выполняются в скрипте
+    script.assert_awaited_once()
+    assert script.await_args.kwargs["keys"] == ["ratelimit:sliding:guest:123"]
+    assert script.await_args.kwargs["args"][:3] == ["sliding", 3, 86_400_000]
+
+
+@pytest.mark.asyncio
+async def test_check_denied_and_unlimited_roles():
+    client, script = _redis([0, 0, 90_000])
+    limiter = RateLimiter(lambda: client, {"guest": "fixed:3/86400"})
+
+    result = await limiter.check(1, "guest")
+    assert not result.allowed
+    assert format_reset(result.reset_in) == "2 мин"
+
+    member = await limiter.check(1, "member")
+    assert member.allowed and member.remaining is None
+    script.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_redis_failure_allows_question():
+    client, script = _redis(None)
+    script.side_effect = ConnectionError("redis is down")
+    limiter = RateLimiter(lambda: client, {"guest": "fixed:3/86400"})
+    assert (await limiter.check(1, "guest")).allowed
+    assert (await RateLimiter(lambda: None, {"guest": "fixed:3/86400"}).check(1, "guest")).allowed
@@ -0,0 +1,97 @@
+import asyncio
+import time
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from app.services import reranker as reranker_module
+from app.services.reranker import Reranker
+
+
+def overlap_scores(pairs, **kwargs):
+    # «Cross-encoder»: число общих слов вопроса и фрагмента
+    return np.array([len(set(q.split()) & set(t.split())) for q, t in pairs], dtype="float32")
+
+
+def make_docs(*texts):
+    return [{"doc_id": i, "start": 0, "end": len(t), "name": f"{i}.pdf", "text": t, "score": 0.5}
+            for i, t in enumerate(texts)]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = MagicMock()
+    model.predict.side_effect = overlap_scores
+    monkeypatch.setattr(reranker_module, "_load_model", MagicMock(return_value=model))
+    return model
+
+
+@pytest.mark.asyncio
+async def test_rerank_reorders_and_caches(model):
+    reranker = Reranker("cross", top_n=3, budget_ms=5000)
+    docs = make_docs("страхование ответственности", "размер компенсационного фонда", "фонд", "хвост")
+
+    result = await reranker.rerank("размер компенсационного фонда", docs, "v1")
+    assert [d["doc_id"] for d in result] == [1, 0, 2, 3]
+    assert result[0]["rerank_score"] == 3.0
+    assert "rerank_score" not in result[3]
+
+    again = await reranker.rerank("Размер компенсационного  фонда?", docs, "v1")
+    assert again == result
+    assert model.predict.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_queries_share_one_forward_pass(model):
+    reranker = Reranker("cross", top_n=5, budget_ms=5000)
+    docs = make_docs("компенсационный фонд", "страхование")
+    results = await asyncio.gather(
+        reranker.rerank("страхование", docs),
+        reranker.rerank("компенсационный фонд", docs),
+    )
+    assert model.predict.call_count == 1
+    assert len(model.predict.call_args.args[0]) == 4
+    assert results[0][0]["doc_id"] == 1
+    assert results[1][0]["doc_id"] == 0
+
+
+@pytest.mark.asyncio
+async def test_budget_exceeded_keeps_search_order(model):
+    def slow(pairs, **kwargs):
+        time.sleep(0.2)
+        return overlap_scores(pairs)
+    model.predict.side_effect = slow
+    reranker = Reranker("cross", top_n=5, budget_ms=20)
+    docs = make_docs("страхование", "компенсационный фонд")
+
+    assert await reranker.rerank("компенсационный фонд", docs) == docs
+    # Досчитанная оценка попадает в кэш и используется следующим вопросом
+    await asyncio.sleep(0.4)
+    result = await reranker.rerank("компенсационный фонд", docs)
+    assert result[0]["doc_id"] == 1
+    assert model.predict.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_model_error_keeps_search_order(model):
+    model.predict.side_effect = RuntimeError("oom")
+    reranker = Reranker("cross", budget_ms=5000)
+    docs = make_docs("страхование", "компенсационный фонд")
+    assert await reranker.rerank("фонд", docs) == docs
+
+
+@pytest.mark.asyncio
+async def test_backlog_over_limit_is_skipped(model):
+    def slow(pairs, **kwargs):
+        time.sleep(0.2)
+        return overlap_scores(pairs)
+    model.predict.side_effect = slow
+    reranker = Reranker("cross", budget_ms=20, cache_size=0, max_pending=1)
+    docs = make_docs("страхование", "компенсационный фонд")
+
+    assert await reranker.rerank("компенсационный фонд", docs) == docs
+    # Первая оценка ещё считается после таймаута: вторая в очередь не ставится
+    assert await reranker.rerank("страхование", docs) == docs
+    await asyncio.sleep(0.4)
+    assert model.predict.call_count == 1
+    assert reranker._pending == 0
+    reranker.close()
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import numpy as np
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock
+from app.services import document_service
+from app.services.document_service import DocumentService
+from app.services.retrieval_client import RetrievalClient, RetrievalError
+from app.services.retrieval_worker import RetrievalServer
+
+
+@pytest.fixture
+def local_service(embedding_model, monkeypatch, tmp_path):
+    service = DocumentService(test_mode=True, cache_dir="")
+    monkeypatch.setattr(service, "_extract_pages_from_docx", lambda path: [open(path, encoding="utf-8").read()])
+    return service
+
+
+@pytest.fixture
+def make_doc(tmp_path):
+    def _make(name, text):
+        path = tmp_path / name
+        path.write_text(text, encoding="utf-8")
+        return str(path)
+    return _make
+
+
+@pytest_asyncio.fixture
+async def server(local_service, tmp_path):
+    server = RetrievalServer(local_service, str(tmp_path / "retrieval.sock"))
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_client_searches_through_worker(server, local_service, make_doc):
+    client = RetrievalClient(server.socket_path, pool_size=2)
+    doc_id = await client.add_document(make_doc("fund.docx", "компенсационный фонд взносы"))
+    await client.add_document(make_doc("other.docx", "страхование ответственности"))
+
+    results = await client.search("компенсационный фонд", top_k=1)
+    assert results[0]["doc_id"] == doc_id
+    assert results[0]["name"] == "fund.docx"
+    assert client.index_version == local_service.index_version
+
+    embedding = await client.embed_query("компенсационный фонд")
+    assert embedding.dtype == np.float32 and embedding.shape == (document_service.EMBEDDING_DIM,)
+
+    assert await client.remove_document(doc_id) is True
+    assert all(r["doc_id"] != doc_id for r in await client.search("компенсационный фонд"))
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_worker_errors_are_raised(server):
+    client = RetrievalClient(server.socket_path)
+    with pytest.raises(RetrievalError):
+        await client.add_document("/nonexistent/file.txt")
+    # Соединение остаётся рабочим после ошибки
+    assert await client.search("фонд") == []
+    await client.close()
+
+
+def _fake_connection(client, data: bytes = b""):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    writer = MagicMock()
+    writer.drain = AsyncMock()
+    client._connect = AsyncMock(return_value=(reader, writer))
+    return writer
+
+
+@pytest.mark.asyncio
+async def test_truncated_response_discards_connection():
+    client = RetrievalClient("/nonexistent.sock")
+    writer = _fake_connection(client, b'{"ok": tr\n')
+    with pytest.raises(json.JSONDecodeError):
+        await client.search("фонд")
+    writer.close.assert_called_once()
+    assert client._idle == []
+
+
+@pytest.mark.asyncio
+async def test_cancelled_call_discards_connection():
+    client = RetrievalClient("/nonexistent.sock")
+    writer = _fake_connection(client)
+    task = asyncio.create_task(client.search("фонд"))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    # Ответ на отменённый запрос не достанется следующему вызывающему
+    writer.close.assert_called_once()
+    assert client._idle == []
+
+
+@pytest.mark.asyncio
+async def test_in_process_fallback(local_service, make_doc, tmp_path):
+    client = RetrievalClient(str(tmp_path / "missing.sock"), fallback=lambda: local_service)
+    await client.add_document(make_doc("fund.docx", "компенсационный фонд"))
+    results = await client.search("компенсационный фонд")
+    assert results[0]["name"] == "fund.docx"
+
+    with pytest.raises(OSError):
+        await RetrievalClient(str(tmp_path / "missing.sock")).search("фонд")
+
+
+@pytest.mark.asyncio
+async def test_stale_pooled_connection_is_replaced(server, local_service, make_doc):
+    await local_service.add_document(make_doc("fund.docx", "компенсационный фонд"))
+    # Соединение из пула, закрытое перезапущенным процессом поиска
+    reader = asyncio.StreamReader()
+    reader.feed_eof()
+    stale = MagicMock()
+    stale.drain = AsyncMock()
+    client = RetrievalClient(server.socket_path, fallback=MagicMock())
+    client._idle.append((reader, stale))
+
+    results = await client.search("компенсационный фонд")
+    assert results[0]["name"] == "fund.docx"
+    stale.close.assert_called_once()
+    client._fallback_factory.assert_not_called()
+    assert len(client._idle) == 1
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_fallback_is_created_once_and_expires(local_service, make_doc, tmp_path):
+    await local_service.add_document(make_doc("fund.docx", "компенсационный фонд"))
+    factory = MagicMock(return_value=local_service)
+    socket_path = str(tmp_path / "retrieval.sock")
+    client = RetrievalClient(socket_path, fallback=factory, fallback_retry=60)
+
+    results = await asyncio.gather(*(client.search("компенсационный фонд") for _ in range(3)))
+    assert all(r[0]["name"] == "fund.docx" for r in results)
+    factory.assert_called_once()
+
+    # Процесс поиска снова доступен: после истечения срока клиент возвращается к сокету
+    server = RetrievalServer(local_service, socket_path)
+    await server.start()
+    await client.search("компенсационный фонд")
+    assert client._idle == []
+    client._fallback_until = 0.0
+    await client.search("компенсационный фонд")
+    assert len(client._idle) == 1
+    await client.close()
+    await server.close()
@@ -0,0 +1,130 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.services.registry_sync import RegistrySync
+from app.services.registry_parser import RegistryParser, available_parsers, get_parser
+from app.services.sro_registry_service import (
+    SRORegistryService,
+    get_registry_parser,
+    parse_page_count,
+    parse_registry_page,
+)
+
+REGISTRY_PAGE = """
+<table class="table table-bordered table-striped">
+  <tr><th>№</th><th>Наименование</th><th>ИНН</th><th>Дата</th><th>Статус</th></tr>
+  <tr><td>1</td><td>ООО «Ромашка»</td><td>5260000001</td><td>01.01.2010</td><td>Член СРО</td></tr>
+  <tr><td>2</td><td>ООО «Лютик»</td><td>5260000002</td><td>02.02.2012</td><td>Исключен</td></tr>
+</table>
+<a href="/reestr/?PAGEN_1=2">2</a><a href="/reestr/?PAGEN_1=12">12</a>
+"""
+
+
+def test_parse_registry_page():
+    members = parse_registry_page(REGISTRY_PAGE)
+    assert [m["inn"] for m in members] == ["5260000001", "5260000002"]
+    assert members[0]["is_member"] is True
+    assert members[1]["is_member"] is False
+    assert parse_page_count(REGISTRY_PAGE) == 12
+
+
+@pytest.mark.parametrize("backend", available_parsers())
+def test_parser_backends_agree(backend):
+    parser = get_parser(backend)
+    assert list(parser.iter_rows(REGISTRY_PAGE)) == list(get_parser("bs4").iter_rows(REGISTRY_PAGE))
+    row = parser.find_inn(REGISTRY_PAGE, "5260000002")
+    assert row.name == "ООО «Лютик»"
+    assert row.status == "Исключен"
+    assert parser.find_inn(REGISTRY_PAGE, "0000000000") is None
+
+
+def test_registry_parser_is_resolved_once(monkeypatch):
+    from app.services import sro_registry_service
+    get_registry_parser.cache_clear()
+    monkeypatch.setattr(sro_registry_service.settings, "registry_parser", "bs4")
+    try:
+        parser = SRORegistryService().parser
+        assert parser.name == "bs4"
+        assert get_registry_parser() is parser
+    finally:
+        get_registry_parser.cache_clear()
+
+
+def test_incomplete_parser_cannot_be_created():
+    class RowsOnly(RegistryParser):
+        def _rows(self, html):
+            return iter(())
+
+    with pytest.raises(TypeError):
+        RowsOnly()
+
+
+@pytest.mark.asyncio
+async def test_check_membership_uses_replica():
+    service = SRORegistryService()
+    member = {"name": "ООО «Ромашка»", "inn": "5260000001", "status": "Член СРО",
+              "join_date": "01.01.2010", "is_member": True}
+    live = AsyncMock()
+    with patch('app.services.sro_registry_service.get_registry_member', AsyncMock(return_value=member)), \
+            patch.object(service, '_check_live', live):
+        result = await service.check_membership_by_inn("5260000001")
+
+    assert result["is_member"] is True
+    live.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_check_membership_falls_back_to_live():
+    service = SRORegistryService()
+    found = {"registry": "СРО НОСО", "name": "ООО «Ромашка»", "inn": "5260000001", "status": "Член СРО",
+             "join_date": "01.01.2010", "is_member": True, "registry_url": service.base_url}
+    upsert = AsyncMock()
+    with patch('app.services.sro_registry_service.get_registry_member', AsyncMock(return_value=None)), \
+            patch('app.services.sro_registry_service.upsert_registry_members', upsert), \
+            patch.object(service, '_check_live', AsyncMock(return_value=found)):
+        result = await service.check_membership_by_inn("5260000001")
+
+    assert result == found
+    upsert.assert_awaited_once_with([found])
+
+
+def _registry_page(first, count, pages=3):
+    rows = "".join(
+        f"<tr><td>{i}</td><td>ООО «{i}»</td><td>{5260000000 + i}</td><td>01.01.2010</td><td>Член СРО</td></tr>"
+        for i in range(first, first + count)
+    )
+    return (f'<table class="table table-bordered table-striped">'
+            f'<tr><th>№</th><th>Наименование</th><th>ИНН</th><th>Дата</th><th>Статус</th></tr>{rows}</table>'
+            f'<a href="/reestr/?PAGEN_1={pages}">{pages}</a>')
+
+
+async def _sync(pages, conn, upsert):
+    sync = RegistrySync(SRORegistryService(), interval=3600, page_delay=0)
+    sync.fetch_page = AsyncMock(side_effect=lambda page: pages[page - 1])
+    db = MagicMock()
+    db.acquire.return_value.__aenter__.return_value = conn
+    with patch('app.services.registry_sync.db', db), \
+            patch('app.services.registry_sync.ensure_registry_schema', AsyncMock()), \
+            patch('app.services.registry_sync.upsert_registry_members', upsert):
+        return await sync.sync_once()
+
+
+def _deletes(conn):
+    return [call for call in conn.execute.await_args_list if "DELETE" in call.args[0]]
+
+
+@pytest.mark.asyncio
+async def test_sync_prunes_after_complete_pass():
+    conn, upsert = AsyncMock(), AsyncMock()
+    await _sync([_registry_page(1, 2), _registry_page(3, 2), _registry_page(5, 1)], conn, upsert)
+    assert sum(len(call.args[0]) for call in upsert.await_args_list) == 5
+    assert len(_deletes(conn)) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("rows", [0, 1], ids=["empty", "short"])
+async def test_sync_incomplete_middle_page_prunes_nothing(rows):
+    # Страница 2 из 3 пустая или короткая: организации со страницы 3 не удаляются
+    conn, upsert = AsyncMock(), AsyncMock()
+    with pytest.raises(RuntimeError, match="incomplete"):
+        await _sync([_registry_page(1, 2), _registry_page(3, rows), _registry_page(5, 2)], conn, upsert)
+    assert not _deletes(conn)
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+# Модули, которые не должны загружаться при импорте бота: модель, индекс,
+# разбор документов и HTML реестра подгружаются лениво, SQLAlchemy — только для get_db
+HEAVY_MODULES = ("torch", "sentence_transformers", "faiss", "pypdf", "docx", "sqlalchemy",
+                 "bs4", "lxml", "selectolax")
+# Необязательный бюджет на импорт app.main, мс (0 — только отчёт)
+IMPORT_BUDGET_MS = int(os.getenv("STARTUP_IMPORT_BUDGET_MS", "0"))
+
+
+def import_profile(module: str):
+    """Профиль `python -X importtime -c "import <module>"`: [(модуль, self мкс, cumulative мкс)]."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def test_app_import_profile():
+    rows = import_profile("app.main")
+    top = sorted((r for r in rows if r[0].startswith("app")), key=lambda r: -r[2])[:10]
+    print("\nimport app.main, cumulative ms:")
+    for name, _, cumulative in top:
+        print(f"  {cumulative / 1000:9.1f}  {name}")
+
+    loaded = {name.split(".")[0] for name, _, _ in rows}
+    assert not loaded & set(HEAVY_MODULES), f"heavy modules imported at startup: {loaded & set(HEAVY_MODULES)}"
+    if IMPORT_BUDGET_MS:
+        total = next(cumulative for name, _, cumulative in rows if name == "app.main")
+        assert total / 1000 <= IMPORT_BUDGET_MS
@@ -0,0 +1,104 @@
+import os
+import pytest
+from unittest.mock import MagicMock
+from app.celery import celery
+from app.config import settings
+from app.services import document_service, tasks
+from app.services.document_service import DocumentService
+from app.services.index_artifact import latest_version, read_artifact
+
+
+@pytest.fixture
+def corpus(embedding_model, corpus_texts, make_docx, monkeypatch, tmp_path):
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    for name, text in corpus_texts.items():
+        make_docx(docs_dir, name, text)
+    monkeypatch.setattr(document_service, "DOCS_DIRS", [str(docs_dir)])
+    monkeypatch.setattr(tasks, "_service", None)
+    monkeypatch.setattr(settings, "index_artifact_dir", str(tmp_path / "artifacts"))
+    monkeypatch.setattr(settings, "index_cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(settings, "ingest_workers", 0)
+    monkeypatch.setattr(celery.conf, "task_always_eager", True)
+    return embedding_model
+
+
+def test_rebuild_publishes_artifact(corpus, corpus_texts):
+    result = tasks.rebuild_corpus.delay(shard_size=2).get()
+    version = result["version"]
+    assert result["shards"] == 2
+    assert latest_version(settings.index_artifact_dir) == version
+    assert tasks.rebuild_progress(version)["state"] == "done"
+    assert not os.path.exists(tasks._build_dir(version))
+
+    artifact = read_artifact(settings.index_artifact_dir)
+    assert [doc["name"] for doc in artifact.documents] == sorted(corpus_texts)
+    assert artifact.index.ntotal == len(artifact.passages) == artifact.manifest["passages"]
+    # Номера документов сквозные по всем шардам
+    assert sorted(set(artifact.passages["doc_id"])) == [0, 1, 2]
+
+    # Повторный запуск на том же корпусе ничего не пересчитывает
+    corpus.encode.reset_mock()
+    again = tasks.rebuild_corpus.delay(shard_size=2).get()
+    assert again == {"version": version, "state": "done", "shards": 0}
+    corpus.encode.assert_not_called()
+
+
+def test_shard_is_extracted_in_task_process(corpus, monkeypatch):
+    # Процесс prefork-воркера — демон: пул разбора внутри задачи создавать нельзя
+    ingest = MagicMock(wraps=tasks.ingest)
+    monkeypatch.setattr(tasks, "ingest", ingest)
+    tasks.rebuild_corpus.delay(shard_size=2).get()
+    assert ingest.call_count == 2
+    assert all(call.kwargs["workers"] == 1 for call in ingest.call_args_list)
+
+
+def test_rebuild_resumes_after_failure(corpus, corpus_texts, monkeypatch):
+    from app.services import vector_index
+    original = vector_index.build_index
+    monkeypatch.setattr(vector_index, "build_index", MagicMock(side_effect=MemoryError("boom")))
+    with pytest.raises(MemoryError):
+        tasks.rebuild_corpus.delay(shard_size=1)
+    version = tasks.plan_rebuild(shard_size=1)["version"]
+    progress = tasks.rebuild_progress(version)
+    assert progress["state"] == "running"
+    assert progress["shards_done"] == progress["shards_total"] == len(corpus_texts)
+    assert progress["files_done"] == progress["files_total"] == len(corpus_texts)
+
+    # Готовые шарды не кодируются заново, слияние доводит сборку до конца
+    monkeypatch.setattr(vector_index, "build_index", original)
+    monkeypatch.setattr(tasks, "ingest", MagicMock(side_effect=AssertionError("shard rebuilt")))
+    result = tasks.rebuild_corpus.delay(shard_size=1).get()
+    assert result["version"] == version
+    assert tasks.rebuild_progress(version)["state"] == "done"
+
+
+def test_resume_keeps_original_shard_layout(corpus, corpus_texts, monkeypatch):
+    from app.services import vector_index
+    original = vector_index.build_index
+    monkeypatch.setattr(vector_index, "build_index", MagicMock(side_effect=MemoryError("boom")))
+    with pytest.raises(MemoryError):
+        tasks.rebuild_corpus.delay(shard_size=1)
+
+    # Продолжение с другим размером шарда: используется разбиение начатой сборки
+    monkeypatch.setattr(vector_index, "build_index", original)
+    monkeypatch.setattr(tasks, "ingest", MagicMock(side_effect=AssertionError("shard rebuilt")))
+    result = tasks.rebuild_corpus.delay(shard_size=2).get()
+    assert result["shards"] == len(corpus_texts)
+    artifact = read_artifact(settings.index_artifact_dir)
+    assert artifact.version == result["version"]
+    assert [doc["name"] for doc in artifact.documents] == sorted(corpus_texts)
+
+
+@pytest.mark.asyncio
+async def test_service_loads_artifact(corpus, corpus_texts, monkeypatch):
+    tasks.rebuild_corpus.delay().get()
+    monkeypatch.setattr(settings, "index_artifact_load", True)
+    # Исходные файлы боту не нужны
+    monkeypatch.setattr(document_service, "DOCS_DIRS", [])
+    service = DocumentService(test_mode=True, cache_dir="")
+    service.load()
+
+    assert [doc["name"] for doc in service.documents] == sorted(corpus_texts)
+    results = await service.search("Членские взносы уплачиваются ежеквартально", top_k=1)
+    assert results[0]["name"] == "c.docx"
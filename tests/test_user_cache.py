@@ -0,0 +1,138 @@
+import asyncio
+import pytest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock
+from app.database import connection
+from app.database.connection import get_user, upsert_user, user_cache
+
+USER = {"id": 123, "inn": "5260000001", "is_member": True, "is_blocked": False, "role": "member"}
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    conn = MagicMock()
+    conn.prepared = {}
+    conn.fetchrow = AsyncMock(return_value=None)
+
+    @asynccontextmanager
+    async def acquire(timeout=None):
+        yield conn
+
+    pool = MagicMock()
+    pool.acquire = acquire
+    monkeypatch.setattr(connection.db, "pool", pool)
+    user_cache.clear()
+    yield conn
+    user_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_get_user_reads_through_cache(fake_pool):
+    fake_pool.fetchrow.return_value = USER
+    assert await get_user(123) == USER
+    assert await get_user(123) == USER
+    fake_pool.fetchrow.assert_awaited_once()
+    # Выбираются только нужные хендлерам колонки
+    assert "SELECT *" not in fake_pool.fetchrow.await_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_cached_profile_is_not_shared(fake_pool):
+    fake_pool.fetchrow.return_value = USER
+    first = await get_user(123)
+    first["role"] = "admin"
+    assert (await get_user(123))["role"] == "member"
+    fake_pool.fetchrow.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_unknown_user_is_cached(fake_pool):
+    assert await get_user(456) is None
+    assert await get_user(456) is None
+    fake_pool.fetchrow.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_upsert_user_writes_through(fake_pool):
+    assert await get_user(123) is None
+    fake_pool.fetchrow.return_value = USER
+    await upsert_user(123, "5260000001", True, "member")
+    assert fake_pool.fetchrow.await_count == 2
+
+    user = await get_user(123)
+    assert user["role"] == "member"
+    assert fake_pool.fetchrow.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_upsert_invalidates_other_processes(fake_pool, monkeypatch):
+    redis = MagicMock()
+    redis.publish = AsyncMock()
+    monkeypatch.setattr(connection.db, "redis", redis)
+    fake_pool.fetchrow.return_value = USER
+    await upsert_user(123, "5260000001", True, "member")
+    redis.publish.assert_awaited_once_with(connection.USER_INVALIDATION_CHANNEL, f"{connection._INSTANCE_ID}:123")
+
+    # Сообщение другого процесса удаляет запись, своё — нет
+    connection._apply_user_invalidation(f"{connection._INSTANCE_ID}:123".encode())
+    assert user_cache.get(123) is not None
+    connection._apply_user_invalidation(b"other:123")
+    assert user_cache.get(123) is None
+
+
+@pytest.mark.asyncio
+async def test_listener_applies_published_invalidations(fake_pool, monkeypatch):
+    messages = asyncio.Queue()
+    messages.put_nowait({"type": "message", "data": b"other:123"})
+
+    async def get_message(ignore_subscribe_messages, timeout):
+        try:
+            return await asyncio.wait_for(messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    pubsub = MagicMock()
+    pubsub.subscribe = AsyncMock()
+    pubsub.aclose = AsyncMock()
+    pubsub.get_message = get_message
+    redis = MagicMock()
+    redis.pubsub.return_value = pubsub
+    monkeypatch.setattr(connection.db, "redis", redis)
+    user_cache.set(123, USER)
+
+    connection.start_user_cache_listener()
+    try:
+        for _ in range(100):
+            if user_cache.get(123) is None:
+                break
+            await asyncio.sleep(0.01)
+        assert user_cache.get(123) is None
+        pubsub.subscribe.assert_awaited_once_with(connection.USER_INVALIDATION_CHANNEL)
+    finally:
+        await connection.stop_user_cache_listener()
+    pubsub.aclose.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_get_user_uses_prepared_statement(fake_pool):
+    stmt = MagicMock()
+    stmt.fetchrow = AsyncMock(return_value=USER)
+    fake_pool.prepared = {"get_user": stmt}
+    assert await get_user(123) == USER
+    stmt.fetchrow.assert_awaited_once_with(123)
+    fake_pool.fetchrow.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_health_probe_updates_pool_metrics(fake_pool, monkeypatch):
+    from app.monitoring import DB_POOL_HEALTHY, DB_POOL_SIZE
+    fake_pool.fetchval = AsyncMock(return_value=1)
+    connection.db.pool.get_size.return_value = 4
+    connection.db.pool.get_idle_size.return_value = 3
+    assert await connection.db.check_health() is True
+    assert DB_POOL_HEALTHY._value.get() == 1
+    assert DB_POOL_SIZE._value.get() == 4
+
+    fake_pool.fetchval.side_effect = ConnectionError("down")
+    assert await connection.db.check_health() is False
+    assert DB_POOL_HEALTHY._value.get() == 0
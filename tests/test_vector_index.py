@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from app.services.vector_index import (
+    INDEX_TYPES,
+    build_index,
+    choose_index_type,
+    index_memory_bytes,
+    index_type_of,
+    recall_at_k,
+)
+
+DIM = 384
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, DIM))
+    vectors = centers[rng.integers(0, 20, 1500)] + 0.3 * rng.normal(size=(1500, DIM))
+    queries = vectors[rng.choice(1500, 50, replace=False)] + 0.05 * rng.normal(size=(50, DIM))
+    return vectors.astype("float32"), queries.astype("float32")
+
+
+@pytest.fixture(scope="module")
+def flat(corpus):
+    return build_index("flat", corpus[0], DIM)
+
+
+# Минимальный recall@10 относительно flat на синтетическом корпусе
+MIN_RECALL = {"flat": 1.0, "sq_fp16": 0.95, "sq8": 0.8, "hnsw": 0.8, "ivf_flat": 0.8, "ivf_sq8": 0.7, "ivf_pq": 0.2}
+
+
+@pytest.mark.parametrize("kind", INDEX_TYPES)
+def test_index_types_recall(kind, corpus, flat):
+    vectors, queries = corpus
+    index = build_index(kind, vectors, DIM)
+    assert index.ntotal == len(vectors)
+    assert index_type_of(index) == kind
+    assert recall_at_k(index, flat, queries, k=10) >= MIN_RECALL[kind]
+
+
+def test_compressed_indexes_are_smaller(corpus, flat):
+    flat_size = index_memory_bytes(flat)
+    assert index_memory_bytes(build_index("sq8", corpus[0], DIM)) < flat_size / 3
+    assert index_memory_bytes(build_index("ivf_pq", corpus[0], DIM)) < flat_size / 10
+
+
+def test_auto_selection_and_small_corpus_fallback():
+    assert choose_index_type(500) == "flat"
+    assert choose_index_type(100_000) == "hnsw"
+    assert choose_index_type(1_000_000) == "ivf_pq"
+    # Обучать IVF не на чем: используется точный индекс
+    index = build_index("ivf_pq", np.random.rand(10, DIM).astype("float32"), DIM)
+    assert index_type_of(index) == "flat"
+
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw", "ivf_flat"])
+def test_cached_index_accepts_new_vectors(kind, corpus, tmp_path):
+    from app.services.index_cache import IndexCache
+    vectors, queries = corpus
+    cache = IndexCache(str(tmp_path), "fp")
+    cache.save_index(build_index(kind, vectors, DIM), ["sha"], kind)
+
+    # IVF читается без отображения в память, иначе в него нельзя дописать документы
+    index = cache.load_index(["sha"], kind)
+    index.add(queries)
+    assert index.ntotal == len(vectors) + len(queries)
+
+
+def test_cache_matches_requested_type(tmp_path):
+    from app.services.index_cache import IndexCache
+    cache = IndexCache(str(tmp_path), "fp")
+    # Маленький корпус: вместо ivf_pq собран flat, но кэш годится для следующего запуска с ivf_pq
+    cache.save_index(build_index("ivf_pq", np.random.rand(10, DIM).astype("float32"), DIM), ["sha"], "ivf_pq")
+    assert cache.load_index(["sha"], "ivf_pq").ntotal == 10
+    assert cache.load_index(["sha"], "hnsw") is None